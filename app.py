@@ -6,11 +6,23 @@ from datetime import datetime
 import time
 import json
 import tempfile
-from threading import Thread, Lock
-from modules.installed_packages import get_installed_packages
-from modules import ClaudeAI, GCPOps, PDFOps, SegmentationOps
+import copy
+import glob
+import functools
+import uuid
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+# ClaudeAI/AsyncClaudeRunner (anthropic), PDFOps (fitz) and pandas are imported where they are
+# first used; the modules package loads its submodules on attribute access
+from modules import get_installed_packages
+from modules import GCPOps, SegmentationOps, PaperStore, WriteBehindQueue
+from modules import IngestPipeline, PipelineStage, AnthropicRateLimiter
+from modules import ExtractionCache, LocalDiskCacheBackend, GCSCacheBackend
+from modules import SegmentationContainer, AlignmentJob, ReadAheadCache, PaperTextStore
+from modules import SharedPaperState, VersionConflictError, create_state_backend, IngestJobRegistry, ProgressBroadcaster
+from modules import ImageLocks, WarmUp
 import logging
-import pandas as pd
 import shutil
 
 # Configure logging
@@ -38,9 +50,23 @@ BUCKET_SEGMENTATION_LABELS='papers-diatoms-segmentation'
 
 # Global variables for data management
 PAPERS_JSON_PUBLIC_URL = f"https://storage.googleapis.com/{PAPERS_BUCKET_JSON_FILES}/jsons_from_pdfs/{SESSION_ID}/{SESSION_ID}.json"
-PAPER_JSON_FILES = []
-DIATOMS_DATA = []
-data_lock = Lock()
+PAPERS_SHARDS_BASE_URL = GCPOps.get_paper_shards_base_url(PAPERS_JSON_PUBLIC_URL)
+paper_store = PaperStore()  # Indexed PAPER_JSON_FILES / DIATOMS_DATA
+# Per-image striped locks for the labelling routes plus a reader-writer lock for whole-dataset operations
+image_locks = ImageLocks()
+
+# Papers and ingest job progress are kept in a state backend shared by all gunicorn workers
+# (STATE_BACKEND=sqlite, the default when GUNICORN_WORKERS > 1); paper_store is this worker's replica
+state_backend = create_state_backend()
+shared_papers = SharedPaperState(state_backend, paper_store)
+# Set once the papers were loaded; until then the manifest must not be rewritten from the replica
+papers_loaded = Event()
+
+# Write-behind persistence settings
+WRITE_BEHIND_JOURNAL_ROOT = os.environ.get('WRITE_BEHIND_JOURNAL_DIR', os.path.join('temp_uploads', 'journal', SESSION_ID))
+# With several workers each one journals to its own directory so no two share a segment
+WRITE_BEHIND_JOURNAL_DIR = os.path.join(WRITE_BEHIND_JOURNAL_ROOT, f"worker-{os.getpid()}") if state_backend.shared else WRITE_BEHIND_JOURNAL_ROOT
+WRITE_BEHIND_WINDOW_SECONDS = float(os.environ.get('WRITE_BEHIND_WINDOW_SECONDS', '2.0'))
 
 # 
 ALLOWED_EXTENSIONS = {'pdf'}
@@ -50,32 +76,185 @@ def allowed_file(filename):
 # Create an instance of GCPOps
 gcp_ops = GCPOps()
 segmentation_ops = SegmentationOps()
-# Initialize the uploaded PDF files DataFrame
-try:
-    UPLOADED_PDF_FILES_DF = gcp_ops.initialize_paper_upload_tracker_df_from_gcp(
-        session_id=SESSION_ID,
-        bucket_name=BUCKET_PAPER_TRACKER_CSV
-    )
-    logger.info("Successfully initialized PDF files DataFrame")
-except Exception as e:
-    logger.error(f"Error initializing PDF files DataFrame: {str(e)}")
-    UPLOADED_PDF_FILES_DF = pd.DataFrame()
-
-# Initialize paper data
-try:
-    with data_lock:
-        PAPER_JSON_FILES = gcp_ops.load_paper_json_files(PAPERS_JSON_PUBLIC_URL)
-        if PAPER_JSON_FILES:
-            DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(PAPERS_JSON_PUBLIC_URL)
-            logger.info(f"Successfully loaded {len(DIATOMS_DATA)} diatom entries")
-        else:
-            logger.warning("No paper JSON files found")
-            PAPER_JSON_FILES = []
-            DIATOMS_DATA = []
-except Exception as e:
-    logger.error(f"Error loading paper data: {str(e)}")
-    PAPER_JSON_FILES = []
-    DIATOMS_DATA = []
+# pdf_text_content / first_two_pages_text live in compressed blobs beside the shards, not in memory
+paper_text_store = PaperTextStore(gcp_ops, PAPERS_SHARDS_BASE_URL)
+# Uploaded PDF files DataFrame, loaded during warm-up
+UPLOADED_PDF_FILES_DF = None
+
+def load_uploaded_pdf_files_df():
+    """Initialize the uploaded PDF files DataFrame from the tracker CSV"""
+    global UPLOADED_PDF_FILES_DF
+    try:
+        UPLOADED_PDF_FILES_DF = gcp_ops.initialize_paper_upload_tracker_df_from_gcp(
+            session_id=SESSION_ID,
+            bucket_name=BUCKET_PAPER_TRACKER_CSV
+        )
+        logger.info("Successfully initialized PDF files DataFrame")
+    except Exception as e:
+        logger.error(f"Error initializing PDF files DataFrame: {str(e)}")
+        import pandas as pd
+        UPLOADED_PDF_FILES_DF = pd.DataFrame()
+
+def load_papers_from_gcs():
+    """Load all papers and their keys from the GCS shards"""
+    return gcp_ops.load_sharded_paper_json_files(PAPERS_SHARDS_BASE_URL, PAPERS_JSON_PUBLIC_URL)
+
+def load_initial_papers():
+    """Initialize paper data (from the shared state if another worker already loaded it)"""
+    try:
+        with image_locks.dataset():
+            shared_papers.initialize(load_papers_from_gcs)
+            papers_loaded.set()
+            if paper_store.papers:
+                logger.info(f"Successfully loaded {paper_store.image_count()} diatom entries")
+            else:
+                logger.warning("No paper JSON files found")
+    except Exception as e:
+        logger.error(f"Error loading paper data: {str(e)}")
+        paper_store.load([])
+
+def ensure_paper_store_loaded():
+    """Reload the paper store from GCS if no diatom entries are loaded"""
+    if not paper_store.diatoms:
+        with image_locks.dataset():
+            if not paper_store.diatoms:
+                shared_papers.initialize(load_papers_from_gcs)
+                papers_loaded.set()
+                offload_paper_texts(paper_store.paper_keys)
+    return paper_store.diatoms
+
+def require_papers_loaded():
+    """Load the papers if the startup load failed, raising if they still cannot be loaded"""
+    if not papers_loaded.is_set():
+        with image_locks.dataset():
+            if not papers_loaded.is_set():
+                shared_papers.initialize(load_papers_from_gcs)
+                papers_loaded.set()
+
+def save_papers_manifest(paper_keys):
+    """Write the shard manifest, refusing to while the papers are not loaded so none are dropped from it"""
+    if not papers_loaded.is_set():
+        raise RuntimeError("Papers are not loaded; not rewriting the shard manifest")
+    if not gcp_ops.save_papers_manifest(PAPERS_SHARDS_BASE_URL, paper_keys):
+        raise RuntimeError("Failed to save the papers manifest")
+
+def hydrate_segmentations(image_data):
+    """Return image_data with segmentation coordinate lists restored from its binary container"""
+    container_url = image_data.get('segmentation_container_url')
+    segmentation_indices = image_data.get('segmentation_indices_array') or []
+    if not container_url or not any(isinstance(entry, dict) and 'polygon_ref' in entry for entry in segmentation_indices):
+        return image_data
+    container = gcp_ops.load_segmentation_container(container_url)
+    if container is None:
+        return image_data
+    return dict(image_data, segmentation_indices_array=container.hydrate_indices(segmentation_indices))
+
+def snapshot_paper(paper_key):
+    """Deep copy of a paper taken under its image lock, so it is never serialized mid-edit"""
+    while True:
+        image_index = paper_store.get_paper_image_index(paper_key)
+        with image_locks.image(image_index):
+            # A reindex may have moved the image before the lock was taken
+            if paper_store.get_paper_image_index(paper_key) != image_index:
+                continue
+            paper = shared_papers.get_paper(paper_key)
+            return copy.deepcopy(paper) if paper is not None else None
+
+def save_papers(paper_keys):
+    """Save the given papers to their GCS shards concurrently and return the keys that failed"""
+    def save_one(paper_key):
+        paper = snapshot_paper(paper_key)
+        return paper is not None and bool(gcp_ops.save_paper_shard(PAPERS_SHARDS_BASE_URL, paper_key, paper))
+
+    paper_keys = list(dict.fromkeys(paper_keys))
+    if not paper_keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(paper_keys))) as executor:
+        results = list(executor.map(save_one, paper_keys))
+    return [paper_key for paper_key, saved in zip(paper_keys, results) if not saved]
+
+def commit_papers(paper_keys):
+    """Publish edited papers to the other workers and queue them for a write-behind flush to GCS"""
+    paper_keys = [paper_key for paper_key in paper_keys if paper_key]
+    shared_papers.publish(paper_keys)
+    write_behind.mark_dirty(paper_keys)
+
+def save_image_papers(image_indices):
+    """Queue the papers that own the given images for a write-behind flush to GCS"""
+    commit_papers([paper_store.get_image_paper_key(index) for index in image_indices])
+    return True
+
+# Acknowledge edits once they are journaled and flush them to GCS in the background
+write_behind = WriteBehindQueue(
+    flush_fn=save_papers,
+    snapshot_fn=snapshot_paper,
+    journal_dir=WRITE_BEHIND_JOURNAL_DIR,
+    flush_window=WRITE_BEHIND_WINDOW_SECONDS
+)
+
+def orphaned_journal_dirs():
+    """Journal directories of workers that are no longer running, including the single-worker layout"""
+    journal_dirs = [WRITE_BEHIND_JOURNAL_ROOT]
+    for path in glob.glob(os.path.join(WRITE_BEHIND_JOURNAL_ROOT, 'worker-*')):
+        try:
+            os.kill(int(path.rsplit('-', 1)[1]), 0)
+        except ProcessLookupError:
+            journal_dirs.append(path)
+        except (ValueError, PermissionError):
+            continue
+    return [path for path in journal_dirs if os.path.abspath(path) != os.path.abspath(WRITE_BEHIND_JOURNAL_DIR)]
+
+def replay_write_behind_journals():
+    """Re-apply journaled edits of this and of exited workers, then start the write-behind flusher"""
+    try:
+        # Re-apply edits that were journaled but not flushed before the last shutdown
+        replayed_papers = write_behind.replay()
+        if replayed_papers:
+            new_paper_keys = [key for key in replayed_papers if paper_store.get_paper_by_key(key) is None]
+            for paper_key, paper in replayed_papers.items():
+                paper_store.upsert_paper(paper_key, paper)
+            commit_papers(replayed_papers.keys())
+            if new_paper_keys:
+                save_papers(new_paper_keys)
+                save_papers_manifest(paper_store.paper_keys)
+            logger.info(f"Replayed {len(replayed_papers)} journaled papers")
+
+        if state_backend.shared:
+            # Take over journals of workers that exited; the shared state already holds their
+            # published edits, so those papers only need flushing
+            for journal_dir in orphaned_journal_dirs():
+                orphaned_papers = WriteBehindQueue.read_journal(journal_dir)
+                with image_locks.dataset():
+                    unknown_keys = [key for key in orphaned_papers if state_backend.get(SharedPaperState.NAMESPACE, key) is None]
+                    for paper_key in unknown_keys:
+                        paper_store.upsert_paper(paper_key, orphaned_papers[paper_key])
+                    commit_papers(orphaned_papers.keys())
+                if journal_dir != WRITE_BEHIND_JOURNAL_ROOT:
+                    shutil.rmtree(journal_dir, ignore_errors=True)
+                else:
+                    for path in glob.glob(os.path.join(journal_dir, 'journal-*.log')):
+                        os.remove(path)
+                if orphaned_papers:
+                    logger.info(f"Adopted {len(orphaned_papers)} journaled papers from {journal_dir}")
+    except Exception as e:
+        logger.error(f"Error replaying write-behind journal: {str(e)}")
+    write_behind.start()
+
+def offload_paper_texts(paper_keys):
+    """Move inline text fields of the given papers to the text store and queue their slimmer shards"""
+    offloaded = paper_text_store.offload(paper_store, paper_keys)
+    if offloaded:
+        commit_papers(offloaded)
+    return offloaded
+
+def offload_resident_paper_texts():
+    """Papers saved before the text fields were split out still carry them inline"""
+    try:
+        offload_paper_texts(paper_store.paper_keys)
+    except Exception as e:
+        logger.error(f"Error moving paper text fields out of the paper store: {str(e)}")
+
+atexit.register(write_behind.stop)
 
 def safe_value(value):
     """Safely handle potentially None values"""
@@ -103,116 +282,444 @@ def parse_output(output):
         app.logger.error(f"Error parsing JSON output: {str(e)}")
         return None
 
-# Processing status tracking
-processing_status = {
-    'current_index': 0,
-    'current_url': '',
-    'complete': False,
-    'total_pdfs': 0,
-    'full_text': '',
-    'first_two_pages_text': '',
-    'filename': '',
-    'citation_info': '',
-    'extracted_images_file_metadata': '',
-    'pdf_paper_json': '',
-    'paper_info': '',
-    'diatoms_data': '',
-}
-
-def process_pdfs(pdf_urls):
-    global processing_status, PAPER_JSON_FILES
-    TEMP_JSON_FILES = []
-
-    # Construct the papers JSON public URL
-    with data_lock:
-        PAPER_JSON_FILES = gcp_ops.load_paper_json_files(PAPERS_JSON_PUBLIC_URL) or []
-
-    for i, url in enumerate(pdf_urls, 1):
-        with data_lock:
-            processing_status['current_index'] = i
-            processing_status['current_url'] = url
+# Queue and progress of every /process_pdfs run, shared by all workers. It is kept in SQLite
+# (INGEST_QUEUE_BACKEND, INGEST_QUEUE_DB_PATH) so interrupted jobs resume from their checkpoints.
+ingest_backend = create_state_backend(
+    os.environ.get('INGEST_QUEUE_BACKEND', 'sqlite'),
+    os.environ.get('INGEST_QUEUE_DB_PATH', os.path.join('temp_uploads', 'ingest_queue.sqlite3'))
+)
+ingest_jobs = IngestJobRegistry(ingest_backend)
+# Stages whose output is checkpointed; the downloaded PDF and extracted images before that are not kept
+INGEST_CHECKPOINT_STAGES = ('upload', 'claude')
+INGEST_CHECKPOINT_FIELDS = ('filename', 'full_text', 'first_two_pages_text', 'extracted_images_file_metadata',
+                            'paper_info', 'diatoms_data', 'citation_info', 'cache_hit')
+
+def fetch_job_progress(job_id, cursor):
+    """Changes of an ingest job after a cursor, for the progress stream"""
+    if cursor and ingest_backend.latest_seq() == cursor:
+        job = ingest_jobs.get_job(job_id)
+        return None if job is None else (None, cursor, job['state'] in ('complete', 'failed'))
+    status = ingest_jobs.get_status(job_id, since=cursor)
+    if status is None:
+        return None
+    return status, status['cursor'], status['job']['state'] in ('complete', 'failed')
+
+# Pushes job progress to every open /process_status/<job_id>/stream
+progress_broadcaster = ProgressBroadcaster(fetch_job_progress)
+
+def ingest_stage_download(context):
+    """Pipeline stage: stream the PDF once and look up the extraction cache"""
+    from modules import PDFOps
+    extraction_cache = get_extraction_cache()
+    url = context['url']
+    with pdf_validators_lock:
+        validators = pdf_validators.get(url)
+
+    cached = None
+    if validators:
+        # Conditional GET: a 304 means the PDF is the one we already extracted
+        download = PDFOps.fetch_pdf(url, validators['etag'], validators['last_modified'])
+        if download['not_modified']:
+            cached = extraction_cache.get(validators['file_256_hash'])
+            if not cached:
+                # Unchanged on the server but evicted from the cache; fetch the content again
+                download = PDFOps.fetch_pdf(url)
+    else:
+        download = PDFOps.fetch_pdf(url)
+
+    if not download['not_modified']:
+        if download['etag'] or download['last_modified']:
+            with pdf_validators_lock:
+                pdf_validators[url] = {
+                    'etag': download['etag'],
+                    'last_modified': download['last_modified'],
+                    'file_256_hash': download['file_256_hash']
+                }
+        cached = extraction_cache.get(download['file_256_hash'])
+
+    if cached:
+        PDFOps.release_pdf(download)
+        # Unchanged PDF: skip extraction, upload and Claude and go straight to merge
+        context.update({
+            'cache_hit': True,
+            'full_text': cached['full_text'],
+            'first_two_pages_text': cached['first_two_pages_text'],
+            'filename': PDFOps._get_filename(context['url']),
+            'extracted_images_file_metadata': cached['extracted_images_file_metadata'],
+            'paper_info': cached['paper_info'],
+            'diatoms_data': cached['diatoms_data'],
+            'citation_info': cached['citation_info']
+        })
+    else:
+        context['pdf_download'] = download
+    return context
+
+def ingest_stage_extract(context):
+    """Pipeline stage: extract text, images and hash from the PDF in a single pass"""
+    if context.get('cache_hit'):
+        return context
+    from modules import PDFOps
+    download = context.pop('pdf_download')
+    try:
+        ingest_result = PDFOps().extract_from_download(download, context['url'])
+    finally:
+        PDFOps.release_pdf(download)
+    context.update({
+        'ingest_result': ingest_result,
+        'full_text': ingest_result['full_text'],
+        'first_two_pages_text': ingest_result['first_two_pages_text'],
+        'filename': ingest_result['filename']
+    })
+    return context
+
+def ingest_stage_upload(context):
+    """Pipeline stage: upload the extracted images to GCS"""
+    if context.get('cache_hit'):
+        return context
+    from modules import PDFOps
+    context['extracted_images_file_metadata'] = PDFOps().upload_extracted_images(
+        context.pop('ingest_result'), SESSION_ID, BUCKET_EXTRACTED_IMAGES
+    )
+    return context
+
+def ingest_stage_claude(context):
+    """Pipeline stage: extract paper info, diatoms data and citation with Claude"""
+    if context.get('cache_hit'):
+        return context
+    if CLAUDE_CITATION_METHOD == 'citation_from_llm':
+        claude_rate_limiter.acquire(context['full_text'] + context['first_two_pages_text'], requests=2)
+    else:
+        claude_rate_limiter.acquire(context['full_text'])
+
+    if CLAUDE_MODE == 'async':
+        # Paper info and citation prompts run concurrently on the shared event loop
+        paper_info, diatoms_data, paper_image_urls, citation_info = get_claude_async_runner().process_paper(
+            context['full_text'], context['extracted_images_file_metadata'],
+            context['first_two_pages_text'], CLAUDE_CITATION_METHOD
+        )
+    else:
+        from modules import ClaudeAI
+        claude = ClaudeAI()
+        paper_info, diatoms_data, paper_image_urls = claude.process_paper(
+            context['full_text'], context['extracted_images_file_metadata']
+        )
+        citation_info = claude.extract_citation(first_two_pages_text=context['first_two_pages_text'], method=CLAUDE_CITATION_METHOD)
+    context.update({
+        'paper_info': paper_info,
+        'diatoms_data': diatoms_data,
+        'citation_info': citation_info
+    })
+    cache_extraction(context)
+    return context
+
+def ingest_claude_batch(results):
+    """Run the Claude step for a whole ingest run through the Message Batches API, then merge"""
+    pending = [context for context in results
+               if not context.get('error') and not context.get('cache_hit') and 'claude' not in context.get('skip_stages', ())]
+    if pending:
+        from modules import ClaudeAI
+        batch_results = ClaudeAI().process_papers_with_message_batches(pending, CLAUDE_CITATION_METHOD)
+        for context, (paper_info, diatoms_data, paper_image_urls, citation_info) in zip(pending, batch_results):
+            context.update({
+                'paper_info': paper_info,
+                'diatoms_data': diatoms_data,
+                'citation_info': citation_info
+            })
+            cache_extraction(context)
+            checkpoint_ingest_stage(context, 'claude')
 
+    for context in results:
+        if context.get('error'):
+            continue
+        context['stage'] = 'merge'
         try:
-            pdf_ops = PDFOps()
-            claude = ClaudeAI()
-
-            # Extract text and images
-            full_text, first_two_pages_text, filename = pdf_ops.extract_text_from_pdf(url)
-            extracted_images_file_metadata = pdf_ops.extract_images_and_metadata(url, SESSION_ID, BUCKET_EXTRACTED_IMAGES)
-
-            # Process the paper
-            paper_info, diatoms_data, paper_image_urls = claude.process_paper(full_text, extracted_images_file_metadata)
-            citation_info = claude.extract_citation(first_two_pages_text=first_two_pages_text, method="default_citation")
-
-            # Create JSON for the paper
-            pdf_paper_json = {
-                "pdf_file_url": safe_value(url),
-                "filename": safe_value(filename),
-                "extracted_images_file_metadata": safe_value(extracted_images_file_metadata),
-                "pdf_text_content": safe_value(full_text),
-                "first_two_pages_text": safe_value(first_two_pages_text),
-                "paper_info": safe_value(paper_info),
-                "papers_json_public_url": safe_value(PAPERS_JSON_PUBLIC_URL),
-                "diatoms_data": safe_value(diatoms_data),
-                "citation": safe_value(citation_info),
-            }
-            TEMP_JSON_FILES.append(pdf_paper_json)
-
-            with data_lock:
-                processing_status.update({
-                    'full_text': full_text,
-                    'first_two_pages_text': first_two_pages_text,
-                    'filename': filename,
-                    'citation_info': json.dumps(citation_info, indent=2),
-                    'extracted_images_file_metadata': json.dumps(extracted_images_file_metadata, indent=2),
-                    'pdf_paper_json': json.dumps(pdf_paper_json, indent=2),
-                    'paper_info': json.dumps(paper_info, indent=2),
-                    'diatoms_data': json.dumps(diatoms_data, indent=2),
-                })
+            ingest_stage_merge(context)
+            on_ingest_event('stage_finished', context)
         except Exception as e:
-            app.logger.error(f"Error processing PDF at {url}: {str(e)}")
-        
-        time.sleep(15)  # Simulate processing delay
+            context['error'] = f"merge: {str(e)}"
+            on_ingest_event('stage_failed', context)
+
+def cache_extraction(context):
+    """Store a finished Claude extraction in the extraction cache"""
+    paper_info = context['paper_info']
+    diatoms_data = context['diatoms_data']
+    citation_info = context['citation_info']
+
+    # Only cache complete extractions so failures are retried next time
+    metadata = context['extracted_images_file_metadata']
+    if paper_info and metadata:
+        get_extraction_cache().put(metadata['file_256_hash'], {
+            'full_text': context['full_text'],
+            'first_two_pages_text': context['first_two_pages_text'],
+            'extracted_images_file_metadata': metadata,
+            'paper_info': paper_info,
+            'diatoms_data': diatoms_data,
+            'citation_info': citation_info
+        })
 
-    # Append TEMP_JSON_FILES to PAPER_JSON_FILES and save
-    with data_lock:
-        PAPER_JSON_FILES.extend(TEMP_JSON_FILES)
-        gcp_ops.save_paper_json_files(PAPERS_JSON_PUBLIC_URL, PAPER_JSON_FILES)
+def ingest_stage_merge(context):
+    """Pipeline stage: build the paper JSON, add it to the paper store and save it"""
+    pdf_paper_json = {
+        "pdf_file_url": safe_value(context['url']),
+        "filename": safe_value(context['filename']),
+        "extracted_images_file_metadata": safe_value(context['extracted_images_file_metadata']),
+        "pdf_text_content": safe_value(context['full_text']),
+        "first_two_pages_text": safe_value(context['first_two_pages_text']),
+        "paper_info": safe_value(context['paper_info']),
+        "papers_json_public_url": safe_value(PAPERS_JSON_PUBLIC_URL),
+        "diatoms_data": safe_value(context['diatoms_data']),
+        "citation": safe_value(context['citation_info']),
+    }
+    context['pdf_paper_json'] = pdf_paper_json
+
+    # The heavy results are only read when someone opens the document on the processing page
+    ingest_jobs.set_payload(context['job_id'], context['position'], {
+        'filename': context['filename'],
+        'full_text': context['full_text'],
+        'first_two_pages_text': context['first_two_pages_text'],
+        'citation_info': context['citation_info'],
+        'extracted_images_file_metadata': context['extracted_images_file_metadata'],
+        'pdf_paper_json': pdf_paper_json,
+        'paper_info': context['paper_info'],
+        'diatoms_data': context['diatoms_data'],
+    })
+    merge_ingested_paper(context)
+    return context
+
+def merge_ingested_paper(context):
+    """Add one ingested paper to the paper store and write its shard and the manifest"""
+    job_id, index = context['job_id'], context['position']
+    # The text fields are uploaded after the dataset lock is released
+    paper, texts = PaperTextStore.split_texts(context['pdf_paper_json'])
+    require_papers_loaded()
+    with image_locks.dataset():
+        shared_papers.sync()
+        paper_key = context.get('paper_key')
+        if not paper_key:
+            # Recorded before the paper is added, so a resumed job replaces it instead of adding a copy
+            paper_key = context['paper_key'] = paper_store.available_paper_key(paper)
+            ingest_jobs.save_checkpoint(job_id, index, paper_key=paper_key)
+        paper_store.upsert_paper(paper_key, paper)
+        shared_papers.publish([paper_key])
+        if state_backend.shared:
+            # Another worker may have added papers meanwhile; pull them, and only rebuild the
+            # replica in the shared order if one of them was published ahead of this paper
+            shared_papers.sync()
+            if not shared_papers.in_shared_order(paper_key):
+                shared_papers.reload()
+        paper_keys = list(paper_store.paper_keys)
+    # The uploads happen outside the dataset lock so annotators are not blocked meanwhile
+    if texts and not paper_text_store.put(paper_key, texts):
+        raise RuntimeError(f"Failed to save the text of paper {paper_key}")
+    if save_papers([paper_key]):
+        raise RuntimeError(f"Failed to save paper {paper_key}")
+    save_papers_manifest(paper_keys)
+    ingest_jobs.save_checkpoint(job_id, index, stage='merge', context={})
+
+def checkpoint_ingest_stage(context, stage):
+    """Persist a document's output after a checkpointed stage so a resumed job continues from there"""
+    ingest_jobs.save_checkpoint(context['job_id'], context['position'], stage=stage, context={
+        field: context[field] for field in INGEST_CHECKPOINT_FIELDS if field in context
+    })
+
+def on_ingest_event(event, context):
+    """Track each document's stage, timings and errors in its ingest job and checkpoint its output"""
+    job_id, index, stage = context['job_id'], context['position'], context['stage']
+    timings = dict(context.get('timings', {}))
+    if event == 'stage_started':
+        ingest_jobs.update_document(job_id, index, stage=stage, state='running')
+    elif event == 'stage_failed':
+        ingest_jobs.record_failure(job_id, index, context['error'], timings=timings)
+    elif stage == INGEST_STAGES[-1][0]:
+        ingest_jobs.finish_document(job_id, index, timings=timings, filename=context.get('filename', ''))
+    else:
+        # A cache hit already carries the Claude results
+        checkpoint_stage = 'claude' if context.get('cache_hit') else stage
+        if checkpoint_stage in INGEST_CHECKPOINT_STAGES:
+            checkpoint_ingest_stage(context, checkpoint_stage)
+        ingest_jobs.update_document(job_id, index, timings=timings, cached=bool(context.get('cache_hit')))
+    progress_broadcaster.notify()
+
+# Claude mode: 'sync' (blocking requests per worker), 'async' (one shared event loop with at
+# most CLAUDE_MAX_CONCURRENT_REQUESTS in flight) or 'batch' (Message Batches API for runs of
+# at least CLAUDE_BATCH_MIN_PAPERS PDFs). CLAUDE_BASE_URL can point at a local stub server.
+CLAUDE_MODE = os.environ.get('CLAUDE_MODE', 'sync')
+CLAUDE_CITATION_METHOD = os.environ.get('CLAUDE_CITATION_METHOD', 'default_citation')
+CLAUDE_BATCH_MIN_PAPERS = int(os.environ.get('CLAUDE_BATCH_MIN_PAPERS', '20'))
+claude_async_runner = None
+claude_async_runner_lock = Lock()
+
+def get_claude_async_runner():
+    """Start the shared async Claude runner on first use"""
+    global claude_async_runner
+    with claude_async_runner_lock:
+        if claude_async_runner is None:
+            from modules import AsyncClaudeRunner
+            claude_async_runner = AsyncClaudeRunner()
+            atexit.register(claude_async_runner.close)
+        return claude_async_runner
+
+def claude_stage_workers():
+    """Default worker count of the claude stage, resolved when the first ingest run starts"""
+    from modules import ClaudeAI
+    return ClaudeAI.MAX_CONCURRENT_REQUESTS if CLAUDE_MODE == 'async' else 2
+
+# Ingest pipeline stages: (name, function, default worker count or a function returning it).
+# Worker counts can be overridden with INGEST_WORKERS_<NAME> environment variables.
+INGEST_STAGES = [
+    ('download', ingest_stage_download, 4),
+    ('extract', ingest_stage_extract, 2),
+    ('upload', ingest_stage_upload, 4),
+    ('claude', ingest_stage_claude, claude_stage_workers),
+    ('merge', ingest_stage_merge, 1),
+]
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', '4'))
+claude_rate_limiter = AnthropicRateLimiter()
+
+# ETag/Last-Modified of each downloaded PDF URL, for conditional re-downloads
+pdf_validators = {}
+pdf_validators_lock = Lock()
+
+# Extraction cache: local disk tier (LRU/TTL) in front of a shared GCS tier, created on first use
+extraction_cache = None
+extraction_cache_lock = Lock()
+
+def get_extraction_cache():
+    """Create the extraction cache on first use; its keys depend on the Claude prompt version"""
+    global extraction_cache
+    with extraction_cache_lock:
+        if extraction_cache is None:
+            from modules import ClaudeAI
+            extraction_cache = ExtractionCache(
+                backends=[
+                    LocalDiskCacheBackend(
+                        directory=os.environ.get('EXTRACTION_CACHE_DIR', os.path.join('temp_uploads', 'extraction_cache')),
+                        max_entries=int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', '500')),
+                        max_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', str(1024 * 1024 * 1024))),
+                        ttl_seconds=float(os.environ.get('EXTRACTION_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+                    ),
+                    GCSCacheBackend(gcp_ops.storage_client, PAPERS_BUCKET_JSON_FILES, prefix='extraction_cache')
+                ],
+                prompt_version=ClaudeAI.PROMPT_VERSION
+            )
+        return extraction_cache
 
-    with data_lock:
-        processing_status['complete'] = True
+def process_pdfs(job_id):
+    """Run (or resume) an ingest job claimed by this process, renewing its lease meanwhile"""
+    stop_renewing = Event()
+
+    def keep_lease():
+        while not stop_renewing.wait(ingest_jobs.LEASE_SECONDS / 3):
+            if not ingest_jobs.renew(job_id):
+                app.logger.warning(f"Lost the lease on ingest job {job_id}")
+                return
+
+    Thread(target=keep_lease, name=f"ingest-lease-{job_id}", daemon=True).start()
+    try:
+        ingest_jobs.set_state(job_id, 'running')
+        progress_broadcaster.notify()
+        run_ingest(job_id)
+        ingest_jobs.set_state(job_id, 'complete')
+    except Exception as e:
+        app.logger.error(f"Error in ingest job {job_id}: {str(e)}")
+        ingest_jobs.set_state(job_id, 'failed', error=str(e))
+    finally:
+        stop_renewing.set()
+    progress_broadcaster.notify()
+
+def ingest_context(job_id, document):
+    """Pipeline context of a pending document, restored from its checkpoint; None if it only needs finishing"""
+    index = document['index']
+    context = {'url': document['url'], 'job_id': job_id, 'position': index}
+    checkpoint = ingest_jobs.get_checkpoint(job_id, index) or {}
+    if checkpoint.get('paper_key'):
+        context['paper_key'] = checkpoint['paper_key']
+    if checkpoint.get('stage'):
+        stage_names = [name for name, _, _ in INGEST_STAGES]
+        if checkpoint['stage'] == stage_names[-1]:
+            # Merged and saved before the interruption
+            ingest_jobs.finish_document(job_id, index, filename=document.get('filename', ''))
+            return None
+        context.update(checkpoint.get('context', {}))
+        context['skip_stages'] = stage_names[:stage_names.index(checkpoint['stage']) + 1]
+    return context
+
+def run_ingest(job_id):
+    """Run the pending documents of a job, retrying failed ones after their backoff"""
+    # Make sure the existing papers are loaded before appending new ones
+    with image_locks.dataset():
+        if not paper_store.papers:
+            shared_papers.initialize(load_papers_from_gcs)
+            offload_paper_texts(paper_store.paper_keys)
+
+    while True:
+        documents = ingest_jobs.pending_documents(job_id)
+        if not documents:
+            return
+        now = time.time()
+        due = [document for document in documents if (document.get('next_attempt_at') or 0) <= now]
+        if not due:
+            time.sleep(min(document['next_attempt_at'] for document in documents) - now)
+            continue
+        contexts = [context for context in (ingest_context(job_id, document) for document in due) if context]
+        if contexts:
+            run_ingest_round(contexts)
+            # A document whose progress could not be recorded must not be retried forever
+            pending = {document['index']: document for document in ingest_jobs.pending_documents(job_id)}
+            for context in contexts:
+                document = pending.get(context['position'])
+                if document and document['state'] in ('queued', 'running'):
+                    ingest_jobs.record_failure(job_id, context['position'], context.get('error') or 'Document did not finish')
+
+def run_ingest_round(contexts):
+    """Run documents through the ingest pipeline; results are merged into the store one by one"""
+    # Large runs in batch mode send all Claude requests as one message batch after extraction
+    use_message_batches = CLAUDE_MODE == 'batch' and len(contexts) >= CLAUDE_BATCH_MIN_PAPERS
+    pipeline = IngestPipeline(
+        stages=[
+            PipelineStage(name, fn, PipelineStage.workers_from_env(name, workers() if callable(workers) else workers))
+            for name, fn, workers in INGEST_STAGES
+            if not (use_message_batches and name in ('claude', 'merge'))
+        ],
+        queue_size=INGEST_QUEUE_SIZE,
+        on_event=on_ingest_event
+    )
+    results = pipeline.run(contexts)
+    if use_message_batches:
+        ingest_claude_batch(results)
+
+    for context in results:
+        if context.get('error'):
+            app.logger.error(f"Error processing PDF at {context['url']}: {context['error']}")
+
+def resume_ingest_jobs():
+    """Claim and resume ingest jobs whose process stopped, now and every INGEST_LEASE_SECONDS / 2"""
+    def resume_abandoned():
+        while True:
+            try:
+                for job_id in ingest_jobs.abandoned_jobs():
+                    if ingest_jobs.claim(job_id):
+                        logger.info(f"Resuming ingest job {job_id}")
+                        Thread(target=process_pdfs, args=(job_id,)).start()
+            except Exception as e:
+                logger.error(f"Error resuming ingest jobs: {str(e)}")
+            time.sleep(ingest_jobs.LEASE_SECONDS / 2)
+
+    Thread(target=resume_abandoned, name='ingest-resumer', daemon=True).start()
 
 
 def save_labels(updated_data):
     """Save updated labels and synchronize all data structures"""
-    global PAPER_JSON_FILES, DIATOMS_DATA
-    
     try:
-        # Update DIATOMS_DATA with new label information
+        # Update the image's diatoms data (shared by DIATOMS_DATA and its paper)
         image_index = updated_data.get('image_index', 0)
         info = updated_data.get('info', [])
         
-        if 0 <= image_index < len(DIATOMS_DATA):
-            DIATOMS_DATA[image_index]['info'] = info
-            
-            # Update corresponding entry in PAPER_JSON_FILES
-            for paper in PAPER_JSON_FILES:
-                if 'diatoms_data' in paper:
-                    # Convert string to dict if necessary
-                    if isinstance(paper['diatoms_data'], str):
-                        paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-                    
-                    # Update the diatoms data
-                    if paper['diatoms_data'].get('image_url') == DIATOMS_DATA[image_index].get('image_url'):
-                        paper['diatoms_data']['info'] = info
-                        break
+        if paper_store.is_valid_index(image_index):
+            paper_store.update_image(image_index, {'info': info})
             
             # Save updated data to GCS
-            success = ClaudeAI.update_and_save_papers(
-                PAPERS_JSON_PUBLIC_URL,
-                PAPER_JSON_FILES,
-                DIATOMS_DATA
-            )
+            success = save_image_papers([image_index])
             
             if not success:
                 raise Exception("Failed to save updates to GCS")
@@ -226,7 +733,54 @@ def save_labels(updated_data):
     return False
 
 
+def with_image_lock(view):
+    """Hold the lock of the request's image_index while the route reads and modifies that image"""
+    @functools.wraps(view)
+    def locked_view(*args, **kwargs):
+        image_index = request.args.get('image_index', type=int)
+        if image_index is None:
+            image_index = (request.get_json(silent=True) or {}).get('image_index', 0)
+        with image_locks.image(image_index):
+            return view(*args, **kwargs)
+    return locked_view
+
+# Endpoints served while the warm-up is still running
+WARM_UP_EXEMPT_ENDPOINTS = {'readiness', 'liveness', 'index', 'static'}
+
+@app.before_request
+def wait_for_warm_up():
+    """Hold requests that need the dataset until the warm-up has loaded it"""
+    if warm_up.ready or request.endpoint in WARM_UP_EXEMPT_ENDPOINTS:
+        return None
+    if not warm_up.wait(STARTUP_WAIT_SECONDS):
+        response = jsonify({'success': False, 'error': 'Service is starting up', 'warm_up': warm_up.get_status()})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return None
+
+@app.before_request
+def sync_shared_state():
+    """Pick up papers other workers changed since this worker last looked"""
+    if state_backend.shared and shared_papers.has_changes():
+        with image_locks.dataset():
+            shared_papers.sync()
+
+@app.errorhandler(VersionConflictError)
+def handle_version_conflict(e):
+    return jsonify({'success': False, 'error': str(e), 'conflict': True}), 409
+
 # Routes
+@app.route('/healthz')
+def liveness():
+    """Liveness probe: the process is serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readiness():
+    """Readiness probe: 200 once the dataset is loaded, 503 with the warm-up progress before"""
+    status = warm_up.get_status()
+    return jsonify(status), (200 if warm_up.ready else 503)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -255,6 +809,7 @@ def download_installed_pkgs():
 @app.route('/all_papers')
 def all_papers():
     try:
+        from modules import ClaudeAI
         claude = ClaudeAI()
         pdf_urls = claude.get_public_urls(PAPERS_BUCKET, SESSION_ID)
         return render_template('papers.html', pdf_urls=pdf_urls)
@@ -263,23 +818,17 @@ def all_papers():
 
 @app.route('/process_pdfs', methods=['POST'])
 def start_processing():
-    global processing_status
-    
     try:
         pdf_urls = json.loads(request.form.get('pdf_urls', '[]'))
         
         if not pdf_urls:
             return render_template('papers.html', error="No PDFs to process")
         
-        processing_status.update({
-            'current_index': 0,
-            'current_url': '',
-            'complete': False,
-            'total_pdfs': len(pdf_urls)
-        })
-        
-        Thread(target=process_pdfs, args=(pdf_urls,)).start()
-        return redirect(url_for('show_processing'))
+        # Every run gets its own job, so concurrent runs do not overwrite each other's progress
+        job_id = ingest_jobs.create(pdf_urls)
+        if ingest_jobs.claim(job_id):
+            Thread(target=process_pdfs, args=(job_id,)).start()
+        return redirect(url_for('show_processing', job_id=job_id))
     except json.JSONDecodeError as e:
         return render_template('papers.html', error=f"Invalid PDF data format: {str(e)}")
     except Exception as e:
@@ -287,11 +836,49 @@ def start_processing():
 
 @app.route('/processing')
 def show_processing():
-    return render_template('processing.html')
+    job_id = request.args.get('job_id')
+    if not job_id:
+        # Fall back to the most recent run
+        jobs = ingest_jobs.list_jobs()
+        job_id = jobs[-1]['job_id'] if jobs else ''
+    return render_template('processing.html', job_id=job_id)
 
 @app.route('/process_status')
 def get_process_status():
-    return jsonify(processing_status)
+    """Summaries of the kept ingest jobs, oldest first, and this worker's progress stream counters"""
+    return jsonify({'jobs': ingest_jobs.list_jobs(), 'streams': progress_broadcaster.get_stats()})
+
+@app.route('/process_status/<job_id>')
+def get_job_status(job_id):
+    """A job's summary and the documents changed since the ?since= cursor of the previous poll"""
+    status = ingest_jobs.get_status(job_id, since=request.args.get('since', 0, type=int))
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown ingest job'}), 404
+    return jsonify(status)
+
+@app.route('/process_status/<job_id>/stream')
+def stream_job_status(job_id):
+    """Server-Sent Events: a snapshot of the job, then its changes as they happen, with heartbeats"""
+    if ingest_jobs.get_job(job_id) is None:
+        return jsonify({'success': False, 'error': 'Unknown ingest job'}), 404
+    if not progress_broadcaster.has_capacity():
+        # Each stream pins a server thread; past the limit the page falls back to delta polling
+        response = jsonify({'success': False, 'error': 'Too many progress streams, poll /process_status instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    return Response(
+        progress_broadcaster.stream(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/process_status/<job_id>/documents/<int:index>')
+def get_job_document(job_id, index):
+    """Texts and extracted JSON of one processed document"""
+    payload = ingest_jobs.get_payload(job_id, index)
+    if payload is None:
+        return jsonify({'success': False, 'error': 'No results for this document yet'}), 404
+    return jsonify(payload)
 
 @app.route('/complete')
 def complete():
@@ -321,52 +908,79 @@ def see_diatoms_data():
             raise ValueError("Required configuration variables are not set")
         
         papers_json_public_url = f"https://storage.googleapis.com/{PAPERS_BUCKET_JSON_FILES}/jsons_from_pdfs/{SESSION_ID}/{SESSION_ID}.json"
-        DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(papers_json_public_url)
+        diatoms_data = ensure_paper_store_loaded()
         
-        if not DIATOMS_DATA:
+        if not diatoms_data:
             raise ValueError("No diatoms data retrieved")
             
         return render_template('diatoms_data.html', 
                              json_url=papers_json_public_url,
-                             diatoms_data=DIATOMS_DATA)
+                             diatoms_data=diatoms_data)
     except Exception as e:
         app.logger.error(f"Error in diatoms_data route: {str(e)}")
         return render_template('error.html', error=str(e)), 500
 
 @app.route('/label', methods=['GET', 'POST'])
 def label():
-    global DIATOMS_DATA
-    
     if request.method == 'POST':
         updated_data = request.json
         save_labels(updated_data)
         return jsonify({'success': True})
     
     # Check if we have data before rendering the template
-    if not DIATOMS_DATA:
+    if not paper_store.diatoms:
         try:
             # Try to reload the data
-            DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(PAPERS_JSON_PUBLIC_URL)
+            ensure_paper_store_loaded()
         except Exception as e:
             app.logger.error(f"Error loading diatoms data: {str(e)}")
             return render_template('error.html', error="No diatom data available"), 404
     
     # Log the data state
-    app.logger.info(f"Label route: Found {len(DIATOMS_DATA)} diatom entries")
+    app.logger.info(f"Label route: Found {paper_store.image_count()} diatom entries")
     
     return render_template('label-react.html')
 
+def build_diatoms_payload(image_index):
+    """Load and align an image's segmentations on a copy of its diatoms data, for read-ahead"""
+    with image_locks.image(image_index):
+        snapshot = paper_store.get_image_snapshot(image_index)
+    if snapshot is None:
+        return None
+    version, image_data = snapshot
+    if image_data.get('segmentation_url'):
+        segmentation_text = gcp_ops.load_segmentation_data(image_data['segmentation_url'])
+        if segmentation_text:
+            image_data = segmentation_ops.process_image_segmentations(
+                image_data,
+                segmentation_text,
+                paper_store.get_spatial_index(image_index)
+            )
+    return version, {'version': version, 'image_data': image_data, 'response_data': hydrate_segmentations(image_data)}
+
+def keep_aligned_segmentations(image_index, version, image_data):
+    """Store the segmentations aligned for a response through the store, unless the image changed since"""
+    with image_locks.image(image_index):
+        if paper_store.get_image_version(image_index) != version:
+            return
+        current_image_data = paper_store.get_image(image_index)
+        changed = {field: value for field, value in image_data.items() if current_image_data.get(field) != value}
+        if changed:
+            # Kept in this worker's store only, as before; the next save of the image persists them
+            paper_store.update_image(image_index, copy.deepcopy(changed))
+
+# Read-ahead of the images next to the one being labelled (DIATOMS_PREFETCH_WINDOW on each side)
+diatoms_read_ahead = ReadAheadCache(load_fn=build_diatoms_payload, version_fn=paper_store.get_image_version)
+atexit.register(diatoms_read_ahead.close)
+
 @app.route('/api/diatoms', methods=['GET'])
 def get_diatoms():
     try:
         image_index = request.args.get('index', 0, type=int)
         
-        global DIATOMS_DATA
-        
-        if not DIATOMS_DATA:
+        if not paper_store.diatoms:
             try:
-                DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(PAPERS_JSON_PUBLIC_URL)
-                if not DIATOMS_DATA:
+                if not ensure_paper_store_loaded():
                     return jsonify({
                         'current_index': 0,
                         'total_images': 0,
@@ -382,26 +996,27 @@ def get_diatoms():
                     'error': 'Failed to load diatoms data'
                 })
         
-        total_images = len(DIATOMS_DATA)
+        total_images = paper_store.image_count()
         image_index = min(max(0, image_index), total_images - 1)
         
         try:
-            current_image_data = DIATOMS_DATA[image_index]
+            # Segmentations are loaded and aligned on a snapshot; the result is kept through the store
+            payload = diatoms_read_ahead.get(image_index)
+            if payload is None:
+                built = build_diatoms_payload(image_index)
+                if built is None:
+                    raise IndexError(image_index)
+                payload = built[1]
+            keep_aligned_segmentations(image_index, payload['version'], payload['image_data'])
+            response_data = payload['response_data']
             
-            # Ensure segmentation data is loaded and processed
-            if current_image_data.get('segmentation_url'):
-                segmentation_text = gcp_ops.load_segmentation_data(current_image_data['segmentation_url'])
-                if segmentation_text:
-                    # Process segmentations using existing SegmentationOps method
-                    current_image_data = segmentation_ops.process_image_segmentations(
-                        current_image_data,
-                        segmentation_text
-                    )
+            # Annotators move sequentially, so get the neighbouring images ready
+            diatoms_read_ahead.prefetch_around(image_index, total_images)
             
             return jsonify({
                 'current_index': image_index,
                 'total_images': total_images,
-                'data': current_image_data
+                'data': response_data
             })
             
         except IndexError:
@@ -423,6 +1038,7 @@ def get_diatoms():
         }), 500
 
 @app.route('/api/save', methods=['POST'])
+@with_image_lock
 def save():
     try:
         update_data = request.json
@@ -439,6 +1055,9 @@ def save():
         else:
             raise Exception("Failed to save labels")
             
+    except VersionConflictError:
+        # Answered with a retryable 409 by handle_version_conflict
+        raise
     except Exception as e:
         app.logger.error(f"Error in save endpoint: {str(e)}")
         return jsonify({
@@ -446,13 +1065,68 @@ def save():
             'error': str(e)
         }), 500
 
+@app.route('/api/lock_stats', methods=['GET'])
+def lock_stats():
+    """Contention counters for the dataset lock and the per-image lock stripes"""
+    return jsonify(image_locks.get_stats())
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the extraction, Claude response, segmentation, read-ahead and paper text caches"""
+    from modules import ClaudeAI
+    return jsonify({
+        'extraction_cache': dict(extraction_cache.stats) if extraction_cache else {},
+        'claude_completion_cache': ClaudeAI.get_completion_cache().get_stats(),
+        'segmentation_cache': gcp_ops.segmentation_cache.get_stats(),
+        'diatoms_read_ahead': diatoms_read_ahead.get_stats(),
+        'paper_text_store': paper_text_store.get_stats(),
+        'shared_state': shared_papers.get_stats()
+    })
+
+@app.route('/api/flush', methods=['POST'])
+def flush():
+    """Flush all queued label and segmentation edits to GCS now"""
+    try:
+        success = write_behind.flush()
+        return jsonify({
+            'success': success,
+            'stats': write_behind.get_stats()
+        }), (200 if success else 500)
+    except Exception as e:
+        app.logger.error(f"Error in flush endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/compact_papers', methods=['POST'])
+def compact_papers():
+    """Rebuild the legacy single-file papers JSON from the per-paper shards for export"""
+    try:
+        # Make sure queued edits are in the shards before compacting
+        write_behind.flush()
+        papers_json_url = gcp_ops.compact_paper_shards(PAPERS_SHARDS_BASE_URL, PAPERS_JSON_PUBLIC_URL)
+        if not papers_json_url:
+            raise Exception("Failed to compact paper shards")
+        return jsonify({
+            'success': True,
+            'gcp_url': papers_json_url,
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        app.logger.error(f"Error in compact_papers endpoint: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/download', methods=['GET'])
 def download_labels():
     """Download the saved labels file for current session"""
     try:
         # Create a temporary file for download
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            json.dump(DIATOMS_DATA, temp_file, indent=4)
+            json.dump([hydrate_segmentations(image_data) for image_data in paper_store.diatoms], temp_file, indent=4)
             temp_path = temp_file.name
         
         try:
@@ -479,12 +1153,10 @@ def download_labels():
 @app.route('/segmentation')
 def segmentation():
     """Route for the segmentation labeling interface"""
-    global DIATOMS_DATA
-    
     try:
-        if not DIATOMS_DATA:
+        if not paper_store.diatoms:
             try:
-                DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(PAPERS_JSON_PUBLIC_URL)
+                ensure_paper_store_loaded()
             except Exception as e:
                 app.logger.error("Error loading diatoms data: {}".format(str(e)))
                 return render_template('error.html', error="No diatom data available"), 404
@@ -497,6 +1169,7 @@ def segmentation():
         return render_template('error.html', error=str(e)), 500
 
 @app.route('/api/save_segmentation', methods=['POST'])
+@with_image_lock
 def save_segmentation():
     try:
         data = request.json
@@ -550,37 +1223,33 @@ def save_segmentation():
         
         logger.info(f"Saved segmentation to URL: {segmentation_url}")
             
-        # Update DIATOMS_DATA with enhanced indices array
-        if 0 <= image_index < len(DIATOMS_DATA):
-            DIATOMS_DATA[image_index]['segmentation_url'] = segmentation_url
-            DIATOMS_DATA[image_index]['segmentation_indices_array'] = segmentation_indices
+        # Update the image's diatoms data with enhanced indices array
+        if paper_store.is_valid_index(image_index):
+            current_image_data = paper_store.get_image(image_index)
+            fields = {
+                'segmentation_url': segmentation_url,
+                'segmentation_indices_array': segmentation_indices
+            }
+            
+            # Keep the polygon coordinates in a binary container and only a reference in the paper JSON
+            try:
+                container = SegmentationContainer.from_segmentation_indices(segmentation_data, segmentation_indices)
+                container_url = gcp_ops.save_segmentation_container(container, segmentation_url)
+                if container_url:
+                    fields['segmentation_container_url'] = container_url
+                    fields['segmentation_indices_array'] = container.compact_indices(segmentation_indices)
+            except ValueError as e:
+                logger.warning(f"Keeping inline polygon coordinates for {image_filename}: {str(e)}")
             
             # Store canvas dimensions if not present
-            if 'canvasWidth' not in DIATOMS_DATA[image_index]:
-                DIATOMS_DATA[image_index]['canvasWidth'] = segmentation_indices[0]['image_width'] if segmentation_indices else None
-            if 'canvasHeight' not in DIATOMS_DATA[image_index]:
-                DIATOMS_DATA[image_index]['canvasHeight'] = segmentation_indices[0]['image_height'] if segmentation_indices else None
+            if 'canvasWidth' not in current_image_data:
+                fields['canvasWidth'] = segmentation_indices[0]['image_width'] if segmentation_indices else None
+            if 'canvasHeight' not in current_image_data:
+                fields['canvasHeight'] = segmentation_indices[0]['image_height'] if segmentation_indices else None
             
-            # Update corresponding entry in PAPER_JSON_FILES
-            for paper in PAPER_JSON_FILES:
-                if 'diatoms_data' in paper:
-                    if isinstance(paper['diatoms_data'], str):
-                        paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-                    
-                    if paper['diatoms_data'].get('image_url') == DIATOMS_DATA[image_index].get('image_url'):
-                        paper['diatoms_data'].update({
-                            'segmentation_url': segmentation_url,
-                            'segmentation_indices_array': segmentation_indices,
-                            'canvasWidth': DIATOMS_DATA[image_index].get('canvasWidth'),
-                            'canvasHeight': DIATOMS_DATA[image_index].get('canvasHeight')
-                        })
-                        break
+            paper_store.update_image(image_index, fields)
             
-            success = ClaudeAI.update_and_save_papers(
-                PAPERS_JSON_PUBLIC_URL,
-                PAPER_JSON_FILES,
-                DIATOMS_DATA
-            )
+            success = save_image_papers([image_index])
             
             if not success:
                 raise Exception("Failed to update papers data in GCS")
@@ -595,6 +1264,8 @@ def save_segmentation():
         else:
             raise ValueError(f"Invalid image index: {image_index}")
             
+    except VersionConflictError:
+        raise
     except Exception as e:
         logger.error(f"Error saving segmentation: {str(e)}")
         return jsonify({
@@ -603,16 +1274,17 @@ def save_segmentation():
         }), 500
 
 @app.route('/api/update_segmentations', methods=['POST'])
+@with_image_lock
 def update_segmentations():
     """Update existing segmentations with enhanced data structure"""
     try:
         data = request.json
         image_index = data.get('image_index')
         
-        if not 0 <= image_index < len(DIATOMS_DATA):
+        if not paper_store.is_valid_index(image_index):
             raise ValueError("Invalid image index")
             
-        current_image = DIATOMS_DATA[image_index]
+        current_image = paper_store.get_image(image_index)
         existing_indices = current_image.get('segmentation_indices_array', [])
         
         if not existing_indices:
@@ -707,25 +1379,11 @@ def update_segmentations():
         if 'canvasHeight' not in current_image:
             current_image['canvasHeight'] = image_height
         
-        # Update DIATOMS_DATA
-        DIATOMS_DATA[image_index] = current_image
-        
-        # Update corresponding entry in PAPER_JSON_FILES
-        for paper in PAPER_JSON_FILES:
-            if 'diatoms_data' in paper:
-                if isinstance(paper['diatoms_data'], str):
-                    paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-                
-                if paper['diatoms_data'].get('image_url') == current_image.get('image_url'):
-                    paper['diatoms_data'] = current_image
-                    break
+        # Update DIATOMS_DATA and the corresponding paper
+        paper_store.replace_image(image_index, current_image)
         
         # Save updated data to GCS
-        success = ClaudeAI.update_and_save_papers(
-            PAPERS_JSON_PUBLIC_URL,
-            PAPER_JSON_FILES,
-            DIATOMS_DATA
-        )
+        success = save_image_papers([image_index])
         
         if not success:
             raise Exception("Failed to save updates to GCS")
@@ -736,6 +1394,8 @@ def update_segmentations():
             'updated_count': len(enhanced_indices)
         })
         
+    except VersionConflictError:
+        raise
     except Exception as e:
         logger.error(f"Error updating segmentations: {str(e)}")
         return jsonify({
@@ -744,6 +1404,7 @@ def update_segmentations():
         }), 500
                 
 @app.route('/api/get_segmentation')
+@with_image_lock
 def get_segmentation():
     """Get segmentation data with enhanced fields"""
     try:
@@ -764,34 +1425,24 @@ def get_segmentation():
         
         # Get enhanced segmentation data
         segmentation_indices = None
-        if image_index is not None and 0 <= image_index < len(DIATOMS_DATA):
-            image_data = DIATOMS_DATA[image_index]
+        if image_index is not None and paper_store.is_valid_index(image_index):
+            image_data = paper_store.get_image(image_index)
             segmentation_indices = image_data.get('segmentation_indices_array', [])
             
             # Add canvas dimensions if not present
             if 'canvasWidth' not in image_data:
-                image_data['canvasWidth'] = image_data.get('image_width')
-                image_data['canvasHeight'] = image_data.get('image_height')
-                
-                # Update PAPER_JSON_FILES with canvas dimensions
-                for paper in PAPER_JSON_FILES:
-                    if 'diatoms_data' in paper:
-                        if isinstance(paper['diatoms_data'], str):
-                            paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-                        
-                        if paper['diatoms_data'].get('image_url') == image_data.get('image_url'):
-                            paper['diatoms_data'].update({
-                                'canvasWidth': image_data['canvasWidth'],
-                                'canvasHeight': image_data['canvasHeight']
-                            })
-                            break
+                image_data = paper_store.update_image(image_index, {
+                    'canvasWidth': image_data.get('image_width'),
+                    'canvasHeight': image_data.get('image_height')
+                })
             
             # Process segmentations using SegmentationOps
             image_data = segmentation_ops.process_image_segmentations(
                 image_data,
-                annotations
+                annotations,
+                paper_store.get_spatial_index(image_index)
             )
-            segmentation_indices = image_data.get('segmentation_indices_array', [])
+            segmentation_indices = hydrate_segmentations(image_data).get('segmentation_indices_array', [])
         
         return jsonify({
             'annotations': annotations,
@@ -815,7 +1466,7 @@ def download_segmentation():
                 'segmentation_url': item.get('segmentation_url', ''),
                 'image_width': item.get('image_width', ''),
                 'image_height': item.get('image_height', '')
-            } for item in DIATOMS_DATA if item.get('segmentation_url')]
+            } for item in paper_store.diatoms if item.get('segmentation_url')]
             
             json.dump(segmentation_data, temp_file, indent=4)
             temp_path = temp_file.name
@@ -972,6 +1623,7 @@ def fetch_and_process_data():
     """Fetch data from the CSV URL and properly convert synonyms to string"""
     url = "https://storage.googleapis.com/papers-diatoms-colossus/cvs/colossus.csv"
     try:
+        import pandas as pd
         df = pd.read_csv(url)
         # Convert the synonyms column data type to string without splitting characters
         df['synonyms'] = df['synonyms'].str.join('')
@@ -991,41 +1643,34 @@ def display_table():
 def get_diatom_list_assistant():
     try:
         image_index = request.args.get('index', 0, type=int)
+        # refresh=true skips the Claude response cache and asks again
+        refresh = request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes')
         
-        if not DIATOMS_DATA or image_index >= len(DIATOMS_DATA):
+        if not paper_store.diatoms or image_index >= paper_store.image_count():
             return jsonify({
                 'error': 'No data available or invalid index'
             }), 404
 
-        # Get the current image data
-        current_image_data = DIATOMS_DATA[image_index]
+        # Read a copy; the Claude call below takes too long to hold the image lock across it
+        current_image_data = paper_store.get_image_snapshot(image_index)[1]
         
         # Extract existing labels from the info array
         labels = [info['label'][0] for info in current_image_data.get('info', [])]
         
         
         # Find corresponding paper and pdf_text_content
-        pdf_text_content = ""
-        matching_paper = None
-        for paper in PAPER_JSON_FILES:
-            if isinstance(paper.get('diatoms_data'), str):
-                paper_diatoms_data = json.loads(paper['diatoms_data'])
-            else:
-                paper_diatoms_data = paper.get('diatoms_data', {})
-                
-            if paper_diatoms_data.get('image_url') == current_image_data.get('image_url'):
-                pdf_text_content = paper.get('pdf_text_content', '')
-                matching_paper = paper
-                break
-            
-                
+        matching_paper = paper_store.get_paper_for_image(image_index)
+        pdf_text_content = matching_paper.get('pdf_text_content', '') if matching_paper else ""
+        if matching_paper and not pdf_text_content:
+            pdf_text_content = paper_text_store.get(paper_store.get_image_paper_key(image_index)).get('pdf_text_content', '')
 
         # Use Claude to find missing species
+        from modules import ClaudeAI
         claude = ClaudeAI()
         reformatted_labels = claude.reformat_labels_to_spaces(labels)
         # messages = claude.part3_create_missing_species_prompt_and_messages(pdf_text_content, labels)
         messages = claude.part3_create_missing_species_prompt_and_messages(pdf_text_content, reformatted_labels)
-        response = claude.get_completion(messages)
+        response = claude.get_completion(messages, refresh=refresh)
 
         if "error" in response:
             return jsonify({
@@ -1051,23 +1696,18 @@ def get_diatom_list_assistant():
         # Add new species to current_image_data's info array
         new_species_added = False
         if response['species_data']:
-            current_image_data['info'].extend(response['species_data'])
-            new_species_added = True
-
-            # Update the matching paper's diatoms_data
-            if matching_paper:
-                if isinstance(matching_paper['diatoms_data'], str):
-                    matching_paper['diatoms_data'] = json.loads(matching_paper['diatoms_data'])
-                matching_paper['diatoms_data'] = current_image_data
-
-                # Save updated data to GCP
-                success = ClaudeAI.update_and_save_papers(
-                    PAPERS_JSON_PUBLIC_URL,
-                    PAPER_JSON_FILES,
-                    DIATOMS_DATA
-                )
-                if not success:
-                    logger.error("Failed to save updated data to GCP")
+            with image_locks.image(image_index):
+                # Append to the labels as they are now, in case they were edited during the Claude call
+                info = copy.deepcopy(paper_store.get_image(image_index).get('info') or [])
+                info.extend(response['species_data'])
+                paper_store.update_image(image_index, {'info': info})
+                new_species_added = True
+
+                if matching_paper:
+                    # Save updated data to GCP
+                    success = save_image_papers([image_index])
+                    if not success:
+                        logger.error("Failed to save updated data to GCP")
 
         # Return the complete data for frontend processing
         return jsonify({
@@ -1085,6 +1725,8 @@ def get_diatom_list_assistant():
             'error': 'Failed to parse JSON response',
             'details': str(e)
         }), 500
+    except VersionConflictError:
+        raise
     except Exception as e:
         logger.error(f"Error in diatom_list_assistant: {str(e)}")
         return jsonify({
@@ -1098,12 +1740,10 @@ def get_diatom_list_assistant():
 @app.route('/label_union')
 def label_union():
     """Route for the label union interface"""
-    global DIATOMS_DATA
-    
     try:
-        if not DIATOMS_DATA:
+        if not paper_store.diatoms:
             try:
-                DIATOMS_DATA = ClaudeAI.get_DIATOMS_DATA(PAPERS_JSON_PUBLIC_URL)
+                ensure_paper_store_loaded()
             except Exception as e:
                 app.logger.error(f"Error loading diatoms data: {str(e)}")
                 return render_template('error.html', error="No diatom data available"), 404
@@ -1115,6 +1755,7 @@ def label_union():
         return render_template('error.html', error=str(e)), 500
 
 @app.route('/api/delete_segmentation', methods=['POST'])
+@with_image_lock
 def delete_segmentation():
     """Delete a segmentation from an image and update the segmentation file"""
     try:
@@ -1122,10 +1763,11 @@ def delete_segmentation():
         image_index = data.get('image_index', 0)
         segmentation_index = data.get('segmentation_index', 0)
         
-        if not 0 <= image_index < len(DIATOMS_DATA):
+        if not paper_store.is_valid_index(image_index):
             raise ValueError("Invalid image index")
             
-        current_image_data = DIATOMS_DATA[image_index]
+        # Edited on a copy so a failed save below leaves the stored image unchanged
+        current_image_data = copy.deepcopy(paper_store.get_image(image_index))
         
         # Get the segmentation URL
         segmentation_url = current_image_data.get('segmentation_url')
@@ -1139,6 +1781,8 @@ def delete_segmentation():
 
         # Split into lines and remove the specified segmentation
         lines = segmentation_text.strip().split('\n')
+        image_filename = current_image_data.get('image_url', '').split('/')[-1]
+        text_updated = False
         if 0 <= segmentation_index < len(lines):
             lines.pop(segmentation_index)
             
@@ -1146,7 +1790,6 @@ def delete_segmentation():
             updated_segmentation_text = '\n'.join(lines)
             
             # Save updated text back to GCP
-            image_filename = current_image_data.get('image_url', '').split('/')[-1]
             updated_segmentation_url = gcp_ops.save_segmentation_data(
                 segmentation_data=updated_segmentation_text,
                 image_filename=image_filename,
@@ -1159,6 +1802,7 @@ def delete_segmentation():
             
             # Update the segmentation URL in case it changed
             current_image_data['segmentation_url'] = updated_segmentation_url
+            text_updated = True
 
         # Remove the segmentation from indices array
         if 'segmentation_indices_array' in current_image_data:
@@ -1166,25 +1810,35 @@ def delete_segmentation():
                 seg for i, seg in enumerate(current_image_data['segmentation_indices_array'])
                 if i != segmentation_index
             ]
-        
-        # Update DIATOMS_DATA
-        DIATOMS_DATA[image_index] = current_image_data
-        
-        # Update paper JSON files
-        for paper in PAPER_JSON_FILES:
-            if isinstance(paper.get('diatoms_data'), str):
-                paper['diatoms_data'] = json.loads(paper['diatoms_data'])
             
-            if paper['diatoms_data'].get('image_url') == current_image_data.get('image_url'):
-                paper['diatoms_data'] = current_image_data
-                break
+            # Drop the polygon from the binary container and shift the later references
+            container_url = current_image_data.get('segmentation_container_url')
+            container = gcp_ops.load_segmentation_container(container_url) if container_url else None
+            if container is not None and 0 <= segmentation_index < len(container):
+                saved_container_url = gcp_ops.save_segmentation_container(
+                    container.without(segmentation_index), current_image_data['segmentation_url']
+                )
+                if not saved_container_url:
+                    # The text and the container must keep listing the same polygons, and the
+                    # references must keep matching the container that is still on GCS
+                    if text_updated and not gcp_ops.save_segmentation_data(
+                        segmentation_data=segmentation_text,
+                        image_filename=image_filename,
+                        session_id=SESSION_ID,
+                        bucket_name=BUCKET_SEGMENTATION_LABELS
+                    ):
+                        logger.error(f"Failed to restore segmentation text of image {image_index} after the container save failed")
+                    raise Exception("Failed to save updated segmentation container to GCP")
+                current_image_data['segmentation_container_url'] = saved_container_url
+                for seg in current_image_data['segmentation_indices_array']:
+                    if isinstance(seg, dict) and isinstance(seg.get('polygon_ref'), int) and seg['polygon_ref'] > segmentation_index:
+                        seg['polygon_ref'] -= 1
+        
+        # Update DIATOMS_DATA and the corresponding paper
+        paper_store.replace_image(image_index, current_image_data)
         
         # Save to GCP
-        success = ClaudeAI.update_and_save_papers(
-            PAPERS_JSON_PUBLIC_URL,
-            PAPER_JSON_FILES,
-            DIATOMS_DATA
-        )
+        success = save_image_papers([image_index])
         
         if not success:
             raise Exception("Failed to save updates to GCP")
@@ -1194,6 +1848,8 @@ def delete_segmentation():
             'message': 'Segmentation deleted successfully'
         })
         
+    except VersionConflictError:
+        raise
     except Exception as e:
         logger.error(f"Error deleting segmentation: {str(e)}")
         return jsonify({
@@ -1204,16 +1860,17 @@ def delete_segmentation():
 
       
 @app.route('/api/align_bbox_segmentation', methods=['POST'])
+@with_image_lock
 def align_bbox_segmentation():
     """Align bounding boxes with segmentations for a single image"""
     try:
         data = request.json
         image_index = data.get('image_index', 0)
         
-        if not 0 <= image_index < len(DIATOMS_DATA):
+        if not paper_store.is_valid_index(image_index):
             raise ValueError("Invalid image index")
 
-        current_image_data = DIATOMS_DATA[image_index]
+        current_image_data = paper_store.get_image(image_index)
         
         # Verify segmentation URL exists
         if not current_image_data.get('segmentation_url'):
@@ -1233,32 +1890,15 @@ def align_bbox_segmentation():
         # Process segmentations
         updated_image_data = segmentation_ops.process_image_segmentations(
             current_image_data,
-            segmentation_text
+            segmentation_text,
+            paper_store.get_spatial_index(image_index)
         )
         
-        # Update DIATOMS_DATA
-        DIATOMS_DATA[image_index] = updated_image_data
-        
-        # Update paper JSON files
-        updated_paper = False
-        for paper in PAPER_JSON_FILES:
-            if isinstance(paper.get('diatoms_data'), str):
-                paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-            
-            if paper['diatoms_data'].get('image_url') == current_image_data.get('image_url'):
-                paper['diatoms_data'] = updated_image_data
-                updated_paper = True
-                break
-        
-        if not updated_paper:
-            app.logger.warning(f"No matching paper found for image {image_index}")
+        # Update DIATOMS_DATA and the corresponding paper
+        paper_store.replace_image(image_index, updated_image_data)
         
         # Save to GCP
-        success = ClaudeAI.update_and_save_papers(
-            PAPERS_JSON_PUBLIC_URL,
-            PAPER_JSON_FILES,
-            DIATOMS_DATA
-        )
+        success = save_image_papers([image_index])
         
         if not success:
             raise Exception("Failed to save updates to GCP")
@@ -1269,6 +1909,8 @@ def align_bbox_segmentation():
             'updated_data': updated_image_data
         })
         
+    except VersionConflictError:
+        raise
     except Exception as e:
         app.logger.error(f"Error in align_bbox_segmentation: {str(e)}")
         return jsonify({
@@ -1276,73 +1918,63 @@ def align_bbox_segmentation():
             'error': str(e)
         }), 500
                 
+# Background alignment jobs, newest last
+alignment_jobs = {}
+alignment_jobs_lock = Lock()
+MAX_ALIGNMENT_JOBS_KEPT = 20
+
+def commit_alignments(aligned, snapshot_versions):
+    """Store aligned images that were not edited while the job ran and persist them in one flush"""
+    committed_indices = []
+    errors = []
+    with image_locks.dataset():
+        for index, snapshot, updated_image_data in aligned:
+            # Every change through the store bumps the version; comparing it avoids a deep compare
+            if paper_store.get_image_version(index) != snapshot_versions.get(index):
+                errors.append({'image_index': index, 'error': f"Image {index} was edited during alignment; skipped"})
+                continue
+            paper_store.replace_image(index, updated_image_data)
+            committed_indices.append(index)
+        if committed_indices:
+            save_image_papers(committed_indices)
+    
+    if committed_indices:
+        if not write_behind.flush():
+            raise Exception("Failed to save updates to GCP")
+    return committed_indices, errors
+
 @app.route('/api/align_all_images', methods=['POST'])
 def align_all_images():
-    """Automatically align bounding boxes with segmentations for all images"""
+    """Start a background job that aligns bounding boxes with segmentations for all images"""
     try:
-        total_processed = 0
-        errors = []
-        processed_indices = []
-        
-        for index, image_data in enumerate(DIATOMS_DATA):
-            try:
-                # Skip images without segmentation data
-                if not image_data.get('segmentation_url'):
-                    continue
-                    
-                # Load segmentation data
-                segmentation_text = gcp_ops.load_segmentation_data(image_data['segmentation_url'])
-                if not segmentation_text:
-                    errors.append(f"Failed to load segmentation data for image {index}")
-                    continue
-                
-                # Process segmentations
-                updated_image_data = segmentation_ops.process_image_segmentations(
-                    image_data,
-                    segmentation_text
-                )
-                
-                if not updated_image_data.get('segmentation_indices_array'):
-                    errors.append(f"Failed to process segmentations for image {index}")
-                    continue
-                
-                # Update DIATOMS_DATA
-                DIATOMS_DATA[index] = updated_image_data
-                
-                # Update corresponding paper
-                for paper in PAPER_JSON_FILES:
-                    if isinstance(paper.get('diatoms_data'), str):
-                        paper['diatoms_data'] = json.loads(paper['diatoms_data'])
-                    
-                    if paper['diatoms_data'].get('image_url') == image_data.get('image_url'):
-                        paper['diatoms_data'] = updated_image_data
-                        break
-                
-                total_processed += 1
-                processed_indices.append(index)
-                
-            except Exception as e:
-                errors.append(f"Error processing image {index}: {str(e)}")
-                continue
-        
-        # Save all updates to GCP
-        if total_processed > 0:
-            success = ClaudeAI.update_and_save_papers(
-                PAPERS_JSON_PUBLIC_URL,
-                PAPER_JSON_FILES,
-                DIATOMS_DATA
-            )
+        with alignment_jobs_lock:
+            # Only one alignment job runs at a time; report the running one instead
+            for job in alignment_jobs.values():
+                if not job.finished:
+                    return jsonify({'success': True, 'job_id': job.job_id, 'status': job.get_status()}), 202
             
-            if not success:
-                raise Exception("Failed to save updates to GCP")
+            # Snapshot the images and their versions so edits made while the job runs can be detected at commit
+            images = []
+            snapshot_versions = {}
+            with image_locks.dataset():
+                for index, image_data in enumerate(paper_store.diatoms):
+                    if image_data.get('segmentation_url'):
+                        snapshot_versions[index] = paper_store.get_image_version(index)
+                        images.append((index, copy.deepcopy(image_data)))
+            
+            job = AlignmentJob(
+                job_id=uuid.uuid4().hex,
+                images=images,
+                load_segmentation=gcp_ops.load_segmentation_data,
+                commit=functools.partial(commit_alignments, snapshot_versions=snapshot_versions),
+                on_update=lambda status: state_backend.put('alignment_jobs', status['job_id'], status)
+            )
+            alignment_jobs[job.job_id] = job
+            while len(alignment_jobs) > MAX_ALIGNMENT_JOBS_KEPT:
+                alignment_jobs.pop(next(iter(alignment_jobs)))
         
-        return jsonify({
-            'success': True,
-            'total_processed': total_processed,
-            'processed_indices': processed_indices,
-            'errors': errors,
-            'message': f'Successfully processed {total_processed} images'
-        })
+        job.start()
+        return jsonify({'success': True, 'job_id': job.job_id, 'status': job.get_status()}), 202
         
     except Exception as e:
         app.logger.error(f"Error in align_all_images: {str(e)}")
@@ -1351,9 +1983,45 @@ def align_all_images():
             'error': str(e)
         }), 500
 
+@app.route('/api/align_all_images/<job_id>', methods=['GET'])
+def align_all_images_status(job_id):
+    """Get the progress of a background alignment job"""
+    with alignment_jobs_lock:
+        job = alignment_jobs.get(job_id)
+    if job is not None:
+        return jsonify({'success': True, 'status': job.get_status()})
+    
+    # The job may be running in another worker
+    record = state_backend.get('alignment_jobs', job_id)
+    if record is None:
+        return jsonify({'success': False, 'error': 'Unknown alignment job'}), 404
+    return jsonify({'success': True, 'status': record[1]})
+
 
 # ----------------------------------------------------------------------------------------
 
+# Startup I/O runs on a warm-up thread so a cold start serves /readyz and /healthz at once.
+# STARTUP_MODE=eager runs it at import instead (e.g. for scripts importing app).
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'lazy')
+# How long a request arriving during warm-up waits for it before getting a 503
+STARTUP_WAIT_SECONDS = float(os.environ.get('STARTUP_WAIT_SECONDS', '60'))
+warm_up = WarmUp([
+    ('papers', load_initial_papers),
+    ('write_behind_journals', replay_write_behind_journals),
+    ('paper_texts', offload_resident_paper_texts),
+    ('pdf_tracker', load_uploaded_pdf_files_df),
+    ('ingest_jobs', resume_ingest_jobs),
+])
+
+# Process pool workers started with forkserver/spawn re-import this file as __mp_main__ when it
+# is run directly; they must not load the dataset, replay journals or resume ingest jobs
+if __name__ == '__mp_main__':
+    pass
+elif STARTUP_MODE == 'eager':
+    warm_up.run()
+else:
+    warm_up.start()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, threaded=True)
\ No newline at end of file
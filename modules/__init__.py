@@ -1,7 +1,54 @@
-from .installed_packages import get_installed_packages
-from .claudeAI import ClaudeAI
-from .gcpOps import GCPOps
-from .pdfOps import PDFOps
-from .segmentationOps import SegmentationOps
+import importlib
 
-__all__ = ['get_installed_packages', 'ClaudeAI', 'GCPOps', 'PDFOps', 'SegmentationOps']
\ No newline at end of file
+# Submodule defining each exported name. Submodules are imported on first attribute
+# access (PEP 562), so importing one light class does not pull in anthropic, fitz,
+# google-cloud-storage or pandas through the others.
+_EXPORTS = {
+    'get_installed_packages': '.installed_packages',
+    'ClaudeAI': '.claudeAI',
+    'AsyncClaudeRunner': '.claudeAI',
+    'GCPOps': '.gcpOps',
+    'PDFOps': '.pdfOps',
+    'SegmentationOps': '.segmentationOps',
+    'PaperStore': '.paperStore',
+    'WriteBehindQueue': '.writeBehind',
+    'TokenBucket': '.rateLimiter',
+    'AnthropicRateLimiter': '.rateLimiter',
+    'IngestPipeline': '.ingestPipeline',
+    'PipelineStage': '.ingestPipeline',
+    'ExtractionCache': '.extractionCache',
+    'LocalDiskCacheBackend': '.extractionCache',
+    'GCSCacheBackend': '.extractionCache',
+    'CompletionCache': '.completionCache',
+    'BBoxGridIndex': '.spatialIndex',
+    'SegmentationContainer': '.segmentationContainer',
+    'AlignmentJob': '.alignmentJob',
+    'SegmentationCache': '.segmentationCache',
+    'ReadAheadCache': '.readAheadCache',
+    'PaperTextStore': '.paperTextStore',
+    'InMemoryStateBackend': '.sharedState',
+    'SQLiteStateBackend': '.sharedState',
+    'SharedDocument': '.sharedState',
+    'SharedPaperState': '.sharedState',
+    'VersionConflictError': '.sharedState',
+    'create_state_backend': '.sharedState',
+    'ImageLocks': '.imageLocks',
+    'ReadWriteLock': '.imageLocks',
+    'WarmUp': '.warmUp',
+    'IngestJobRegistry': '.ingestJobs',
+    'ProgressBroadcaster': '.progressBroadcaster',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
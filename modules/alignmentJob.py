@@ -0,0 +1,241 @@
+import os
+import copy
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .segmentationOps import SegmentationOps
+from .spatialIndex import BBoxGridIndex
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Created once per worker process
+_segmentation_ops: Optional[SegmentationOps] = None
+
+
+def _align_shard(shard: List[Tuple[int, Dict[str, Any], str]]) -> List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Align a shard of images in a worker process.
+
+    Args:
+        shard (list): (image_index, image_data, segmentation_text) tuples
+
+    Returns:
+        list: (image_index, updated_image_data, error) tuples, with exactly one of
+        updated_image_data and error set
+    """
+    global _segmentation_ops
+    if _segmentation_ops is None:
+        _segmentation_ops = SegmentationOps()
+
+    results = []
+    for image_index, image_data, segmentation_text in shard:
+        try:
+            # Aligning mutates the image in place; on the thread fallback it is the caller's snapshot
+            image_data = copy.deepcopy(image_data)
+            bboxes = image_data.get('info') or []
+            spatial_index = BBoxGridIndex(bboxes) if len(bboxes) >= BBoxGridIndex.MIN_BBOXES else None
+            updated_image_data = _segmentation_ops.process_image_segmentations(
+                image_data, segmentation_text, spatial_index
+            )
+            if not updated_image_data.get('segmentation_indices_array'):
+                results.append((image_index, None, f"Failed to process segmentations for image {image_index}"))
+            else:
+                results.append((image_index, updated_image_data, None))
+        except Exception as e:
+            results.append((image_index, None, f"Error processing image {image_index}: {str(e)}"))
+    return results
+
+
+class AlignmentJob:
+    """
+    Background bbox/segmentation alignment over many images.
+
+    Segmentation files are downloaded on a thread pool and, as they arrive,
+    grouped into shards that are aligned on a process pool, so downloading
+    and aligning overlap. All aligned images are handed to the commit
+    callback together once every shard is done, so they are persisted in a
+    single flush. Progress is readable at any time through get_status().
+    """
+
+    PUBLISH_INTERVAL_SECONDS = 0.5
+    PREFETCH_WORKERS = int(os.getenv('ALIGN_PREFETCH_WORKERS', '8'))
+    PROCESS_WORKERS = int(os.getenv('ALIGN_PROCESS_WORKERS', str(os.cpu_count() or 1)))
+    SHARD_SIZE = int(os.getenv('ALIGN_SHARD_SIZE', '16'))
+
+    def __init__(self, job_id: str, images: List[Tuple[int, Dict[str, Any]]],
+                 load_segmentation: Callable[[str], Optional[str]],
+                 commit: Callable[[List[Tuple[int, Dict[str, Any], Dict[str, Any]]]], Tuple[List[int], List[Dict[str, Any]]]],
+                 on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the job.
+
+        Args:
+            job_id (str): Identifier reported in the status
+            images (list): (image_index, image_data) snapshots of the images to align;
+                images without a segmentation_url are skipped
+            load_segmentation (callable): Returns the segmentation text for a URL, or None
+            commit (callable): Receives (image_index, snapshot, updated_image_data) tuples
+                and returns (committed_indices, errors)
+            on_update (callable): Receives the status after state changes and, at most
+                every PUBLISH_INTERVAL_SECONDS, after progress, e.g. to share it with other workers
+        """
+        self.job_id = job_id
+        self.images = [(index, image_data) for index, image_data in images if image_data.get('segmentation_url')]
+        self.load_segmentation = load_segmentation
+        self.commit = commit
+        self.on_update = on_update
+        self._last_published = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {
+            'job_id': job_id,
+            'state': 'queued',
+            'total': len(self.images),
+            'fetched': 0,
+            'aligned': 0,
+            'total_processed': 0,
+            'processed_indices': [],
+            'errors': [],
+            'started_at': None,
+            'finished_at': None,
+        }
+
+    def _publish(self, force: bool = False) -> None:
+        if not self.on_update or (not force and time.time() - self._last_published < self.PUBLISH_INTERVAL_SECONDS):
+            return
+        self._last_published = time.time()
+        try:
+            self.on_update(self.get_status())
+        except Exception as e:
+            logger.error(f"Error publishing alignment job {self.job_id} status: {str(e)}")
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self.status.update(fields)
+        self._publish(force=True)
+
+    def _increment(self, field: str, amount: int = 1) -> None:
+        with self._lock:
+            self.status[field] += amount
+        self._publish()
+
+    def _add_error(self, image_index: Optional[int], error: str) -> None:
+        with self._lock:
+            self.status['errors'].append({'image_index': image_index, 'error': error})
+
+    def get_status(self) -> Dict[str, Any]:
+        """Return a copy of the job's progress counters and per-image errors."""
+        with self._lock:
+            return dict(
+                self.status,
+                processed_indices=list(self.status['processed_indices']),
+                errors=list(self.status['errors'])
+            )
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return self.status['state'] in ('complete', 'failed')
+
+    def start(self) -> None:
+        """Run the job on a background thread."""
+        self._publish(force=True)
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def _create_process_pool(self):
+        try:
+            # Forked children of a threaded gunicorn worker could inherit locks held by its other threads
+            return ProcessPoolExecutor(max_workers=max(1, self.PROCESS_WORKERS),
+                                       mp_context=multiprocessing.get_context('forkserver'))
+        except (OSError, NotImplementedError, ValueError) as e:
+            logger.warning(f"Process pool unavailable, aligning on a thread instead: {str(e)}")
+            return ThreadPoolExecutor(max_workers=1)
+
+    def _collect_shard(self, future, shard: List[Tuple[int, Dict[str, Any], str]],
+                       aligned: List[Tuple[int, Dict[str, Any], Dict[str, Any]]],
+                       snapshots: Dict[int, Dict[str, Any]]) -> None:
+        try:
+            results = future.result()
+        except Exception as e:
+            # A crashed worker loses the whole shard
+            for image_index, _, _ in shard:
+                self._add_error(image_index, f"Error processing image {image_index}: {str(e)}")
+            self._increment('aligned', len(shard))
+            return
+
+        for image_index, updated_image_data, error in results:
+            if error:
+                self._add_error(image_index, error)
+            else:
+                aligned.append((image_index, snapshots[image_index], updated_image_data))
+        self._increment('aligned', len(results))
+
+    def run(self) -> None:
+        """Prefetch, align and commit every image, updating the status as it goes."""
+        self._update(state='running', started_at=time.time())
+        snapshots = dict(self.images)
+        aligned: List[Tuple[int, Dict[str, Any], Dict[str, Any]]] = []
+
+        try:
+            shard_futures = {}
+            with ThreadPoolExecutor(max_workers=max(1, self.PREFETCH_WORKERS)) as fetch_pool, \
+                    self._create_process_pool() as align_pool:
+                fetches = {
+                    fetch_pool.submit(self.load_segmentation, image_data['segmentation_url']): image_index
+                    for image_index, image_data in self.images
+                }
+
+                shard = []
+                for future in as_completed(fetches):
+                    image_index = fetches[future]
+                    try:
+                        segmentation_text = future.result()
+                    except Exception as e:
+                        logger.error(f"Error loading segmentation data for image {image_index}: {str(e)}")
+                        segmentation_text = None
+                    self._increment('fetched')
+
+                    if not segmentation_text:
+                        self._add_error(image_index, f"Failed to load segmentation data for image {image_index}")
+                        self._increment('aligned')
+                        continue
+
+                    shard.append((image_index, snapshots[image_index], segmentation_text))
+                    if len(shard) >= self.SHARD_SIZE:
+                        shard_futures[align_pool.submit(_align_shard, shard)] = shard
+                        shard = []
+
+                if shard:
+                    shard_futures[align_pool.submit(_align_shard, shard)] = shard
+
+                for future in as_completed(shard_futures):
+                    self._collect_shard(future, shard_futures[future], aligned, snapshots)
+
+            self._update(state='committing')
+            aligned.sort(key=lambda item: item[0])
+            committed_indices, commit_errors = self.commit(aligned) if aligned else ([], [])
+            for error in commit_errors:
+                self._add_error(error.get('image_index'), error.get('error'))
+
+            self._update(
+                state='complete',
+                total_processed=len(committed_indices),
+                processed_indices=sorted(committed_indices),
+                finished_at=time.time()
+            )
+            logger.info(f"Alignment job {self.job_id} aligned {len(committed_indices)} of {len(self.images)} images")
+
+        except Exception as e:
+            logger.error(f"Error in alignment job {self.job_id}: {str(e)}")
+            self._add_error(None, str(e))
+            self._update(state='failed', finished_at=time.time())
@@ -1,5 +1,8 @@
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from google.cloud import storage
+import asyncio
+import threading
+import time
 import logging
 from typing import List, Dict, Optional, Any, Union, Tuple
 from datetime import datetime, timedelta
@@ -7,6 +10,7 @@ from dotenv import load_dotenv
 import json
 import os
 import requests
+from .completionCache import CompletionCache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,41 +22,159 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Response cache shared by all ClaudeAI instances in the process
+_completion_cache: Optional[CompletionCache] = None
+_completion_cache_lock = threading.Lock()
+
 class ClaudeAI:
     """
     A class to handle interactions with Claude AI API and manage paper data storage.
     """
+
+    # Bump whenever the extraction prompts or their post-processing change, so
+    # cached extraction results from older prompts are not reused
+    PROMPT_VERSION = "1"
+
+    MAX_TOKENS = 8092
+    
+    # Cap on in-flight requests when running prompts concurrently with the async client
+    MAX_CONCURRENT_REQUESTS = int(os.getenv('CLAUDE_MAX_CONCURRENT_REQUESTS', '4'))
     
     def __init__(self):
         """Initialize the ClaudeAI instance with necessary credentials and configurations."""
         self.CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
         self.secret_json = os.getenv('GOOGLE_SECRET_JSON')
-        self.client = Anthropic(api_key=self.CLAUDE_API_KEY)
+        # CLAUDE_BASE_URL points the client at another endpoint, e.g. a local stub server for benchmarks
+        self.base_url = os.getenv('CLAUDE_BASE_URL') or None
+        self.client = Anthropic(api_key=self.CLAUDE_API_KEY, base_url=self.base_url)
         self.MODEL_NAME = "claude-3-5-sonnet-20241022"
 
-    def get_completion(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def create_async_client(self) -> AsyncAnthropic:
+        """
+        Create an async Anthropic client with the same credentials and endpoint.
+        
+        The client must be used (and closed) on the event loop it was created for.
+
+        Returns:
+            AsyncAnthropic: Async API client
+        """
+        return AsyncAnthropic(api_key=self.CLAUDE_API_KEY, base_url=self.base_url)
+
+    @staticmethod
+    def get_completion_cache() -> CompletionCache:
+        """
+        Get the process-wide response cache, creating it on first use.
+        
+        CLAUDE_COMPLETION_CACHE_PATH sets the SQLite file (empty for memory only),
+        CLAUDE_COMPLETION_CACHE_ENTRIES the in-memory LRU size and
+        CLAUDE_COMPLETION_CACHE_TTL_SECONDS the maximum age of persisted responses.
+
+        Returns:
+            CompletionCache: Shared response cache
+        """
+        global _completion_cache
+        with _completion_cache_lock:
+            if _completion_cache is None:
+                ttl_seconds = os.getenv('CLAUDE_COMPLETION_CACHE_TTL_SECONDS')
+                _completion_cache = CompletionCache(
+                    db_path=os.getenv(
+                        'CLAUDE_COMPLETION_CACHE_PATH',
+                        os.path.join('temp_uploads', 'claude_completion_cache.sqlite3')
+                    ) or None,
+                    max_memory_entries=int(os.getenv('CLAUDE_COMPLETION_CACHE_ENTRIES', '256')),
+                    ttl_seconds=float(ttl_seconds) if ttl_seconds else None
+                )
+            return _completion_cache
+
+    def _cached_completion(self, messages: List[Dict[str, Any]], refresh: bool) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Return the cache key for a request and the cached response, unless refreshing."""
+        cache = self.get_completion_cache()
+        cache_key = cache.make_key(self.MODEL_NAME, self.MAX_TOKENS, messages)
+        if refresh:
+            cache.record_bypass()
+            return cache_key, None
+        return cache_key, cache.get(cache_key)
+
+    @staticmethod
+    def _parse_completion(response: Any) -> Dict[str, Any]:
+        """
+        Parse the JSON body of a Claude message response.
+
+        Args:
+            response: Message returned by the API
+
+        Returns:
+            dict: Parsed JSON response, or a dict with an "error" key
+        """
+        try:
+            return json.loads(response.content[0].text)
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON in response"}
+        except (IndexError, AttributeError):
+            return {"error": "Unexpected response format"}
+
+    def get_completion(self, messages: List[Dict[str, Any]], refresh: bool = False) -> Dict[str, Any]:
         """
         Send a request to Claude API and return the completion.
+        
+        Identical requests are answered from the response cache.
 
         Args:
             messages (list): Array of message objects
+            refresh (bool): Skip the cache lookup and store the fresh response
 
         Returns:
             dict: Parsed JSON response from Claude
         """
         try:
+            cache_key, cached = self._cached_completion(messages, refresh)
+            if cached is not None:
+                return cached
+
             response = self.client.messages.create(
                 model=self.MODEL_NAME,
-                max_tokens=8092,
+                max_tokens=self.MAX_TOKENS,
                 messages=messages
             )
+            completion = self._parse_completion(response)
+            self.get_completion_cache().put(cache_key, completion)
+            return completion
 
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                return {"error": "Invalid JSON in response"}
-            except (IndexError, AttributeError):
-                return {"error": "Unexpected response format"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def get_completion_async(self, client: AsyncAnthropic, messages: List[Dict[str, Any]],
+                                   semaphore: Optional[asyncio.Semaphore] = None,
+                                   refresh: bool = False) -> Dict[str, Any]:
+        """
+        Async version of get_completion.
+
+        Args:
+            client (AsyncAnthropic): Async API client
+            messages (list): Array of message objects
+            semaphore (asyncio.Semaphore): Limits the number of in-flight requests
+            refresh (bool): Skip the cache lookup and store the fresh response
+
+        Returns:
+            dict: Parsed JSON response from Claude
+        """
+        try:
+            cache_key, cached = self._cached_completion(messages, refresh)
+            if cached is not None:
+                return cached
+
+            if semaphore is None:
+                response = await client.messages.create(
+                    model=self.MODEL_NAME, max_tokens=self.MAX_TOKENS, messages=messages
+                )
+            else:
+                async with semaphore:
+                    response = await client.messages.create(
+                        model=self.MODEL_NAME, max_tokens=self.MAX_TOKENS, messages=messages
+                    )
+            completion = self._parse_completion(response)
+            self.get_completion_cache().put(cache_key, completion)
+            return completion
 
         except Exception as e:
             return {"error": str(e)}
@@ -72,10 +194,49 @@ class ClaudeAI:
                 - paper_image_urls: List of image URLs from the paper
         """
         # Get paper info
-        part1_prompt = self.part1_create_paper_info_json_from_pdf_text_content_prompt()
-        part1_messages = self.part1_create_messages_for_paper_info_json(full_text, part1_prompt)
-        paper_info = self.get_completion(part1_messages)
+        paper_info = self.get_completion(self.create_paper_info_messages(full_text))
+        return self.build_paper_diatoms_data(paper_info, extracted_images_file_metadata)
+
+    @classmethod
+    def create_paper_info_messages(cls, full_text: str) -> List[Dict[str, Any]]:
+        """
+        Create the paper info request messages for a paper's full text.
+
+        Args:
+            full_text (str): The complete text content of the paper
+
+        Returns:
+            list: Array of message objects for the API request
+        """
+        part1_prompt = cls.part1_create_paper_info_json_from_pdf_text_content_prompt()
+        return cls.part1_create_messages_for_paper_info_json(full_text, part1_prompt)
+
+    @classmethod
+    def create_citation_messages(cls, first_two_pages_text: str) -> List[Dict[str, Any]]:
+        """
+        Create the citation request messages for the first two pages of a paper.
+
+        Args:
+            first_two_pages_text (str): Text content from first two pages of PDF
+
+        Returns:
+            list: Array of message objects for the API request
+        """
+        prompt = cls.part0_get_citation_info_for_paper()
+        return cls.part1_create_messages_for_paper_info_json(first_two_pages_text, prompt)
+
+    def build_paper_diatoms_data(self, paper_info: Dict[str, Any],
+                                 extracted_images_file_metadata: Dict) -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+        """
+        Build the diatoms data for a paper from its extracted paper info.
         
+        Args:
+            paper_info (Dict): Paper info returned by Claude
+            extracted_images_file_metadata (Dict): Metadata containing extracted image information
+            
+        Returns:
+            tuple: (paper_info, paper_diatoms_data, paper_image_urls), see process_paper
+        """
         if not paper_info or "error" in paper_info:
             logger.error("Failed to extract paper info")
             return {}, {}, []
@@ -133,6 +294,132 @@ class ClaudeAI:
             
         return paper_info, paper_diatoms_data, paper_image_urls
 
+    async def process_paper_async(self, client: AsyncAnthropic, full_text: str,
+                                  extracted_images_file_metadata: Dict,
+                                  first_two_pages_text: str = "",
+                                  citation_method: str = "default_citation",
+                                  semaphore: Optional[asyncio.Semaphore] = None
+                                  ) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], Dict[str, Any]]:
+        """
+        Async version of process_paper that also extracts the citation.
+        
+        The paper info and citation prompts are sent concurrently.
+        
+        Args:
+            client (AsyncAnthropic): Async API client
+            full_text (str): The complete text content of the paper
+            extracted_images_file_metadata (Dict): Metadata containing extracted image information
+            first_two_pages_text (str): Text content from first two pages of PDF
+            citation_method (str): "default_citation" or "citation_from_llm"
+            semaphore (asyncio.Semaphore): Limits the number of in-flight requests
+            
+        Returns:
+            tuple: (paper_info, paper_diatoms_data, paper_image_urls, citation_info)
+        """
+        paper_info_request = self.get_completion_async(client, self.create_paper_info_messages(full_text), semaphore)
+        if citation_method == "citation_from_llm":
+            citation_request = self.get_completion_async(
+                client, self.create_citation_messages(first_two_pages_text), semaphore
+            )
+            paper_info, citation_info = await asyncio.gather(paper_info_request, citation_request)
+        else:
+            paper_info = await paper_info_request
+            citation_info = self.extract_citation(first_two_pages_text, method=citation_method)
+        
+        return (*self.build_paper_diatoms_data(paper_info, extracted_images_file_metadata), citation_info)
+
+    async def process_papers_async(self, papers: List[Dict[str, Any]],
+                                   citation_method: str = "default_citation"
+                                   ) -> List[Tuple[Dict[str, Any], Dict[str, Any], List[str], Dict[str, Any]]]:
+        """
+        Process several papers concurrently, with at most MAX_CONCURRENT_REQUESTS requests in flight.
+        
+        Args:
+            papers (list): Dicts with full_text, first_two_pages_text and extracted_images_file_metadata
+            citation_method (str): "default_citation" or "citation_from_llm"
+            
+        Returns:
+            list: process_paper_async results, in input order
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        async with self.create_async_client() as client:
+            return await asyncio.gather(*[
+                self.process_paper_async(
+                    client,
+                    paper['full_text'],
+                    paper['extracted_images_file_metadata'],
+                    paper.get('first_two_pages_text', ''),
+                    citation_method,
+                    semaphore
+                )
+                for paper in papers
+            ])
+
+    def process_papers_with_message_batches(self, papers: List[Dict[str, Any]],
+                                            citation_method: str = "default_citation",
+                                            poll_interval: float = 30.0
+                                            ) -> List[Tuple[Dict[str, Any], Dict[str, Any], List[str], Dict[str, Any]]]:
+        """
+        Process papers through the Message Batches API and wait for the batch to end.
+        
+        Batches are processed asynchronously by the API at a lower cost, which
+        suits large ingest runs that do not need results right away.
+        
+        Args:
+            papers (list): Dicts with full_text, first_two_pages_text and extracted_images_file_metadata
+            citation_method (str): "default_citation" or "citation_from_llm"
+            poll_interval (float): Seconds between batch status checks
+            
+        Returns:
+            list: Same results as process_papers_async, in input order
+        """
+        # Message Batches moved out of beta after anthropic 0.40
+        batches = getattr(self.client.messages, 'batches', None) or self.client.beta.messages.batches
+        
+        requests_by_id = {}
+        for paper_index, paper in enumerate(papers):
+            requests_by_id[f"paper-{paper_index}-info"] = self.create_paper_info_messages(paper['full_text'])
+            if citation_method == "citation_from_llm":
+                requests_by_id[f"paper-{paper_index}-citation"] = self.create_citation_messages(
+                    paper.get('first_two_pages_text', '')
+                )
+        
+        completions: Dict[str, Dict[str, Any]] = {}
+        try:
+            batch = batches.create(requests=[
+                {
+                    "custom_id": custom_id,
+                    "params": {"model": self.MODEL_NAME, "max_tokens": self.MAX_TOKENS, "messages": messages}
+                }
+                for custom_id, messages in requests_by_id.items()
+            ])
+            logger.info(f"Submitted message batch {batch.id} with {len(requests_by_id)} requests")
+            
+            while batch.processing_status != "ended":
+                time.sleep(poll_interval)
+                batch = batches.retrieve(batch.id)
+            
+            for entry in batches.results(batch.id):
+                if entry.result.type == "succeeded":
+                    completions[entry.custom_id] = self._parse_completion(entry.result.message)
+                else:
+                    completions[entry.custom_id] = {"error": f"Batch request {entry.result.type}"}
+        except Exception as e:
+            logger.error(f"Error processing message batch: {str(e)}")
+        
+        results = []
+        for paper_index, paper in enumerate(papers):
+            paper_info = completions.get(f"paper-{paper_index}-info", {"error": "Missing batch result"})
+            if citation_method == "citation_from_llm":
+                citation_info = completions.get(f"paper-{paper_index}-citation", {"error": "Missing batch result"})
+            else:
+                citation_info = self.extract_citation(paper.get('first_two_pages_text', ''), method=citation_method)
+            results.append((
+                *self.build_paper_diatoms_data(paper_info, paper['extracted_images_file_metadata']),
+                citation_info
+            ))
+        return results
+
     def get_storage_client(self):
         """
         Get authenticated Google Cloud Storage client.
@@ -567,14 +854,8 @@ class ClaudeAI:
             # Since this is a static method, we need to instantiate ClaudeAI
             claude_instance = ClaudeAI()
             
-            # Get the citation extraction prompt
-            prompt = ClaudeAI.part0_get_citation_info_for_paper()
-            
             # Create messages for the API request
-            messages = ClaudeAI.part1_create_messages_for_paper_info_json(
-                first_two_pages_text, 
-                prompt
-            )
+            messages = ClaudeAI.create_citation_messages(first_two_pages_text)
             
             try:
                 # Get completion from Claude API using the instance method
@@ -681,5 +962,51 @@ class ClaudeAI:
         except Exception as e:
             logger.error(f"Error updating and saving papers: {str(e)}")
             return False
+
+
+class AsyncClaudeRunner:
+    """
+    Runs ClaudeAI coroutines on one background event loop.
     
-    
+    Ingest worker threads submit papers with process_paper(); the requests of
+    all papers share one async client and one semaphore, so the number of
+    in-flight Claude requests is capped across the whole ingest run.
+    """
+
+    def __init__(self, claude: Optional[ClaudeAI] = None, max_concurrent_requests: Optional[int] = None):
+        self.claude = claude or ClaudeAI()
+        self.max_concurrent_requests = max_concurrent_requests or self.claude.MAX_CONCURRENT_REQUESTS
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='claude-async-loop', daemon=True)
+        self._thread.start()
+        self._client, self._semaphore = asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self) -> Tuple[AsyncAnthropic, asyncio.Semaphore]:
+        # Both must be created on the loop that uses them
+        return self.claude.create_async_client(), asyncio.Semaphore(self.max_concurrent_requests)
+
+    def process_paper(self, full_text: str, extracted_images_file_metadata: Dict,
+                      first_two_pages_text: str = "", citation_method: str = "default_citation"
+                      ) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], Dict[str, Any]]:
+        """
+        Run process_paper_async on the background loop and block until it finishes.
+
+        Returns:
+            tuple: (paper_info, paper_diatoms_data, paper_image_urls, citation_info)
+        """
+        coroutine = self.claude.process_paper_async(
+            self._client, full_text, extracted_images_file_metadata,
+            first_two_pages_text, citation_method, self._semaphore
+        )
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self) -> None:
+        """Close the async client and stop the background loop."""
+        if not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.error(f"Error closing async Claude client: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
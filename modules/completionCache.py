@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """
+    Cache of Claude responses keyed by the request payload.
+
+    Lookups check an in-memory LRU first and then a SQLite file, so repeated
+    prompts (reprocessed papers, the same diatom list request for an image)
+    are answered without calling the API, including after a restart. Only
+    successful responses are stored.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_memory_entries: int = 256,
+                 ttl_seconds: Optional[float] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path (str): SQLite file for the persistent tier; None keeps the cache in memory only
+            max_memory_entries (int): Number of responses held in the in-memory LRU
+            ttl_seconds (float): Maximum age of a persisted response; None keeps them forever
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        # Responses are held as JSON text so callers can never mutate a cached entry
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0}
+
+        if self.db_path:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connection() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so keep one per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Expand plain string content into text blocks so equivalent payloads hash the same."""
+        normalized = []
+        for message in messages:
+            content = message.get('content')
+            if isinstance(content, str):
+                content = [{'type': 'text', 'text': content}]
+            normalized.append(dict(message, content=content))
+        return normalized
+
+    @classmethod
+    def make_key(cls, model: str, max_tokens: int, messages: List[Dict[str, Any]]) -> str:
+        """
+        Hash a request payload into a cache key.
+
+        Args:
+            model (str): Model name
+            max_tokens (int): Maximum tokens requested
+            messages (list): Array of message objects
+
+        Returns:
+            str: SHA-256 hex digest of the normalized payload
+        """
+        payload = json.dumps(
+            {'model': model, 'max_tokens': max_tokens, 'messages': cls._normalize_messages(messages)},
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, response: str) -> None:
+        with self._lock:
+            self._memory[key] = response
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+
+        Returns:
+            Optional[Dict[str, Any]]: Cached response, or None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return json.loads(self._memory[key])
+
+        if self.db_path:
+            try:
+                row = self._connection().execute(
+                    "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row and (not self.ttl_seconds or time.time() - row[1] <= self.ttl_seconds):
+                    self._remember(key, row[0])
+                    with self._lock:
+                        self.stats['disk_hits'] += 1
+                    return json.loads(row[0])
+            except Exception as e:
+                logger.error(f"Error reading completion cache entry {key}: {str(e)}")
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        """Store a successful response in both tiers."""
+        if not isinstance(response, dict) or 'error' in response:
+            return
+        response_json = json.dumps(response)
+        self._remember(key, response_json)
+        with self._lock:
+            self.stats['stores'] += 1
+        if self.db_path:
+            try:
+                with self._connection() as connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO completions (key, response, created_at) VALUES (?, ?, ?)",
+                        (key, response_json, time.time())
+                    )
+            except Exception as e:
+                logger.error(f"Error writing completion cache entry {key}: {str(e)}")
+
+    def record_bypass(self) -> None:
+        """Count a lookup that was skipped for a forced refresh."""
+        with self._lock:
+            self.stats['bypassed'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the in-memory size."""
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['disk_hits']
+            return dict(
+                self.stats,
+                memory_entries=len(self._memory),
+                hit_rate=round(hits / lookups, 3) if lookups else 0.0
+            )
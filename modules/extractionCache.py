@@ -0,0 +1,170 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class LocalDiskCacheBackend:
+    """
+    Local disk tier of the extraction cache.
+
+    Entries are gzipped JSON files. A hit refreshes the file's mtime, so the
+    oldest mtime is the least recently used entry; entries older than the TTL
+    are dropped on read and entries beyond max_entries/max_bytes are evicted
+    LRU-first on write.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 500,
+                 max_bytes: int = 1024 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if self.ttl_seconds and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                # mtime is the last access, so this entry has not been used within the TTL
+                os.remove(path)
+                return None
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path, None)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading extraction cache entry {key}: {str(e)}")
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._path(key)
+        temp_path = f"{path}.tmp"
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+            self._evict()
+        except Exception as e:
+            logger.error(f"Error writing extraction cache entry {key}: {str(e)}")
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                except FileNotFoundError:
+                    pass
+
+
+class GCSCacheBackend:
+    """
+    GCS tier of the extraction cache, shared by all instances.
+    """
+
+    def __init__(self, storage_client, bucket_name: str, prefix: str = 'extraction_cache'):
+        self.storage_client = storage_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _blob(self, key: str):
+        return self.storage_client.bucket(self.bucket_name).blob(f"{self.prefix}/{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            blob = self._blob(key)
+            if not blob.exists():
+                return None
+            return json.loads(gzip.decompress(blob.download_as_bytes()).decode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error reading GCS extraction cache entry {key}: {str(e)}")
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        try:
+            self._blob(key).upload_from_string(
+                gzip.compress(json.dumps(entry).encode('utf-8')),
+                content_type='application/gzip'
+            )
+        except Exception as e:
+            logger.error(f"Error writing GCS extraction cache entry {key}: {str(e)}")
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of PDF extraction results.
+
+    Entries are keyed by the PDF's file_256_hash and the Claude prompt version,
+    and hold the extracted text, the uploaded image manifest, the process_paper
+    output and the citation, so an unchanged PDF can go straight to the merge
+    step. Backends are checked in order and a hit is copied into the faster
+    tiers in front of it.
+    """
+
+    def __init__(self, backends: List[Any], prompt_version: str):
+        self.backends = backends
+        self.prompt_version = prompt_version
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def make_key(self, file_256_hash: str) -> str:
+        return f"{file_256_hash}-v{self.prompt_version}"
+
+    def get(self, file_256_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the extraction result for a PDF hash.
+
+        Returns:
+            Optional[Dict[str, Any]]: Cached entry, or None on a miss
+        """
+        if not file_256_hash:
+            return None
+        key = self.make_key(file_256_hash)
+        for tier, backend in enumerate(self.backends):
+            entry = backend.get(key)
+            if entry is not None:
+                for faster_backend in self.backends[:tier]:
+                    faster_backend.put(key, entry)
+                self.stats['hits'] += 1
+                return entry
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, file_256_hash: str, entry: Dict[str, Any]) -> None:
+        """Store the extraction result for a PDF hash in every tier."""
+        if not file_256_hash:
+            return
+        key = self.make_key(file_256_hash)
+        entry = dict(entry, file_256_hash=file_256_hash, prompt_version=self.prompt_version, cached_at=time.time())
+        for backend in self.backends:
+            backend.put(key, entry)
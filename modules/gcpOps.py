@@ -1,12 +1,22 @@
 import os
+import gzip
 import json
+import time
 import logging
 from google.cloud import storage
+from google.api_core import exceptions as gcs_exceptions
 from dotenv import load_dotenv
-import pandas as pd
 import requests
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Tuple, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import tempfile
+from .paperStore import PaperStore
+from .segmentationContainer import SegmentationContainer
+from .segmentationCache import SegmentationCache
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +26,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class GCPOps:
+    # Attempts per paper shard download before loading the papers fails
+    SHARD_LOAD_ATTEMPTS = 3
+    SHARD_LOAD_BACKOFF_SECONDS = 0.5
+
     def __init__(self):
         # Load environment variables from .env file
         load_dotenv()
@@ -29,6 +43,9 @@ class GCPOps:
         except Exception as e:
             logger.error(f"Failed to initialize GCP storage client: {str(e)}")
             raise
+        
+        # Segmentation files and containers by URL, revalidated against their GCS generation
+        self.segmentation_cache = SegmentationCache()
 
     def save_file_to_bucket(self, artifact_url: str, session_id: str, bucket_name: str, 
                           subdir: str = "papers", 
@@ -68,7 +85,7 @@ class GCPOps:
             logger.error(f"Error saving file to bucket: {str(e)}")
             return None
 
-    def save_tracker_csv(self, df: pd.DataFrame, session_id: str, bucket_name: str) -> Optional[str]:
+    def save_tracker_csv(self, df: 'pd.DataFrame', session_id: str, bucket_name: str) -> Optional[str]:
         """
         Save a pandas DataFrame as a CSV to the specified GCS bucket.
         """
@@ -97,10 +114,13 @@ class GCPOps:
             logger.error(f"Error saving tracker CSV: {str(e)}")
             return None
 
-    def initialize_paper_upload_tracker_df_from_gcp(self, session_id: str, bucket_name: str) -> pd.DataFrame:
+    def initialize_paper_upload_tracker_df_from_gcp(self, session_id: str, bucket_name: str) -> 'pd.DataFrame':
         """
         Initialize a pandas DataFrame from a CSV file stored in GCS.
         """
+        # pandas is only needed here, so it is imported on first use
+        import pandas as pd
+
         try:
             # Construct the GCS URL
             gcs_url = f"https://storage.googleapis.com/{bucket_name}/{session_id}/papers/csv/{session_id}.csv"
@@ -239,6 +259,222 @@ class GCPOps:
             logger.error(f"Error saving paper JSON files: {str(e)}")
             return ""
 
+    @staticmethod
+    def get_paper_shards_base_url(papers_json_public_url: str) -> str:
+        """
+        Get the base URL of the per-paper shard layout for a legacy papers JSON URL.
+
+        The legacy file .../jsons_from_pdfs/{SESSION_ID}/{SESSION_ID}.json maps to
+        .../jsons_from_pdfs/{SESSION_ID}/papers, which holds one {key}.json per paper
+        plus a manifest.json listing the keys in order.
+        """
+        return f"{papers_json_public_url.rsplit('/', 1)[0]}/papers"
+
+    def _get_blob_from_url(self, public_url: str):
+        bucket_name = public_url.split('/')[3]
+        blob_path = '/'.join(public_url.split('/')[4:])
+        return self.storage_client.bucket(bucket_name).blob(blob_path)
+
+    def save_paper_shard(self, shards_base_url: str, paper_key: str,
+                         paper: Dict[str, Any]) -> Optional[str]:
+        """
+        Save a single paper JSON object as its own shard in GCS.
+
+        Args:
+            shards_base_url: Base URL of the shard layout
+            paper_key: Storage key of the paper (its file_256_hash)
+            paper: Paper JSON object
+
+        Returns:
+            Optional[str]: Public URL of the shard, or None if error
+        """
+        try:
+            shard_url = f"{shards_base_url}/{paper_key}.json"
+            blob = self._get_blob_from_url(shard_url)
+            blob.upload_from_string(json.dumps(paper), content_type='application/json')
+            return shard_url
+        except Exception as e:
+            logger.error(f"Error saving paper shard {paper_key}: {str(e)}")
+            return None
+
+    def save_papers_manifest(self, shards_base_url: str, paper_keys: List[str]) -> Optional[str]:
+        """
+        Save the manifest listing all paper shard keys in order.
+
+        Args:
+            shards_base_url: Base URL of the shard layout
+            paper_keys: Storage keys of all papers, in PAPER_JSON_FILES order
+
+        Returns:
+            Optional[str]: Public URL of the manifest, or None if error
+        """
+        try:
+            manifest_url = f"{shards_base_url}/manifest.json"
+            manifest = {
+                'version': 1,
+                'updated': datetime.now().isoformat(),
+                'paper_keys': list(paper_keys)
+            }
+            blob = self._get_blob_from_url(manifest_url)
+            blob.upload_from_string(json.dumps(manifest, indent=2), content_type='application/json')
+            logger.info(f"Saved papers manifest with {len(paper_keys)} entries")
+            return manifest_url
+        except Exception as e:
+            logger.error(f"Error saving papers manifest: {str(e)}")
+            return None
+
+    def load_papers_manifest(self, shards_base_url: str) -> Optional[List[str]]:
+        """
+        Load the list of paper shard keys from the manifest.
+
+        Returns:
+            Optional[List[str]]: Paper keys, or None if no manifest exists
+
+        Raises:
+            Exception: If the manifest exists but cannot be read; treating that as a
+                missing manifest would re-migrate the legacy file over newer shards
+        """
+        try:
+            blob = self._get_blob_from_url(f"{shards_base_url}/manifest.json")
+            if not blob.exists():
+                return None
+            return json.loads(blob.download_as_string()).get('paper_keys', [])
+        except gcs_exceptions.NotFound:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading papers manifest: {str(e)}")
+            raise
+
+    def load_paper_shard(self, shards_base_url: str, paper_key: str) -> Dict[str, Any]:
+        """
+        Load a single paper shard from GCS, retrying failed downloads.
+
+        Returns:
+            Dict[str, Any]: Paper JSON object
+
+        Raises:
+            Exception: If the shard is missing or still fails after SHARD_LOAD_ATTEMPTS
+        """
+        for attempt in range(1, self.SHARD_LOAD_ATTEMPTS + 1):
+            try:
+                blob = self._get_blob_from_url(f"{shards_base_url}/{paper_key}.json")
+                return json.loads(blob.download_as_string())
+            except gcs_exceptions.NotFound:
+                logger.error(f"Paper shard {paper_key} is listed in the manifest but missing")
+                raise
+            except Exception as e:
+                if attempt == self.SHARD_LOAD_ATTEMPTS:
+                    logger.error(f"Error loading paper shard {paper_key} after {attempt} attempts: {str(e)}")
+                    raise
+                time.sleep(self.SHARD_LOAD_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+    def save_paper_text(self, shards_base_url: str, paper_key: str,
+                        texts: Dict[str, str]) -> Optional[str]:
+        """
+        Save a paper's large text fields as a gzipped JSON blob beside its shard.
+
+        Args:
+            shards_base_url: Base URL of the shard layout
+            paper_key: Storage key of the paper (its file_256_hash)
+            texts: Text fields of the paper, e.g. pdf_text_content and first_two_pages_text
+
+        Returns:
+            Optional[str]: Public URL of the text blob, or None if error
+        """
+        try:
+            text_url = f"{shards_base_url}/text/{paper_key}.json.gz"
+            blob = self._get_blob_from_url(text_url)
+            blob.upload_from_string(gzip.compress(json.dumps(texts).encode('utf-8')), content_type='application/gzip')
+            return text_url
+        except Exception as e:
+            logger.error(f"Error saving paper text {paper_key}: {str(e)}")
+            return None
+
+    def load_paper_text(self, shards_base_url: str, paper_key: str) -> Optional[Dict[str, str]]:
+        """
+        Load a paper's large text fields.
+
+        Returns:
+            Optional[Dict[str, str]]: Text fields, or None if missing or on error
+        """
+        try:
+            blob = self._get_blob_from_url(f"{shards_base_url}/text/{paper_key}.json.gz")
+            return json.loads(gzip.decompress(blob.download_as_bytes()).decode('utf-8'))
+        except gcs_exceptions.NotFound:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading paper text {paper_key}: {str(e)}")
+            return None
+
+    def load_sharded_paper_json_files(self, shards_base_url: str, papers_json_public_url: str,
+                                      max_workers: int = 16) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Load all papers from the shard layout, migrating from the legacy single file if needed.
+
+        Args:
+            shards_base_url: Base URL of the shard layout
+            papers_json_public_url: Public URL of the legacy {SESSION_ID}.json file
+            max_workers: Number of concurrent shard downloads
+
+        Returns:
+            Tuple[List[Dict[str, Any]], List[str]]: Papers and their storage keys, in order
+
+        Raises:
+            Exception: If the manifest or one of its shards cannot be loaded; returning
+                a partial list would drop the missing papers from the next manifest.
+                Also raised if the migration could not save every shard and the manifest.
+        """
+        paper_keys = self.load_papers_manifest(shards_base_url)
+
+        if paper_keys is None:
+            # No shards yet: read the legacy file once and split it into shards
+            papers = self.load_paper_json_files(papers_json_public_url)
+            if papers:
+                migrated = PaperStore(papers)
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    shard_urls = list(executor.map(
+                        lambda item: self.save_paper_shard(shards_base_url, item[0], item[1]),
+                        zip(migrated.paper_keys, migrated.papers)
+                    ))
+                # Without a manifest the next load migrates again from the legacy file
+                failed = [key for key, url in zip(migrated.paper_keys, shard_urls) if not url]
+                if failed:
+                    raise RuntimeError(f"Failed to save {len(failed)} paper shards during migration; not writing the manifest")
+                if not self.save_papers_manifest(shards_base_url, migrated.paper_keys):
+                    raise RuntimeError("Failed to save the papers manifest during migration")
+                logger.info(f"Migrated {len(papers)} papers to shard layout at {shards_base_url}")
+                return migrated.papers, migrated.paper_keys
+            return [], []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            papers = list(executor.map(lambda key: self.load_paper_shard(shards_base_url, key), paper_keys))
+        logger.info(f"Loaded {len(papers)} paper shards from GCS")
+        return papers, list(paper_keys)
+
+    def compact_paper_shards(self, shards_base_url: str, papers_json_public_url: str) -> str:
+        """
+        Rebuild the legacy single-file {SESSION_ID}.json from the paper shards for export.
+
+        Text fields kept in separate blobs are inlined again, so the export has the
+        same shape as before they were split out.
+
+        Returns:
+            str: Public URL of the legacy file, or empty string on error
+
+        Raises:
+            Exception: If the manifest or a shard cannot be loaded
+        """
+        papers, paper_keys = self.load_sharded_paper_json_files(shards_base_url, papers_json_public_url)
+        if not papers:
+            logger.warning("No paper shards found to compact")
+            return ""
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            texts = list(executor.map(lambda key: self.load_paper_text(shards_base_url, key), paper_keys))
+        for paper, paper_texts in zip(papers, texts):
+            for field, value in (paper_texts or {}).items():
+                paper.setdefault(field, value)
+        return self.save_paper_json_files(papers_json_public_url, papers)
+
     def save_json_to_bucket(self, local_file_path: str, bucket_name: str, 
                           session_id: str) -> Optional[str]:
         """
@@ -443,6 +679,9 @@ class GCPOps:
                 public_url = f"https://storage.googleapis.com/{bucket_name}/{blob_name}"
                 logger.info(f"Saved segmentation data to {public_url}")
                 
+                # Write through so the next read only needs to revalidate
+                self.segmentation_cache.put(public_url, blob.generation, segmentation_data)
+                
                 return public_url
                 
             finally:
@@ -454,9 +693,43 @@ class GCPOps:
             logger.error(f"Error saving segmentation data: {str(e)}")
             return None
             
+    def _load_cached_blob(self, url: str, parse):
+        """
+        Download a blob through the segmentation cache.
+        
+        A cached copy is revalidated with if_generation_not_match, so an unchanged
+        blob answers 304 without a body; a missing blob raises NotFound.
+        
+        Args:
+            url: Public URL of the blob
+            parse: Turns the downloaded bytes into the cached value
+            
+        Returns:
+            The cached or freshly parsed value
+        """
+        blob = self._get_blob_from_url(url)
+        cached = self.segmentation_cache.get(url)
+        if cached is not None:
+            generation, value = cached
+            try:
+                data = blob.download_as_bytes(if_generation_not_match=generation)
+            except gcs_exceptions.NotModified:
+                self.segmentation_cache.record('hits')
+                return value
+            except gcs_exceptions.NotFound:
+                self.segmentation_cache.invalidate(url)
+                raise
+        else:
+            data = blob.download_as_bytes()
+        
+        self.segmentation_cache.record('misses')
+        value = parse(data)
+        self.segmentation_cache.put(url, blob.generation, value)
+        return value
+
     def load_segmentation_data(self, segmentation_url: str) -> Optional[str]:
         """
-        Load segmentation data from GCS.
+        Load segmentation data from GCS, revalidating the cached copy if there is one.
         
         Args:
             segmentation_url: Public URL of the segmentation file
@@ -465,21 +738,73 @@ class GCPOps:
             Optional[str]: Content of the segmentation file, or None if error
         """
         try:
-            bucket_name = segmentation_url.split('/')[3]
-            blob_path = '/'.join(segmentation_url.split('/')[4:])
-            
-            bucket = self.storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_path)
-            
-            if blob.exists():
-                return blob.download_as_string().decode('utf-8')
-            else:
-                logger.warning(f"No segmentation file found at {segmentation_url}")
-                return None
+            return self._load_cached_blob(segmentation_url, lambda data: data.decode('utf-8'))
                 
+        except gcs_exceptions.NotFound:
+            logger.warning(f"No segmentation file found at {segmentation_url}")
+            return None
         except Exception as e:
             logger.error(f"Error loading segmentation data: {str(e)}")
             return None
+
+    @staticmethod
+    def get_segmentation_container_url(segmentation_url: str) -> str:
+        """
+        Get the URL of the binary container stored next to a segmentation text file.
+        
+        Args:
+            segmentation_url: Public URL of the .txt segmentation file
+            
+        Returns:
+            str: Public URL of the matching .seg container
+        """
+        base_url = segmentation_url[:-len('.txt')] if segmentation_url.endswith('.txt') else segmentation_url
+        return f"{base_url}.seg"
+
+    def save_segmentation_container(self, container: SegmentationContainer,
+                                    segmentation_url: str) -> Optional[str]:
+        """
+        Save a binary segmentation container next to its segmentation text file.
+        
+        Args:
+            container: Packed segmentations
+            segmentation_url: Public URL of the .txt segmentation file
+            
+        Returns:
+            Optional[str]: Public URL of the saved container, or None if error
+        """
+        try:
+            container_url = self.get_segmentation_container_url(segmentation_url)
+            blob = self._get_blob_from_url(container_url)
+            container_bytes = container.to_bytes()
+            blob.upload_from_string(container_bytes, content_type='application/octet-stream')
+            logger.info(f"Saved segmentation container to {container_url}")
+            # Cache a read-only copy so the next read only needs to revalidate
+            self.segmentation_cache.put(container_url, blob.generation, SegmentationContainer.from_bytes(container_bytes))
+            return container_url
+        except Exception as e:
+            logger.error(f"Error saving segmentation container: {str(e)}")
+            return None
+
+    def load_segmentation_container(self, container_url: str) -> Optional[SegmentationContainer]:
+        """
+        Load a binary segmentation container; its arrays are read-only views over the
+        downloaded bytes, so a cached container is shared between callers.
+        
+        Args:
+            container_url: Public URL of the .seg container
+            
+        Returns:
+            Optional[SegmentationContainer]: The container, or None if missing or invalid
+        """
+        try:
+            return self._load_cached_blob(container_url, SegmentationContainer.from_bytes)
+        except gcs_exceptions.NotFound:
+            logger.warning(f"No segmentation container found at {container_url}")
+            return None
+        except Exception as e:
+            logger.error(f"Error loading segmentation container: {str(e)}")
+            return None
         
     def get_segmentation_data(self, filename, bucket_name):
         """Get segmentation data from GCS bucket"""
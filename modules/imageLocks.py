@@ -0,0 +1,208 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class LockStats:
+    """Acquisition, contention and wait-time counters of one lock."""
+
+    __slots__ = ('acquisitions', 'contended', 'wait_seconds', 'max_wait_seconds')
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited: float, contended: bool) -> None:
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'contention_rate': round(self.contended / self.acquisitions, 3) if self.acquisitions else 0.0,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'max_wait_seconds': round(self.max_wait_seconds, 3),
+        }
+
+
+class ReadWriteLock:
+    """
+    Writer-preferring reader-writer lock.
+
+    Any number of threads may hold the read side at once; the write side is
+    exclusive. Waiting writers block new readers so whole-dataset operations
+    are not starved, except that a thread already holding the read side may
+    take it again.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writers_waiting = 0
+        self._local = threading.local()
+        self.read_stats = LockStats()
+        self.write_stats = LockStats()
+
+    def acquire_read(self) -> None:
+        held = getattr(self._local, 'reads', 0)
+        start = time.perf_counter()
+        with self._condition:
+            contended = False
+            while self._writer is not None and self._writer != threading.get_ident() or \
+                    (self._writers_waiting and not held and self._writer is None):
+                contended = True
+                self._condition.wait()
+            self._readers += 1
+            self.read_stats.record(time.perf_counter() - start, contended)
+        self._local.reads = held + 1
+
+    def release_read(self) -> None:
+        self._local.reads -= 1
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        if getattr(self._local, 'reads', 0):
+            raise RuntimeError("Cannot take the write lock while holding the read lock")
+        start = time.perf_counter()
+        with self._condition:
+            if self._writer == threading.get_ident():
+                self._local.writes += 1
+                self.write_stats.record(0.0, False)
+                return
+            contended = False
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    contended = True
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = threading.get_ident()
+            self.write_stats.record(time.perf_counter() - start, contended)
+        self._local.writes = 1
+
+    def release_write(self) -> None:
+        with self._condition:
+            self._local.writes -= 1
+            if self._local.writes == 0:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ImageLocks:
+    """
+    Concurrency control for DIATOMS_DATA / PAPER_JSON_FILES.
+
+    Routes that read or modify one image take image(index): the shared side of
+    a dataset reader-writer lock plus one of a fixed set of striped re-entrant
+    locks chosen by the image index, so annotators working on different images
+    proceed in parallel while edits to the same image are serialized.
+    Operations on the whole dataset (loading, appending papers, syncing other
+    workers' changes, bulk alignment commits) take dataset(), which waits for
+    every image lock to be released.
+    """
+
+    STRIPES = int(os.getenv('IMAGE_LOCK_STRIPES', '64'))
+
+    def __init__(self, stripes: int = None):
+        """
+        Args:
+            stripes (int): Number of striped image locks; defaults to IMAGE_LOCK_STRIPES
+        """
+        self.stripes = max(1, stripes or self.STRIPES)
+        self._dataset = ReadWriteLock()
+        self._locks = [threading.RLock() for _ in range(self.stripes)]
+        self._stats = [LockStats() for _ in range(self.stripes)]
+        self._stats_lock = threading.Lock()
+
+    def stripe_of(self, image_index: int) -> int:
+        """Stripe guarding an image."""
+        try:
+            return int(image_index) % self.stripes
+        except (TypeError, ValueError):
+            return 0
+
+    @contextmanager
+    def image(self, image_index: int) -> Iterator[None]:
+        """Hold an image for reading or modification."""
+        stripe = self.stripe_of(image_index)
+        lock = self._locks[stripe]
+        with self._dataset.read():
+            start = time.perf_counter()
+            contended = not lock.acquire(blocking=False)
+            if contended:
+                lock.acquire()
+            try:
+                with self._stats_lock:
+                    self._stats[stripe].record(time.perf_counter() - start, contended)
+                yield
+            finally:
+                lock.release()
+
+    @contextmanager
+    def dataset(self) -> Iterator[None]:
+        """Hold the whole dataset exclusively."""
+        with self._dataset.write():
+            yield
+
+    def get_stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Return contention metrics for the dataset lock and the image stripes.
+
+        Args:
+            top (int): Number of most contended stripes to list individually
+        """
+        with self._stats_lock:
+            stripes: List[Dict[str, Any]] = [
+                dict(stats.to_dict(), stripe=stripe)
+                for stripe, stats in enumerate(self._stats) if stats.acquisitions
+            ]
+        stripes.sort(key=lambda stats: (stats['contended'], stats['wait_seconds']), reverse=True)
+        totals = LockStats()
+        for stats in self._stats:
+            totals.acquisitions += stats.acquisitions
+            totals.contended += stats.contended
+            totals.wait_seconds += stats.wait_seconds
+            totals.max_wait_seconds = max(totals.max_wait_seconds, stats.max_wait_seconds)
+        return {
+            'dataset_read': self._dataset.read_stats.to_dict(),
+            'dataset_write': self._dataset.write_stats.to_dict(),
+            'images': dict(totals.to_dict(), stripes=self.stripes),
+            'most_contended_stripes': stripes[:top],
+        }
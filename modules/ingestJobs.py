@@ -0,0 +1,311 @@
+import os
+import time
+import uuid
+import socket
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+from .sharedState import VersionConflictError
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class IngestJobRegistry:
+    """
+    Durable queue and progress of ingest runs, one job per /process_pdfs call.
+
+    Each job is a small summary record plus one compact record per document
+    (current stage, per-stage timings, attempts, error) in a state backend, so
+    any worker can answer a status poll. Every write carries the backend's
+    sequence number: a poll that passes back the cursor it last received
+    gets only the documents changed since. The heavy results of a document
+    (its texts and extracted JSON) are stored as a separate record that is
+    only read on demand.
+
+    With a persistent backend the registry is also the job queue: each
+    document's stage output is checkpointed as it completes, failed documents
+    are retried with exponential backoff, and the worker running a job holds
+    a lease on it that it renews while running. A job whose lease expired, or
+    whose owner process is gone, can be claimed by another worker and resumed
+    from the checkpoints.
+    """
+
+    JOBS_NAMESPACE = 'ingest_jobs'
+    DOCUMENTS_NAMESPACE = 'ingest_documents'
+    PAYLOADS_NAMESPACE = 'ingest_payloads'
+    CHECKPOINTS_NAMESPACE = 'ingest_checkpoints'
+    MAX_JOBS = int(os.getenv('INGEST_JOBS_KEPT', '20'))
+    MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '3'))
+    RETRY_BASE_SECONDS = float(os.getenv('INGEST_RETRY_BASE_SECONDS', '5'))
+    RETRY_MAX_SECONDS = 300.0
+    LEASE_SECONDS = float(os.getenv('INGEST_LEASE_SECONDS', '60'))
+
+    def __init__(self, backend, max_jobs: Optional[int] = None, max_attempts: Optional[int] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            backend: State backend shared by the workers
+            max_jobs (int): Number of finished jobs kept before the oldest are dropped
+            max_attempts (int): Attempts per document before it is marked failed
+        """
+        self.backend = backend
+        self.max_jobs = self.MAX_JOBS if max_jobs is None else max_jobs
+        self.max_attempts = self.MAX_ATTEMPTS if max_attempts is None else max_attempts
+        # Identifies this process as a job owner; the token tells a reused pid apart
+        self.owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'token': uuid.uuid4().hex[:8]}
+
+    @staticmethod
+    def _document_key(job_id: str, index: int) -> str:
+        return f"{job_id}/{index}"
+
+    def _modify(self, namespace: str, key: str, fn: Callable[[Dict[str, Any]], None],
+                attempts: int = 10) -> Optional[Dict[str, Any]]:
+        for _ in range(attempts):
+            record = self.backend.get(namespace, key)
+            if record is None:
+                return None
+            version, value = record[0], dict(record[1])
+            fn(value)
+            try:
+                self.backend.put(namespace, key, value, expected_version=version)
+                return value
+            except VersionConflictError:
+                continue
+        raise VersionConflictError(namespace, key, version, -1)
+
+    def create(self, urls: List[str]) -> str:
+        """
+        Register a new job with one queued document per URL.
+
+        Returns:
+            str: The job id
+        """
+        self._prune()
+        job_id = uuid.uuid4().hex[:12]
+        for index, url in enumerate(urls):
+            self.backend.put(self.DOCUMENTS_NAMESPACE, self._document_key(job_id, index), {
+                'index': index,
+                'url': url,
+                'filename': '',
+                'stage': '',
+                'state': 'queued',
+                'cached': False,
+                'timings': {},
+                'error': None,
+                'attempts': 0,
+                'next_attempt_at': None,
+                'has_payload': False,
+            })
+        self.backend.put(self.JOBS_NAMESPACE, job_id, {
+            'job_id': job_id,
+            'state': 'queued',
+            'total': len(urls),
+            'completed': 0,
+            'failed': 0,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            'owner': None,
+            'lease_until': None,
+        })
+        return job_id
+
+    def set_state(self, job_id: str, state: str, error: Optional[str] = None) -> None:
+        """Move a job to running, complete or failed."""
+        def apply(job):
+            job['state'] = state
+            if state == 'running':
+                job['started_at'] = job['started_at'] or time.time()
+            elif state in ('complete', 'failed'):
+                job['finished_at'] = time.time()
+                job['lease_until'] = None
+            if error:
+                job['error'] = error
+        self._modify(self.JOBS_NAMESPACE, job_id, apply)
+
+    def update_document(self, job_id: str, index: int, **fields) -> None:
+        """Update a document's stage, state, timings or filename."""
+        self._modify(self.DOCUMENTS_NAMESPACE, self._document_key(job_id, index),
+                     lambda document: document.update(fields))
+
+    def finish_document(self, job_id: str, index: int, error: Optional[str] = None, **fields) -> None:
+        """Mark a document done (or failed) and count it in the job summary."""
+        self.update_document(job_id, index, state='failed' if error else 'done', error=error, **fields)
+
+        def count(job):
+            job['failed' if error else 'completed'] += 1
+        self._modify(self.JOBS_NAMESPACE, job_id, count)
+
+    def record_failure(self, job_id: str, index: int, error: str, **fields) -> Optional[float]:
+        """
+        Count a failed attempt of a document and schedule its retry.
+
+        The n-th retry waits RETRY_BASE_SECONDS * 2 ** (n - 1), at most RETRY_MAX_SECONDS.
+        After max_attempts the document is marked failed for good.
+
+        Returns:
+            Optional[float]: Time of the next attempt, or None if the document failed for good
+        """
+        key = self._document_key(job_id, index)
+        record = self.backend.get(self.DOCUMENTS_NAMESPACE, key)
+        attempts = (record[1].get('attempts', 0) if record else 0) + 1
+        if attempts >= self.max_attempts:
+            self.finish_document(job_id, index, error=error, attempts=attempts, next_attempt_at=None, **fields)
+            return None
+        next_attempt_at = time.time() + min(self.RETRY_MAX_SECONDS, self.RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        self.update_document(job_id, index, state='retrying', error=error, attempts=attempts,
+                             next_attempt_at=next_attempt_at, **fields)
+        return next_attempt_at
+
+    def pending_documents(self, job_id: str) -> List[Dict[str, Any]]:
+        """Return the documents of a job that are neither done nor failed for good."""
+        job = self.get_job(job_id)
+        if job is None:
+            return []
+        documents = []
+        for index in range(job['total']):
+            record = self.backend.get(self.DOCUMENTS_NAMESPACE, self._document_key(job_id, index))
+            if record and record[1]['state'] not in ('done', 'failed'):
+                documents.append(record[1])
+        return documents
+
+    def save_checkpoint(self, job_id: str, index: int, **fields) -> None:
+        """
+        Record a document's progress so an interrupted job can resume after it.
+
+        Args:
+            job_id (str): Job id
+            index (int): Document index
+            **fields: Checkpoint fields to set, e.g. stage (the last completed stage),
+                context (that stage's output) or paper_key (the key it is merged under)
+        """
+        key = self._document_key(job_id, index)
+        record = self.backend.get(self.CHECKPOINTS_NAMESPACE, key)
+        checkpoint = dict(record[1]) if record else {}
+        checkpoint.update(fields)
+        # A document is only worked on by the job's owner, so there is no concurrent writer
+        self.backend.put(self.CHECKPOINTS_NAMESPACE, key, checkpoint)
+
+    def get_checkpoint(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        """Return a document's checkpoint, or None if no stage completed yet."""
+        record = self.backend.get(self.CHECKPOINTS_NAMESPACE, self._document_key(job_id, index))
+        return record[1] if record else None
+
+    def _owner_alive(self, owner: Optional[Dict[str, Any]]) -> bool:
+        if not owner:
+            return False
+        if owner['host'] != self.owner['host']:
+            return True
+        if owner['pid'] == self.owner['pid']:
+            return owner['token'] == self.owner['token']
+        try:
+            os.kill(owner['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _claimable(self, job: Dict[str, Any]) -> bool:
+        # A job this process already owns is running here and must not be started twice
+        if job['state'] not in ('queued', 'running') or job.get('owner') == self.owner:
+            return False
+        return not self._owner_alive(job.get('owner')) or (job.get('lease_until') or 0) < time.time()
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Take ownership of an unfinished job that nobody else is running.
+
+        Returns:
+            bool: True if this process now owns the job
+        """
+        claimed = []
+
+        def apply(job):
+            claimed.clear()
+            if self._claimable(job):
+                job['owner'] = self.owner
+                job['lease_until'] = time.time() + self.LEASE_SECONDS
+                claimed.append(True)
+        self._modify(self.JOBS_NAMESPACE, job_id, apply)
+        return bool(claimed)
+
+    def renew(self, job_id: str) -> bool:
+        """
+        Extend this process's lease on a job.
+
+        Returns:
+            bool: False if the job is no longer owned by this process
+        """
+        renewed = []
+
+        def apply(job):
+            renewed.clear()
+            if job.get('owner') == self.owner:
+                job['lease_until'] = time.time() + self.LEASE_SECONDS
+                renewed.append(True)
+        self._modify(self.JOBS_NAMESPACE, job_id, apply)
+        return bool(renewed)
+
+    def abandoned_jobs(self) -> List[str]:
+        """Return the ids of unfinished jobs that this process could claim."""
+        return [job['job_id'] for job in self.list_jobs() if self._claimable(job)]
+
+    def set_payload(self, job_id: str, index: int, payload: Dict[str, Any]) -> None:
+        """Store the heavy results of a document."""
+        self.backend.put(self.PAYLOADS_NAMESPACE, self._document_key(job_id, index), payload)
+        self.update_document(job_id, index, has_payload=True)
+
+    def get_payload(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        """Return the heavy results of a document, or None if it has none yet."""
+        record = self.backend.get(self.PAYLOADS_NAMESPACE, self._document_key(job_id, index))
+        return record[1] if record else None
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's summary, or None for an unknown job."""
+        record = self.backend.get(self.JOBS_NAMESPACE, job_id)
+        return record[1] if record else None
+
+    def get_status(self, job_id: str, since: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Return a job's summary and the documents changed after a cursor.
+
+        Args:
+            job_id (str): Job id
+            since (int): Cursor returned by the previous call; 0 returns every document
+
+        Returns:
+            Optional[dict]: {'job', 'documents', 'cursor'}, or None for an unknown job
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        prefix = f"{job_id}/"
+        changes, cursor = self.backend.changes_since(self.DOCUMENTS_NAMESPACE, since)
+        documents = sorted(
+            (value for key, _, _, value in changes if key.startswith(prefix)),
+            key=lambda document: document['index']
+        )
+        return {'job': job, 'documents': documents, 'cursor': cursor}
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Return the summaries of every kept job, oldest first."""
+        return [job for _, _, job in self.backend.items(self.JOBS_NAMESPACE)]
+
+    def _prune(self) -> None:
+        finished = [job for job in self.list_jobs() if job['state'] in ('complete', 'failed')]
+        for job in finished[:max(0, len(finished) - self.max_jobs)]:
+            for index in range(job['total']):
+                key = self._document_key(job['job_id'], index)
+                self.backend.delete(self.DOCUMENTS_NAMESPACE, key)
+                self.backend.delete(self.PAYLOADS_NAMESPACE, key)
+                self.backend.delete(self.CHECKPOINTS_NAMESPACE, key)
+            self.backend.delete(self.JOBS_NAMESPACE, job['job_id'])
+            logger.info(f"Dropped ingest job {job['job_id']}")
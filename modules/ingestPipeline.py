@@ -0,0 +1,150 @@
+import os
+import time
+import queue
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+_STAGE_DONE = object()
+
+
+class PipelineStage:
+    """
+    A named pipeline stage with its own bounded worker pool.
+
+    The stage function receives the document's context dict and returns the
+    (possibly updated) context; raising marks the document as failed so the
+    remaining stages skip it.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+
+    @staticmethod
+    def workers_from_env(name: str, default: int) -> int:
+        """Read the worker count for a stage from INGEST_WORKERS_<NAME>."""
+        try:
+            return max(1, int(os.getenv(f"INGEST_WORKERS_{name.upper()}", default)))
+        except ValueError:
+            return default
+
+
+class IngestPipeline:
+    """
+    Staged PDF ingest pipeline.
+
+    Documents flow through the stages in order. Each stage runs its own thread
+    pool, and stages are connected by bounded queues so a slow stage applies
+    backpressure instead of letting earlier stages pile up results in memory.
+    """
+
+    def __init__(self, stages: List[PipelineStage], queue_size: int = 4,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            stages (list): Stages in execution order
+            queue_size (int): Capacity of the queue in front of each stage
+            on_event (callable): Called with (event, context) on stage start/finish/failure
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_event = on_event
+
+    def _emit(self, event: str, context: Dict[str, Any]) -> None:
+        if self.on_event:
+            try:
+                self.on_event(event, context)
+            except Exception as e:
+                logger.error(f"Error in pipeline event handler: {str(e)}")
+
+    def _run_stage(self, stage: PipelineStage, inbox: queue.Queue, outbox: queue.Queue,
+                   remaining_workers: List[int], lock: threading.Lock, downstream_workers: int) -> None:
+        while True:
+            context = inbox.get()
+            if context is _STAGE_DONE:
+                break
+
+            # Stages listed in skip_stages already ran before, e.g. in an interrupted job
+            if not context.get('error') and stage.name not in context.get('skip_stages', ()):
+                context['stage'] = stage.name
+                self._emit('stage_started', context)
+                start_time = time.time()
+                try:
+                    context = stage.fn(context) or context
+                    context.setdefault('timings', {})[stage.name] = round(time.time() - start_time, 3)
+                    self._emit('stage_finished', context)
+                except Exception as e:
+                    context.setdefault('timings', {})[stage.name] = round(time.time() - start_time, 3)
+                    context['error'] = f"{stage.name}: {str(e)}"
+                    logger.error(f"Error in stage {stage.name} for {context.get('url')}: {str(e)}")
+                    self._emit('stage_failed', context)
+
+            outbox.put(context)
+
+        # The last worker of a stage tells every worker of the next stage to stop
+        with lock:
+            remaining_workers[0] -= 1
+            last_worker = remaining_workers[0] == 0
+        if last_worker:
+            for _ in range(downstream_workers):
+                outbox.put(_STAGE_DONE)
+
+    def run(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run all items through the pipeline and block until they are done.
+
+        Args:
+            items (list): Initial context dicts, one per document
+
+        Returns:
+            list: Final context dicts in input order; failed documents carry an 'error'
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results_queue: queue.Queue = queue.Queue()
+        threads = []
+
+        for stage_index, stage in enumerate(self.stages):
+            inbox = queues[stage_index]
+            is_last = stage_index + 1 == len(self.stages)
+            outbox = results_queue if is_last else queues[stage_index + 1]
+            downstream_workers = 1 if is_last else self.stages[stage_index + 1].workers
+            remaining_workers = [stage.workers]
+            lock = threading.Lock()
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._run_stage,
+                    args=(stage, inbox, outbox, remaining_workers, lock, downstream_workers),
+                    name=f"ingest-{stage.name}-{worker_index}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        for position, context in enumerate(items):
+            context.setdefault('position', position)
+            queues[0].put(context)
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_STAGE_DONE)
+
+        results = []
+        while True:
+            context = results_queue.get()
+            if context is _STAGE_DONE:
+                break
+            results.append(context)
+
+        for thread in threads:
+            thread.join()
+
+        return sorted(results, key=lambda context: context['position'])
@@ -1,17 +1,14 @@
-import subprocess
-import sys
-import json
+import functools
+from importlib import metadata
 
+@functools.lru_cache(maxsize=1)
 def get_installed_packages():
-    # Run pip list command and capture the output
-    result = subprocess.run([sys.executable, '-m', 'pip', 'list', '--format=json'], 
-                          capture_output=True, text=True)
-    
-    # Parse the JSON output
-    packages = json.loads(result.stdout)
-    
-    # Create a dictionary of package names and versions
-    return {package['name']: package['version'] for package in packages}
+    # Read the installed distributions once, on first use, instead of running pip list
+    packages = {}
+    for distribution in metadata.distributions():
+        name = distribution.metadata['Name']
+        if name:
+            packages.setdefault(name, distribution.version)
 
-# Get the dictionary of installed packages
-installed_packages = get_installed_packages()
\ No newline at end of file
+    # Create a dictionary of package names and versions
+    return dict(sorted(packages.items(), key=lambda item: item[0].lower()))
@@ -0,0 +1,486 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from .spatialIndex import BBoxGridIndex
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PaperStore:
+    """
+    In-memory store for PAPER_JSON_FILES and DIATOMS_DATA with hash indexes on
+    image_url, pdf_file_url and file_256_hash.
+
+    Each paper's diatoms_data is normalized to a dict once at load time and the
+    DIATOMS_DATA entries are the very same dict objects, so an update through
+    the store is visible from both views without re-scanning the papers list.
+    A paper whose diatoms_data is not valid JSON is kept (and saved) as it is,
+    but has no DIATOMS_DATA entry.
+
+    Every paper also gets a stable key (its file_256_hash where available) that
+    names its shard in the per-paper storage layout.
+
+    Spatial indexes over an image's bboxes are cached alongside the records (not
+    in the paper JSON) and dropped whenever the image's info is replaced.
+
+    Each image also has a version that changes on every update through the
+    store, so data derived from an image can be checked for staleness.
+    """
+
+    def __init__(self, paper_json_files: Optional[List[Dict[str, Any]]] = None):
+        """
+        Initialize the store, optionally loading an initial list of papers.
+
+        Args:
+            paper_json_files (list): List of paper JSON objects
+        """
+        self._lock = threading.RLock()
+        self._papers: List[Dict[str, Any]] = []
+        self._keys: List[str] = []
+        self._by_key: Dict[str, int] = {}
+        self._diatoms: List[Dict[str, Any]] = []
+        self._image_paper_index: List[int] = []
+        self._paper_image_index: Dict[int, int] = {}
+        self._by_image_url: Dict[str, int] = {}
+        self._by_pdf_file_url: Dict[str, int] = {}
+        self._by_file_hash: Dict[str, int] = {}
+        self._spatial_indexes: Dict[int, BBoxGridIndex] = {}
+        self._generation = 0
+        self._image_versions: Dict[int, int] = {}
+        if paper_json_files:
+            self.load(paper_json_files)
+
+    @staticmethod
+    def normalize_paper(paper: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Normalize a paper so that diatoms_data and extracted_images_file_metadata are dicts.
+
+        Args:
+            paper (dict): Paper JSON object
+
+        Returns:
+            dict: The normalized paper; invalid diatoms_data JSON is left as the string it was
+        """
+        diatoms_data = paper.get('diatoms_data')
+        if isinstance(diatoms_data, str):
+            if not diatoms_data:
+                paper['diatoms_data'] = {}
+            else:
+                try:
+                    paper['diatoms_data'] = json.loads(diatoms_data)
+                except json.JSONDecodeError:
+                    logger.warning("Not indexing the image of a paper with invalid diatoms_data JSON")
+        elif diatoms_data is None:
+            paper['diatoms_data'] = {}
+
+        metadata = paper.get('extracted_images_file_metadata')
+        if isinstance(metadata, str) and metadata:
+            try:
+                paper['extracted_images_file_metadata'] = json.loads(metadata)
+            except json.JSONDecodeError:
+                pass
+
+        return paper
+
+    @staticmethod
+    def get_file_hash(paper: Dict[str, Any]) -> str:
+        """
+        Get the SHA-256 hash of a paper's PDF from its extracted image metadata.
+
+        Args:
+            paper (dict): Paper JSON object
+
+        Returns:
+            str: The file_256_hash, or empty string if not available
+        """
+        metadata = paper.get('extracted_images_file_metadata')
+        if isinstance(metadata, dict):
+            return metadata.get('file_256_hash', '') or ''
+        return ''
+
+    @classmethod
+    def make_paper_key(cls, paper: Dict[str, Any]) -> str:
+        """
+        Derive the storage key for a paper.
+
+        Args:
+            paper (dict): Paper JSON object
+
+        Returns:
+            str: The file_256_hash, or a SHA-256 of the pdf_file_url when no hash is recorded
+        """
+        file_hash = cls.get_file_hash(paper)
+        if file_hash:
+            return file_hash
+        source = paper.get('pdf_file_url') or json.dumps(paper.get('diatoms_data', {}), sort_keys=True)
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def available_paper_key(self, paper: Dict[str, Any]) -> str:
+        """
+        Return the key add_papers() would give a paper right now.
+
+        Args:
+            paper (dict): Paper JSON object
+
+        Returns:
+            str: make_paper_key(paper), suffixed if that key is already taken
+        """
+        with self._lock:
+            base_key = self.make_paper_key(paper)
+            paper_key, suffix = base_key, 1
+            while paper_key in self._by_key:
+                suffix += 1
+                paper_key = f"{base_key}-{suffix}"
+            return paper_key
+
+    def _index_paper(self, paper_index: int, paper_key: Optional[str] = None) -> str:
+        """Add a paper (and its diatoms_data, if any) to the indexes and return its key."""
+        paper = self._papers[paper_index]
+
+        if not paper_key:
+            paper_key = self.available_paper_key(paper)
+        self._keys.append(paper_key)
+        self._by_key[paper_key] = paper_index
+
+        pdf_file_url = paper.get('pdf_file_url')
+        if pdf_file_url:
+            self._by_pdf_file_url.setdefault(pdf_file_url, paper_index)
+
+        file_hash = self.get_file_hash(paper)
+        if file_hash:
+            self._by_file_hash.setdefault(file_hash, paper_index)
+
+        diatoms_data = paper.get('diatoms_data')
+        if diatoms_data and isinstance(diatoms_data, dict):
+            self._paper_image_index[paper_index] = len(self._diatoms)
+            self._diatoms.append(diatoms_data)
+            self._image_paper_index.append(paper_index)
+            image_url = diatoms_data.get('image_url')
+            if image_url:
+                self._by_image_url.setdefault(image_url, paper_index)
+
+        return paper_key
+
+    def load(self, paper_json_files: Iterable[Dict[str, Any]],
+             paper_keys: Optional[List[str]] = None) -> None:
+        """
+        Replace the store contents with a new list of papers and rebuild the indexes.
+
+        Args:
+            paper_json_files (list): List of paper JSON objects
+            paper_keys (list): Optional storage keys, parallel to paper_json_files
+        """
+        with self._lock:
+            self._reset()
+            self._append(paper_json_files, paper_keys)
+            logger.info(f"Loaded {len(self._papers)} papers and {len(self._diatoms)} diatom entries into store")
+
+    def _reset(self) -> None:
+        """Empty the store and its indexes, starting a new generation."""
+        self._papers = []
+        self._keys = []
+        self._by_key = {}
+        self._diatoms = []
+        self._image_paper_index = []
+        self._paper_image_index = {}
+        self._by_image_url = {}
+        self._by_pdf_file_url = {}
+        self._by_file_hash = {}
+        self._spatial_indexes = {}
+        self._generation += 1
+        self._image_versions = {}
+
+    def _reindex(self) -> None:
+        """Rebuild all indexes from the stored papers and keys, starting a new generation."""
+        papers, keys = self._papers, self._keys
+        self._reset()
+        for paper, paper_key in zip(papers, keys):
+            self._papers.append(paper)
+            self._index_paper(len(self._papers) - 1, paper_key)
+
+    def add_papers(self, paper_json_files: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Append new papers to the store and index them.
+
+        Args:
+            paper_json_files (list): List of paper JSON objects to add
+
+        Returns:
+            list: Storage keys of the added papers
+        """
+        with self._lock:
+            return self._append(paper_json_files)
+
+    def _append(self, paper_json_files: Iterable[Dict[str, Any]],
+                paper_keys: Optional[List[str]] = None) -> List[str]:
+        added_keys = []
+        for position, paper in enumerate(paper_json_files or []):
+            paper = self.normalize_paper(paper)
+            paper_key = paper_keys[position] if paper_keys and position < len(paper_keys) else None
+            self._papers.append(paper)
+            added_keys.append(self._index_paper(len(self._papers) - 1, paper_key))
+        return added_keys
+
+    def upsert_paper(self, paper_key: str, paper: Dict[str, Any]) -> None:
+        """
+        Replace the paper stored under paper_key, or append it if the key is new.
+
+        Args:
+            paper_key (str): Storage key of the paper
+            paper (dict): Paper JSON object
+        """
+        with self._lock:
+            paper = self.normalize_paper(paper)
+            paper_index = self._by_key.get(paper_key)
+            if paper_index is None:
+                self._papers.append(paper)
+                self._index_paper(len(self._papers) - 1, paper_key)
+                return
+
+            old_paper = self._papers[paper_index]
+            self._papers[paper_index] = paper
+            image_index = self._paper_image_index.get(paper_index)
+            diatoms_data = paper.get('diatoms_data')
+            if not isinstance(diatoms_data, dict):
+                diatoms_data = None
+            if (old_paper.get('pdf_file_url') != paper.get('pdf_file_url')
+                    or self.get_file_hash(old_paper) != self.get_file_hash(paper)
+                    or (image_index is not None) != bool(diatoms_data)):
+                # Image indices after this paper shift, so rebuild every index
+                self._reindex()
+            elif image_index is not None:
+                old_image_url = self._diatoms[image_index].get('image_url')
+                self._diatoms[image_index] = diatoms_data
+                self._spatial_indexes.pop(image_index, None)
+                self._bump_image_version(image_index)
+                self._reindex_image_url(image_index, old_image_url, diatoms_data.get('image_url'))
+
+    def pop_paper_fields(self, paper_key: str, fields: Iterable[str]) -> Dict[str, Any]:
+        """
+        Remove fields from a stored paper.
+
+        Args:
+            paper_key (str): Storage key of the paper
+            fields (list): Names of the fields to remove
+
+        Returns:
+            dict: The removed fields that were present
+        """
+        with self._lock:
+            paper = self.get_paper_by_key(paper_key)
+            if paper is None:
+                return {}
+            return {field: paper.pop(field) for field in fields if field in paper}
+
+    @property
+    def papers(self) -> List[Dict[str, Any]]:
+        """List of all paper JSON objects (PAPER_JSON_FILES)."""
+        return self._papers
+
+    @property
+    def diatoms(self) -> List[Dict[str, Any]]:
+        """List of all diatoms data objects (DIATOMS_DATA)."""
+        return self._diatoms
+
+    @property
+    def paper_keys(self) -> List[str]:
+        """Storage keys of all papers, in PAPER_JSON_FILES order."""
+        return self._keys
+
+    def image_count(self) -> int:
+        """Number of diatom image entries in the store."""
+        return len(self._diatoms)
+
+    def is_valid_index(self, image_index: Any) -> bool:
+        """Check whether image_index refers to an existing diatom image entry."""
+        return isinstance(image_index, int) and 0 <= image_index < len(self._diatoms)
+
+    def get_image(self, image_index: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the diatoms data for an image by its index in DIATOMS_DATA.
+
+        Args:
+            image_index (int): Index of the image
+
+        Returns:
+            Optional[dict]: The diatoms data, or None if the index is invalid
+        """
+        if not self.is_valid_index(image_index):
+            return None
+        return self._diatoms[image_index]
+
+    def get_paper_for_image(self, image_index: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the paper that owns an image.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+
+        Returns:
+            Optional[dict]: The paper JSON object, or None if the index is invalid
+        """
+        if not self.is_valid_index(image_index):
+            return None
+        return self._papers[self._image_paper_index[image_index]]
+
+    def get_image_paper_key(self, image_index: int) -> Optional[str]:
+        """Get the storage key of the paper that owns an image."""
+        if not self.is_valid_index(image_index):
+            return None
+        return self._keys[self._image_paper_index[image_index]]
+
+    def get_paper_by_key(self, paper_key: str) -> Optional[Dict[str, Any]]:
+        """Get a paper by its storage key."""
+        paper_index = self._by_key.get(paper_key)
+        return self._papers[paper_index] if paper_index is not None else None
+
+    def get_paper_index(self, paper_key: str) -> Optional[int]:
+        """Get the position of a paper in PAPER_JSON_FILES by its storage key."""
+        return self._by_key.get(paper_key)
+
+    def get_paper_image_index(self, paper_key: str) -> Optional[int]:
+        """Get the index in DIATOMS_DATA of a paper's image, or None if it has none."""
+        paper_index = self._by_key.get(paper_key)
+        return self._paper_image_index.get(paper_index) if paper_index is not None else None
+
+    def get_paper_by_image_url(self, image_url: str) -> Optional[Dict[str, Any]]:
+        """Get the first paper whose diatoms_data has the given image_url."""
+        paper_index = self._by_image_url.get(image_url)
+        return self._papers[paper_index] if paper_index is not None else None
+
+    def get_paper_by_pdf_url(self, pdf_file_url: str) -> Optional[Dict[str, Any]]:
+        """Get the first paper with the given pdf_file_url."""
+        paper_index = self._by_pdf_file_url.get(pdf_file_url)
+        return self._papers[paper_index] if paper_index is not None else None
+
+    def get_paper_by_hash(self, file_256_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the first paper whose PDF has the given SHA-256 hash."""
+        paper_index = self._by_file_hash.get(file_256_hash)
+        return self._papers[paper_index] if paper_index is not None else None
+
+    def update_image(self, image_index: int, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Update fields of an image's diatoms data in place.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+            fields (dict): Fields to set on the diatoms data
+
+        Returns:
+            dict: The updated diatoms data
+
+        Raises:
+            ValueError: If the index is invalid
+        """
+        with self._lock:
+            image_data = self.get_image(image_index)
+            if image_data is None:
+                raise ValueError(f"Invalid image index: {image_index}")
+            old_image_url = image_data.get('image_url')
+            image_data.update(fields)
+            if 'info' in fields:
+                self._spatial_indexes.pop(image_index, None)
+            self._bump_image_version(image_index)
+            self._reindex_image_url(image_index, old_image_url, image_data.get('image_url'))
+            return image_data
+
+    def replace_image(self, image_index: int, image_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace an image's diatoms data in both DIATOMS_DATA and its paper.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+            image_data (dict): New diatoms data
+
+        Returns:
+            dict: The stored diatoms data
+
+        Raises:
+            ValueError: If the index is invalid
+        """
+        with self._lock:
+            current = self.get_image(image_index)
+            if current is None:
+                raise ValueError(f"Invalid image index: {image_index}")
+            self._diatoms[image_index] = image_data
+            self._papers[self._image_paper_index[image_index]]['diatoms_data'] = image_data
+            self._spatial_indexes.pop(image_index, None)
+            self._bump_image_version(image_index)
+            self._reindex_image_url(image_index, current.get('image_url'), image_data.get('image_url'))
+            return image_data
+
+    def _bump_image_version(self, image_index: int) -> None:
+        self._image_versions[image_index] = self._image_versions.get(image_index, 0) + 1
+
+    def get_image_version(self, image_index: int) -> Tuple[int, int]:
+        """
+        Get the version of an image's diatoms data.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+
+        Returns:
+            tuple: (store generation, image version); it changes whenever the image
+            is updated or replaced through the store, or the store is reloaded
+        """
+        with self._lock:
+            return (self._generation, self._image_versions.get(image_index, 0))
+
+    def get_image_snapshot(self, image_index: int) -> Optional[Tuple[Tuple[int, int], Dict[str, Any]]]:
+        """
+        Take a consistent deep copy of an image's diatoms data.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+
+        Returns:
+            Optional[tuple]: (version, copy of the diatoms data), or None if the index is invalid
+        """
+        with self._lock:
+            image_data = self.get_image(image_index)
+            if image_data is None:
+                return None
+            return self.get_image_version(image_index), copy.deepcopy(image_data)
+
+    def get_spatial_index(self, image_index: int) -> Optional[BBoxGridIndex]:
+        """
+        Get the bbox spatial index of an image, building it on first use.
+
+        Args:
+            image_index (int): Index of the image in DIATOMS_DATA
+
+        Returns:
+            Optional[BBoxGridIndex]: The index, or None for an invalid index or a
+            plate with too few bboxes to benefit from one
+        """
+        with self._lock:
+            image_data = self.get_image(image_index)
+            if image_data is None:
+                return None
+            bboxes = image_data.get('info') or []
+            if len(bboxes) < BBoxGridIndex.MIN_BBOXES:
+                return None
+            spatial_index = self._spatial_indexes.get(image_index)
+            # Edits made to info in place, outside update_image, also invalidate the index
+            if spatial_index is None or not spatial_index.matches(bboxes):
+                spatial_index = BBoxGridIndex(bboxes)
+                self._spatial_indexes[image_index] = spatial_index
+            return spatial_index
+
+    def _reindex_image_url(self, image_index: int, old_image_url: Optional[str],
+                           new_image_url: Optional[str]) -> None:
+        if old_image_url == new_image_url:
+            return
+        paper_index = self._image_paper_index[image_index]
+        if old_image_url and self._by_image_url.get(old_image_url) == paper_index:
+            del self._by_image_url[old_image_url]
+        if new_image_url:
+            self._by_image_url.setdefault(new_image_url, paper_index)
@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PaperTextStore:
+    """
+    Large paper text fields kept out of the resident paper records.
+
+    pdf_text_content and first_two_pages_text are stored as one gzipped blob
+    per paper key next to the paper shards and loaded on demand through a
+    small LRU, so the in-memory PaperStore and every shard save carry only
+    the annotation data.
+    """
+
+    TEXT_FIELDS = ('pdf_text_content', 'first_two_pages_text')
+    MAX_ENTRIES = int(os.getenv('PAPER_TEXT_CACHE_ENTRIES', '16'))
+
+    def __init__(self, gcp_ops, shards_base_url: str, max_entries: Optional[int] = None):
+        """
+        Initialize the store.
+
+        Args:
+            gcp_ops (GCPOps): Storage operations
+            shards_base_url (str): Base URL of the paper shard layout
+            max_entries (int): Number of papers' texts kept in memory
+        """
+        self.gcp_ops = gcp_ops
+        self.shards_base_url = shards_base_url
+        self.max_entries = self.MAX_ENTRIES if max_entries is None else max_entries
+        self._entries: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @classmethod
+    def split_texts(cls, paper: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Separate a paper's text fields from the rest of its record.
+
+        Returns:
+            tuple: (copy of the paper without the text fields, the text fields)
+        """
+        texts = {field: paper[field] for field in cls.TEXT_FIELDS if field in paper}
+        return {field: value for field, value in paper.items() if field not in texts}, texts
+
+    def _remember(self, paper_key: str, texts: Dict[str, str]) -> None:
+        with self._lock:
+            self._entries[paper_key] = texts
+            self._entries.move_to_end(paper_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, paper_key: str, texts: Dict[str, str]) -> bool:
+        """
+        Store a paper's text fields.
+
+        Returns:
+            bool: True if the texts were saved
+        """
+        if not self.gcp_ops.save_paper_text(self.shards_base_url, paper_key, texts):
+            return False
+        self._remember(paper_key, texts)
+        with self._lock:
+            self.stats['stores'] += 1
+        return True
+
+    def get(self, paper_key: str) -> Dict[str, str]:
+        """
+        Load a paper's text fields.
+
+        Returns:
+            dict: The text fields, or an empty dict if none are stored
+        """
+        with self._lock:
+            texts = self._entries.get(paper_key)
+            if texts is not None:
+                self._entries.move_to_end(paper_key)
+                self.stats['hits'] += 1
+                return texts
+            self.stats['misses'] += 1
+
+        texts = self.gcp_ops.load_paper_text(self.shards_base_url, paper_key)
+        if texts is None:
+            return {}
+        self._remember(paper_key, texts)
+        return texts
+
+    def offload(self, paper_store, paper_keys: Iterable[str], max_workers: int = 8) -> List[str]:
+        """
+        Move inline text fields of stored papers into the text store.
+
+        A paper's fields are removed from its record only after they were saved,
+        so a failed upload leaves the paper unchanged.
+
+        Args:
+            paper_store (PaperStore): Store holding the papers
+            paper_keys (list): Keys of the papers to check
+
+        Returns:
+            list: Keys of the papers that were changed and need their shard rewritten
+        """
+        def offload_one(paper_key: str) -> Optional[str]:
+            paper = paper_store.get_paper_by_key(paper_key)
+            if paper is None:
+                return None
+            texts = {field: paper[field] for field in self.TEXT_FIELDS if field in paper}
+            if not texts or not self.put(paper_key, texts):
+                return None
+            paper_store.pop_paper_fields(paper_key, texts.keys())
+            return paper_key
+
+        paper_keys = [key for key in dict.fromkeys(paper_keys)
+                      if any(field in (paper_store.get_paper_by_key(key) or {}) for field in self.TEXT_FIELDS)]
+        if not paper_keys:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paper_keys))) as executor:
+            offloaded = [key for key in executor.map(offload_one, paper_keys) if key]
+        logger.info(f"Moved text fields of {len(offloaded)} papers out of the resident records")
+        return offloaded
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of papers held in memory."""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+            )
@@ -1,15 +1,106 @@
 import os
-import tempfile
+import time
 import requests
 import hashlib
-import shutil
 import json
-from typing import Optional, Dict, Any, Tuple
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Dict, Any, Tuple, List, Union
 from urllib.parse import urlparse
 import fitz  # PyMuPDF
 from google.cloud import storage
+from google.api_core import exceptions as gcs_exceptions
 from dotenv import load_dotenv
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# One authenticated storage client per process, shared by all PDFOps instances
+_STORAGE_CLIENTS: Dict[Tuple[int, str], storage.Client] = {}
+_STORAGE_CLIENTS_LOCK = threading.Lock()
+
+# Errors worth retrying on upload: throttling, server errors and dropped connections
+_TRANSIENT_UPLOAD_ERRORS = (
+    gcs_exceptions.TooManyRequests,
+    gcs_exceptions.InternalServerError,
+    gcs_exceptions.BadGateway,
+    gcs_exceptions.ServiceUnavailable,
+    gcs_exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+# Process pool for page-range sharded extraction, created on first use
+_EXTRACT_POOL: Optional[ProcessPoolExecutor] = None
+_EXTRACT_POOL_LOCK = threading.Lock()
+# Set if this process cannot start a pool, so every PDF is extracted serially from then on
+_EXTRACT_POOL_UNAVAILABLE = False
+
+
+def _extract_pages(pdf_document: fitz.Document, start: int, end: int) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Collect the text and images of pages [start, end) of an open PDF.
+    
+    An image object (xref) placed on several pages is extracted and hashed once;
+    every placement shares the same bytes.
+    
+    Returns:
+        Tuple[List[str], List[Dict[str, Any]]]: Text of each page, and the page's
+        images with page_index, img_idx, xref, ext, digest (SHA-256 of the image
+        bytes) and the raw image bytes
+    """
+    page_texts = []
+    images: List[Dict[str, Any]] = []
+    extracted: Dict[int, Dict[str, Any]] = {}
+    for page_num in range(start, end):
+        page = pdf_document[page_num]
+        page_texts.append(page.get_text())
+        
+        for img_idx, img in enumerate(page.get_images(), 1):
+            xref = img[0]
+            if xref not in extracted:
+                try:
+                    base_image = pdf_document.extract_image(xref)
+                    extracted[xref] = {
+                        "ext": base_image.get("ext", "jpeg"),
+                        "digest": hashlib.sha256(base_image["image"]).hexdigest(),
+                        "image": base_image["image"]
+                    }
+                except Exception as e:
+                    print(f"Error extracting image {img_idx} on page {page_num + 1}: {str(e)}")
+                    extracted[xref] = {"ext": None, "digest": None, "image": None}
+            images.append(dict(extracted[xref], page_index=page_num, img_idx=img_idx, xref=xref))
+    return page_texts, images
+
+
+def _extract_page_range(source: Union[str, bytes], start: int, end: int) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Extract a page range in a worker process.
+    
+    Args:
+        source (Union[str, bytes]): Path of a spooled PDF, or the PDF bytes
+        start (int): First page of the range
+        end (int): Page after the last page of the range
+        
+    Returns:
+        Tuple[List[str], List[Dict[str, Any]]]: See _extract_pages
+    """
+    if isinstance(source, str):
+        pdf_document = fitz.open(source, filetype="pdf")
+    else:
+        pdf_document = fitz.open(stream=source, filetype="pdf")
+    try:
+        return _extract_pages(pdf_document, start, end)
+    finally:
+        pdf_document.close()
+
 
 class PDFOps:
     """
@@ -17,6 +108,24 @@ class PDFOps:
     and Google Cloud Storage interactions.
     """
     
+    # Parallel image uploads per PDF and retry policy for transient errors
+    UPLOAD_WORKERS = int(os.getenv('PDF_IMAGE_UPLOAD_WORKERS', '8'))
+    UPLOAD_MAX_ATTEMPTS = 4
+    UPLOAD_BACKOFF_SECONDS = 0.5
+    
+    # Streaming download limits; PDFs above the spool threshold go to a temp file
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    MAX_PDF_BYTES = int(os.getenv('PDF_MAX_BYTES', str(200 * 1024 * 1024)))
+    SPOOL_THRESHOLD_BYTES = int(os.getenv('PDF_SPOOL_THRESHOLD_BYTES', str(16 * 1024 * 1024)))
+    DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv('PDF_DOWNLOAD_CONNECT_TIMEOUT', '10'))
+    DOWNLOAD_READ_TIMEOUT = float(os.getenv('PDF_DOWNLOAD_READ_TIMEOUT', '60'))
+    DOWNLOAD_TOTAL_TIMEOUT = float(os.getenv('PDF_DOWNLOAD_TOTAL_TIMEOUT', '300'))
+    
+    # Page-range sharded extraction; PDFs below EXTRACT_MIN_PAGES, or a single worker, stay serial
+    EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(os.cpu_count() or 1)))
+    EXTRACT_MIN_PAGES = int(os.getenv('PDF_EXTRACT_MIN_PAGES', '64'))
+    EXTRACT_SHARD_PAGES = int(os.getenv('PDF_EXTRACT_SHARD_PAGES', '16'))
+    
     def __init__(self):
         """Initialize PDFOps with Google Cloud credentials"""
         load_dotenv()
@@ -26,12 +135,30 @@ class PDFOps:
     
     def _get_storage_client(self) -> storage.Client:
         """
-        Get authenticated Google Cloud Storage client.
+        Get the authenticated Google Cloud Storage client for this process.
+        
+        The client (and its pooled HTTP session) is created once per process and
+        service account, instead of re-parsing the credentials for every upload.
         
         Returns:
             storage.Client: Authenticated GCS client
         """
-        return storage.Client.from_service_account_info(json.loads(self.secret_json))
+        cache_key = (os.getpid(), hashlib.sha256(self.secret_json.encode('utf-8')).hexdigest())
+        with _STORAGE_CLIENTS_LOCK:
+            client = _STORAGE_CLIENTS.get(cache_key)
+            if client is None:
+                client = storage.Client.from_service_account_info(json.loads(self.secret_json))
+                try:
+                    # Size the connection pool for the parallel upload workers
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=self.UPLOAD_WORKERS,
+                        pool_maxsize=self.UPLOAD_WORKERS * 2
+                    )
+                    client._http.mount("https://", adapter)
+                except Exception as e:
+                    print(f"Could not resize storage client connection pool: {str(e)}")
+                _STORAGE_CLIENTS[cache_key] = client
+            return client
     
     @staticmethod
     def _get_file_hash(file_content: bytes) -> str:
@@ -47,31 +174,460 @@ class PDFOps:
         return hashlib.sha256(file_content).hexdigest()
     
     @staticmethod
-    def _download_pdf(pdf_url: str, temp_path: str) -> bytes:
+    def _get_filename(pdf_url: str) -> str:
         """
-        Download PDF from URL and save to temporary path.
+        Get the original filename from a PDF URL.
         
         Args:
             pdf_url (str): URL of the PDF file
-            temp_path (str): Path to save the temporary file
             
         Returns:
-            bytes: Raw PDF content
+            str: Filename from the URL, or 'unnamed.pdf' if it is not a PDF name
+        """
+        filename = os.path.basename(urlparse(pdf_url).path)
+        if not filename.lower().endswith('.pdf'):
+            filename = 'unnamed.pdf'
+        return filename
+    
+    @classmethod
+    def fetch_pdf(cls, pdf_url: str, etag: Optional[str] = None,
+                  last_modified: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Stream a PDF download, hashing it chunk by chunk.
+        
+        Small PDFs are kept in memory; once a download passes SPOOL_THRESHOLD_BYTES
+        it is spooled to a temp file instead. Pass the etag/last_modified of a
+        previous download to make a conditional request. Call release_pdf() on
+        the result when done with it.
+        
+        Args:
+            pdf_url (str): URL of the PDF file
+            etag (str): ETag from a previous download of this URL
+            last_modified (str): Last-Modified from a previous download of this URL
+            
+        Returns:
+            Dict[str, Any]: Dictionary containing:
+                - not_modified: True if the server answered 304 (no content is returned)
+                - content: PDF bytes for in-memory downloads, otherwise None
+                - path: Temp file path for spooled downloads, otherwise None
+                - file_256_hash: SHA-256 hash of the PDF content
+                - size: Number of bytes downloaded
+                - etag, last_modified: Validators for the next conditional request
             
         Raises:
-            requests.exceptions.RequestException: If download fails
+            ValueError: If the PDF is larger than MAX_PDF_BYTES
+            requests.exceptions.RequestException: If download fails or times out
+        """
+        # Convert GCS URL to direct download URL if needed
+        pdf_url = pdf_url.replace("storage.cloud.google.com", "storage.googleapis.com")
+        
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        result = {
+            "not_modified": False,
+            "content": None,
+            "path": None,
+            "file_256_hash": None,
+            "size": 0,
+            "etag": etag,
+            "last_modified": last_modified
+        }
+        
+        with requests.get(pdf_url, headers=headers, stream=True,
+                          timeout=(cls.DOWNLOAD_CONNECT_TIMEOUT, cls.DOWNLOAD_READ_TIMEOUT)) as response:
+            if response.status_code == 304:
+                result["not_modified"] = True
+                return result
+            response.raise_for_status()
+            
+            result["etag"] = response.headers.get('ETag')
+            result["last_modified"] = response.headers.get('Last-Modified')
+            
+            declared_size = response.headers.get('Content-Length')
+            if declared_size and declared_size.isdigit() and int(declared_size) > cls.MAX_PDF_BYTES:
+                raise ValueError(f"PDF is {declared_size} bytes, over the {cls.MAX_PDF_BYTES} byte limit: {pdf_url}")
+            
+            hasher = hashlib.sha256()
+            buffer = bytearray()
+            spool = None
+            deadline = time.monotonic() + cls.DOWNLOAD_TOTAL_TIMEOUT
+            
+            try:
+                for chunk in response.iter_content(chunk_size=cls.DOWNLOAD_CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    result["size"] += len(chunk)
+                    if result["size"] > cls.MAX_PDF_BYTES:
+                        raise ValueError(f"PDF exceeds the {cls.MAX_PDF_BYTES} byte limit: {pdf_url}")
+                    if time.monotonic() > deadline:
+                        raise requests.exceptions.Timeout(
+                            f"PDF download took longer than {cls.DOWNLOAD_TOTAL_TIMEOUT}s: {pdf_url}"
+                        )
+                    
+                    hasher.update(chunk)
+                    if spool is not None:
+                        spool.write(chunk)
+                        continue
+                    buffer.extend(chunk)
+                    if len(buffer) > cls.SPOOL_THRESHOLD_BYTES:
+                        spool = tempfile.NamedTemporaryFile(prefix='pdf_', suffix='.pdf', delete=False)
+                        spool.write(buffer)
+                        buffer = bytearray()
+            except Exception:
+                if spool is not None:
+                    spool.close()
+                    os.remove(spool.name)
+                raise
+        
+        if spool is not None:
+            spool.close()
+            result["path"] = spool.name
+        else:
+            result["content"] = bytes(buffer)
+        result["file_256_hash"] = hasher.hexdigest()
+        return result
+    
+    @staticmethod
+    def release_pdf(download: Optional[Dict[str, Any]]) -> None:
         """
-        response = requests.get(pdf_url)
-        response.raise_for_status()
+        Delete the temp file of a spooled download, if any.
+        
+        Args:
+            download (Dict[str, Any]): Result of fetch_pdf
+        """
+        if not download:
+            return
+        path = download.get("path")
+        download["content"] = None
+        download["path"] = None
+        if path:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove spooled PDF {path}: {str(e)}")
+    
+    def extract_from_download(self, download: Dict[str, Any], pdf_url: str = "") -> Dict[str, Any]:
+        """
+        Extract text and images from a fetch_pdf result.
+        
+        Spooled downloads are opened from their temp file, so MuPDF reads pages
+        from disk instead of holding the whole PDF in memory; extraction workers
+        of a large PDF open the same file rather than receiving a copy of it.
         
-        with open(temp_path, 'wb') as f:
-            f.write(response.content)
+        Args:
+            download (Dict[str, Any]): Result of fetch_pdf
+            pdf_url (str): URL the PDF came from, used for the filename
+            
+        Returns:
+            Dict[str, Any]: See extract_from_pdf_bytes
+        """
+        if download.get("path"):
+            pdf_document = fitz.open(download["path"], filetype="pdf")
+        else:
+            pdf_document = fitz.open(stream=download["content"], filetype="pdf")
+        return self._extract_document(pdf_document, pdf_url, download["file_256_hash"],
+                                      download.get("path") or download["content"])
+    
+    def extract_from_pdf_bytes(self, pdf_content: bytes, pdf_url: str = "") -> Dict[str, Any]:
+        """
+        Extract text and images from in-memory PDF bytes in a single pass over the pages.
+        
+        Args:
+            pdf_content (bytes): Raw PDF content
+            pdf_url (str): URL the PDF came from, used for the filename
             
-        return response.content
+        Returns:
+            Dict[str, Any]: Dictionary containing:
+                - full_text: Complete text content from all pages
+                - first_two_pages_text: Text content from the first two pages only
+                - filename: Original filename from the PDF URL
+                - file_256_hash: SHA-256 hash of the PDF content
+                - total_pages: Number of pages
+                - images: List of extracted images, each with page_index, img_idx,
+                  xref, ext, digest and the raw image bytes
+        """
+        pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+        return self._extract_document(pdf_document, pdf_url, self._get_file_hash(pdf_content), pdf_content)
+    
+    @classmethod
+    def _get_extract_pool(cls) -> Optional[ProcessPoolExecutor]:
+        """Return the shared extraction process pool, or None if one cannot be created here."""
+        global _EXTRACT_POOL, _EXTRACT_POOL_UNAVAILABLE
+        with _EXTRACT_POOL_LOCK:
+            if _EXTRACT_POOL is None and not _EXTRACT_POOL_UNAVAILABLE:
+                try:
+                    # Forked children of a threaded gunicorn worker could inherit locks held by its other threads
+                    _EXTRACT_POOL = ProcessPoolExecutor(max_workers=cls.EXTRACT_WORKERS,
+                                                        mp_context=multiprocessing.get_context('forkserver'))
+                except (OSError, NotImplementedError, ValueError) as e:
+                    print(f"Process pool unavailable, extracting PDFs serially: {str(e)}")
+                    _EXTRACT_POOL_UNAVAILABLE = True
+            return _EXTRACT_POOL
+    
+    @staticmethod
+    def _discard_extract_pool(pool: ProcessPoolExecutor) -> None:
+        """Drop a broken extraction pool so the next large PDF starts a fresh one."""
+        global _EXTRACT_POOL
+        with _EXTRACT_POOL_LOCK:
+            if _EXTRACT_POOL is pool:
+                _EXTRACT_POOL = None
+        pool.shutdown(wait=False)
+    
+    def _page_ranges(self, total_pages: int) -> List[Tuple[int, int]]:
+        """Split the pages into contiguous ranges, one or more per extraction worker."""
+        shards = max(1, min(self.EXTRACT_WORKERS, total_pages // max(1, self.EXTRACT_SHARD_PAGES)))
+        bounds = [total_pages * shard // shards for shard in range(shards + 1)]
+        return [(bounds[shard], bounds[shard + 1]) for shard in range(shards)]
+    
+    def _extract_sharded(self, source: Union[str, bytes],
+                         total_pages: int) -> Optional[Tuple[List[str], List[Dict[str, Any]]]]:
+        """
+        Extract page ranges on the process pool and join them in page order.
+        
+        Returns:
+            Optional[Tuple[List[str], List[Dict[str, Any]]]]: See _extract_pages, or None
+            if the pool is unavailable or a worker died, so the caller extracts serially
+        """
+        pool = self._get_extract_pool()
+        if pool is None:
+            return None
+        try:
+            futures = [pool.submit(_extract_page_range, source, start, end)
+                       for start, end in self._page_ranges(total_pages)]
+            page_texts: List[str] = []
+            images: List[Dict[str, Any]] = []
+            for future in futures:
+                shard_texts, shard_images = future.result()
+                page_texts.extend(shard_texts)
+                images.extend(shard_images)
+            return page_texts, images
+        except Exception as e:
+            print(f"Sharded extraction failed, extracting serially: {str(e)}")
+            if getattr(pool, '_broken', False):
+                self._discard_extract_pool(pool)
+            return None
+    
+    def _extract_document(self, pdf_document: fitz.Document, pdf_url: str, file_256_hash: str,
+                          source: Union[str, bytes, None] = None) -> Dict[str, Any]:
+        """
+        Collect the text and images of every page of an open PDF, then close it.
+        
+        PDFs of at least EXTRACT_MIN_PAGES pages are split into page ranges that
+        EXTRACT_WORKERS processes extract in parallel from source (the spooled
+        file's path or the PDF bytes); smaller ones are walked once in this process.
+        """
+        try:
+            total_pages = len(pdf_document)
+            extracted = None
+            if source is not None and self.EXTRACT_WORKERS > 1 and total_pages >= self.EXTRACT_MIN_PAGES:
+                start_time = time.time()
+                extracted = self._extract_sharded(source, total_pages)
+                if extracted is not None:
+                    logger.debug(f"Extracted {total_pages} pages on {len(self._page_ranges(total_pages))} workers "
+                                 f"in {time.time() - start_time:.2f}s")
+            page_texts, images = extracted or _extract_pages(pdf_document, 0, total_pages)
+            
+            return {
+                "full_text": "".join(page_texts),
+                "first_two_pages_text": "".join(page_texts[:2]),
+                "filename": self._get_filename(pdf_url) if pdf_url else "unnamed.pdf",
+                "file_256_hash": file_256_hash,
+                "total_pages": total_pages,
+                "images": images
+            }
+            
+        finally:
+            pdf_document.close()
+    
+    def ingest_pdf(self, pdf_url: str) -> Dict[str, Any]:
+        """
+        Download a PDF once and extract its text, images and hash.
+        
+        Args:
+            pdf_url (str): URL of the PDF file
+            
+        Returns:
+            Dict[str, Any]: See extract_from_pdf_bytes
+        """
+        download = self.fetch_pdf(pdf_url)
+        try:
+            return self.extract_from_download(download, pdf_url)
+        finally:
+            self.release_pdf(download)
+    
+    @staticmethod
+    def build_image_manifest(images: List[Dict[str, Any]], file_256_hash: str) -> List[Dict[str, Any]]:
+        """
+        Group the image placements of a PDF into distinct images.
+        
+        Placements are the same image if they share an xref or if their bytes
+        have the same digest (the same picture embedded as separate objects).
+        Each distinct image gets a content-addressed filename, so logos and page
+        furniture repeated on many pages are stored once and two different
+        images can never be written to the same name.
+        
+        Args:
+            images (List[Dict[str, Any]]): Images of an ingest result
+            file_256_hash (str): SHA-256 hash of the PDF
+            
+        Returns:
+            List[Dict[str, Any]]: Distinct images in order of first appearance, each with
+            digest, filename, ext, bytes, xrefs, pages (page_index, img_idx pairs) and
+            the raw image bytes
+        """
+        manifest: List[Dict[str, Any]] = []
+        by_digest: Dict[str, Dict[str, Any]] = {}
+        for image in images:
+            if image["image"] is None:
+                continue
+            if not image.get("digest"):
+                image["digest"] = hashlib.sha256(image["image"]).hexdigest()
+            digest = image["digest"]
+            entry = by_digest.get(digest)
+            if entry is None:
+                entry = {
+                    "digest": digest,
+                    "filename": f"{file_256_hash}_image_{digest[:16]}.jpeg",
+                    "ext": image["ext"],
+                    "bytes": len(image["image"]),
+                    "xrefs": [],
+                    "pages": [],
+                    "image": image["image"]
+                }
+                by_digest[digest] = entry
+                manifest.append(entry)
+            if image["xref"] not in entry["xrefs"]:
+                entry["xrefs"].append(image["xref"])
+            entry["pages"].append([image["page_index"], image["img_idx"]])
+        return manifest
+    
+    def upload_extracted_images(self, ingest_result: Dict[str, Any], session_id: str, bucket_name: str,
+                                upload_timings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Upload the distinct images from an ingest result in parallel and build the image metadata.
+        
+        Every distinct image (see build_image_manifest) is uploaded once; each page
+        lists the URLs of the images placed on it, and paper_image_urls lists every
+        distinct image once. Upload timings are logged rather than returned, since
+        the metadata is stored with the paper.
+        
+        Args:
+            ingest_result (Dict[str, Any]): Result of ingest_pdf or extract_from_pdf_bytes
+            session_id (str): Session identifier for organizing uploads
+            bucket_name (str): Name of the GCS bucket for storing images
+            upload_timings (list): Optional list that receives digest, bytes, attempts,
+                seconds and image_url of every upload
+            
+        Returns:
+            Dict[str, Any]: Dictionary containing extracted metadata and image URLs
+        """
+        file_256_hash = ingest_result["file_256_hash"]
+        total_pages = ingest_result["total_pages"]
+        
+        # Initialize result structure
+        result = {
+            "file_256_hash": file_256_hash,
+            "images_in_doc": [],
+            "paper_image_urls": [],
+            "total_images": 0,
+            "distinct_images": 0,
+            "page_details": [],
+            "image_manifest": []
+        }
+        
+        images_by_page: Dict[int, List[Dict[str, Any]]] = {}
+        for image in ingest_result["images"]:
+            images_by_page.setdefault(image["page_index"], []).append(image)
+        
+        manifest = self.build_image_manifest(ingest_result["images"], file_256_hash)
+        result["distinct_images"] = len(manifest)
+        
+        # Upload every distinct image concurrently through the shared client
+        def upload(entry: Dict[str, Any]) -> Tuple[Optional[str], int, float]:
+            return self._upload_with_retry(entry["image"], entry["filename"], session_id, bucket_name)
+        
+        upload_start = time.time()
+        if manifest:
+            with ThreadPoolExecutor(max_workers=min(self.UPLOAD_WORKERS, len(manifest))) as executor:
+                uploads = list(executor.map(upload, manifest))
+        else:
+            uploads = []
+        
+        upload_seconds = time.time() - upload_start
+        
+        urls_by_digest: Dict[str, Optional[str]] = {}
+        timings: List[Dict[str, Any]] = []
+        for entry, (image_url, attempts, seconds) in zip(manifest, uploads):
+            urls_by_digest[entry["digest"]] = image_url
+            timings.append({
+                "digest": entry["digest"],
+                "bytes": entry["bytes"],
+                "attempts": attempts,
+                "seconds": round(seconds, 3),
+                "image_url": image_url
+            })
+            result["image_manifest"].append({
+                "digest": entry["digest"],
+                "filename": entry["filename"],
+                "image_url": image_url,
+                "bytes": entry["bytes"],
+                "xrefs": entry["xrefs"],
+                "pages": entry["pages"]
+            })
+            if image_url:
+                result["paper_image_urls"].append(image_url)
+            else:
+                print(f"Error uploading image {entry['filename']} first placed on page {entry['pages'][0][0] + 1}")
+        
+        # Process each page
+        for page_num in range(total_pages):
+            page_images = images_by_page.get(page_num, [])
+            
+            page_info = {
+                "page_index": page_num,
+                "total_pages": total_pages,
+                "has_images": len(page_images) > 0,
+                "num_images": len(page_images),
+                "image_urls": []
+            }
+            
+            for image in page_images:
+                image_url = urls_by_digest.get(image.get("digest"))
+                if image_url and image_url not in page_info["image_urls"]:
+                    page_info["image_urls"].append(image_url)
+            
+            # Update total_images count and append page info
+            result["total_images"] += page_info["num_images"]
+            result["images_in_doc"].append(page_info)
+            
+            if page_info["has_images"]:
+                result["page_details"].append({
+                    "page_index": page_num,
+                    "num_images": page_info["num_images"],
+                    "image_urls": page_info["image_urls"]
+                })
+        
+        if upload_timings is not None:
+            upload_timings.extend(timings)
+        slowest = max(timings, key=lambda timing: timing["seconds"], default=None)
+        logger.info(
+            f"Uploaded {len([url for url in urls_by_digest.values() if url])} of {len(manifest)} distinct images "
+            f"({result['total_images']} placements) in {upload_seconds:.2f}s, "
+            f"{sum(timing['attempts'] - 1 for timing in timings)} retries"
+            + (f", slowest {slowest['seconds']}s ({slowest['bytes']} bytes)" if slowest else "")
+        )
+        for timing in timings:
+            logger.debug(f"Uploaded image {timing['digest'][:16]}: {timing['bytes']} bytes, "
+                         f"{timing['attempts']} attempts, {timing['seconds']}s")
+        return result
     
     def extract_text_from_pdf(self, pdf_url: str) -> Tuple[str, str, str]:
         """
-        Downloads PDF from URL to temp directory, extracts text content, and returns
+        Downloads PDF from URL into memory, extracts text content, and returns
         the full text, first two pages of text, and filename.
         
         Args:
@@ -83,48 +639,17 @@ class PDFOps:
                 - first_two_pages_text_content: Text content from first two pages only
                 - filename: Original filename from the PDF URL
         """
-        temp_dir = None
         try:
-            # Extract filename from URL
-            parsed_url = urlparse(pdf_url)
-            filename = os.path.basename(parsed_url.path)
-            if not filename.lower().endswith('.pdf'):
-                filename = 'unnamed.pdf'
-            
-            # Create temporary directory and file
-            temp_dir = tempfile.mkdtemp()
-            temp_pdf_path = os.path.join(temp_dir, 'temp.pdf')
-            
-            # Download PDF
-            self._download_pdf(pdf_url, temp_pdf_path)
-            
-            # Extract text using PyMuPDF
-            doc = fitz.open(temp_pdf_path)
-            
-            try:
-                # Process all pages for complete text
-                entire_pdf_text_content = ""
-                for page in doc:
-                    entire_pdf_text_content += page.get_text()
-                
-                # Process first two pages separately
-                first_two_pages_text_content = ""
-                for page_num in range(min(2, doc.page_count)):
-                    first_two_pages_text_content += doc[page_num].get_text()
-                
-                return entire_pdf_text_content, first_two_pages_text_content, filename
-                
-            finally:
-                doc.close()
+            ingest_result = self.ingest_pdf(pdf_url)
+            return (
+                ingest_result["full_text"],
+                ingest_result["first_two_pages_text"],
+                ingest_result["filename"]
+            )
             
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
             return "", "", ""
-            
-        finally:
-            # Clean up temp directory and its contents
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
 
     def upload_to_gcs(self, image_content: bytes, filename: str, session_id: str, bucket_name: str) -> Optional[str]:
         """
@@ -139,23 +664,43 @@ class PDFOps:
         Returns:
             Optional[str]: Public URL of uploaded image or None if upload fails
         """
-        try:
-            client = self._get_storage_client()
-            bucket = client.bucket(bucket_name)
+        image_url, _, _ = self._upload_with_retry(image_content, filename, session_id, bucket_name)
+        return image_url
 
-            # Create blob path using session ID and filename
-            blob_path = f"{session_id}/{filename}"
-            blob = bucket.blob(blob_path)
+    def _upload_with_retry(self, image_content: bytes, filename: str, session_id: str,
+                           bucket_name: str) -> Tuple[Optional[str], int, float]:
+        """
+        Upload an image, retrying transient errors with exponential backoff.
+        
+        Returns:
+            Tuple[Optional[str], int, float]: Public URL (or None), attempts made, seconds taken
+        """
+        start_time = time.time()
+        # Create blob path using session ID and filename
+        blob_path = f"{session_id}/{filename}"
+        
+        for attempt in range(1, self.UPLOAD_MAX_ATTEMPTS + 1):
+            try:
+                bucket = self._get_storage_client().bucket(bucket_name)
+                blob = bucket.blob(blob_path)
 
-            # Upload image
-            blob.upload_from_string(image_content, content_type='image/jpeg')
+                # Upload image
+                blob.upload_from_string(image_content, content_type='image/jpeg')
 
-            # Generate public URL
-            return f"https://storage.googleapis.com/{bucket_name}/{blob_path}"
+                # Generate public URL
+                return f"https://storage.googleapis.com/{bucket_name}/{blob_path}", attempt, time.time() - start_time
 
-        except Exception as e:
-            print(f"Error uploading to GCS: {str(e)}")
-            return None
+            except _TRANSIENT_UPLOAD_ERRORS as e:
+                if attempt == self.UPLOAD_MAX_ATTEMPTS:
+                    print(f"Error uploading to GCS after {attempt} attempts: {str(e)}")
+                    break
+                time.sleep(self.UPLOAD_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+            except Exception as e:
+                print(f"Error uploading to GCS: {str(e)}")
+                break
+        
+        return None, attempt, time.time() - start_time
 
     def extract_images_and_metadata(self, pdf_url: str, session_id: str, bucket_name: str) -> Optional[Dict[str, Any]]:
         """
@@ -169,102 +714,22 @@ class PDFOps:
         Returns:
             Optional[Dict[str, Any]]: Dictionary containing extracted metadata and image URLs
         """
-        temp_dir = None
-        temp_path = None
-        
         try:
-            # Convert GCS URL to direct download URL if needed
-            pdf_url = pdf_url.replace("storage.cloud.google.com", "storage.googleapis.com")
-
-            # Create temporary directory and file
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, 'temp.pdf')
-            
-            # Download PDF and get content
-            pdf_content = self._download_pdf(pdf_url, temp_path)
-            file_256_hash = self._get_file_hash(pdf_content)
-
-            # Open PDF with PyMuPDF
-            pdf_document = fitz.open(temp_path)
+            ingest_result = self.ingest_pdf(pdf_url)
+            return self.upload_extracted_images(ingest_result, session_id, bucket_name)
             
-            try:
-                total_pages = len(pdf_document)
-                
-                # Initialize result structure
-                result = {
-                    "file_256_hash": file_256_hash,
-                    "images_in_doc": [],
-                    "paper_image_urls": [],
-                    "total_images": 0,
-                    "page_details": []
-                }
-
-                # Process each page
-                for page_num in range(total_pages):
-                    page = pdf_document[page_num]
-                    image_list = page.get_images()
-
-                    page_info = {
-                        "page_index": page_num,
-                        "total_pages": total_pages,
-                        "has_images": len(image_list) > 0,
-                        "num_images": len(image_list),
-                        "image_urls": []
-                    }
-
-                    if image_list:
-                        for img_idx, img in enumerate(image_list, 1):
-                            try:
-                                # Extract and upload image
-                                xref = img[0]
-                                base_image = pdf_document.extract_image(xref)
-                                image_filename = f"{file_256_hash}_image_{img_idx}.jpeg"
-                                
-                                image_url = self.upload_to_gcs(
-                                    image_content=base_image["image"],
-                                    filename=image_filename,
-                                    session_id=session_id,
-                                    bucket_name=bucket_name
-                                )
-
-                                if image_url:
-                                    page_info["image_urls"].append(image_url)
-                                    result["paper_image_urls"].append(image_url)
-
-                            except Exception as e:
-                                print(f"Error processing image {img_idx} on page {page_num + 1}: {str(e)}")
-
-                    # Update total_images count and append page info
-                    result["total_images"] += page_info["num_images"]
-                    result["images_in_doc"].append(page_info)
-
-                    if page_info["has_images"]:
-                        result["page_details"].append({
-                            "page_index": page_num,
-                            "num_images": page_info["num_images"],
-                            "image_urls": page_info["image_urls"]
-                        })
-
-                return result
-
-            finally:
-                pdf_document.close()
-
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
             return None
-            
-        finally:
-            # Clean up temporary files
-            if temp_path and os.path.exists(temp_path):
-                os.unlink(temp_path)
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
 
 
 # Example usage:
 # pdf_ops = PDFOps()
 #
+# # Download once and get text, images and hash in a single pass
+# ingest_result = pdf_ops.ingest_pdf("https://example.com/sample.pdf")
+# metadata = pdf_ops.upload_extracted_images(ingest_result, "unique_session_id", "your-gcs-bucket-name")
+#
 # # Extract text and get first two pages preview
 # full_text, first_two_pages, filename = pdf_ops.extract_text_from_pdf("https://example.com/sample.pdf")
 # print(f"Filename: {filename}")
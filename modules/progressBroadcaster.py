@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Queued for a subscriber that fell behind: it gets a fresh snapshot instead of the missed events
+_RESYNC = object()
+
+
+class ProgressSubscriber:
+    """One Server-Sent Events client of a topic."""
+
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def offer(self, event: str, data: Dict[str, Any]) -> None:
+        """Queue an event without blocking the producer; a full queue turns into a resync."""
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(_RESYNC)
+
+
+class ProgressBroadcaster:
+    """
+    Fans progress of long-running jobs out to Server-Sent Events streams.
+
+    One producer thread per worker reads each watched topic's changes through
+    fetch_fn and pushes them to every subscriber of that topic, so the cost of
+    reading progress does not grow with the number of open pages. The producer
+    wakes up at once when notify() is called by the code doing the work in this
+    worker, and every POLL_INTERVAL_SECONDS otherwise to pick up progress made
+    by other workers. Idle streams get a heartbeat comment every
+    HEARTBEAT_SECONDS so proxies keep them open.
+
+    Each open stream holds a server thread, so a worker serves at most
+    MAX_STREAMS of them; callers check has_capacity() and send further
+    clients to the polling endpoint instead.
+    """
+
+    POLL_INTERVAL_SECONDS = float(os.getenv('PROGRESS_POLL_INTERVAL_SECONDS', '0.5'))
+    HEARTBEAT_SECONDS = float(os.getenv('PROGRESS_HEARTBEAT_SECONDS', '15'))
+    MAX_STREAM_SECONDS = float(os.getenv('PROGRESS_MAX_STREAM_SECONDS', '600'))
+    MAX_STREAMS = int(os.getenv('PROGRESS_MAX_STREAMS', '2'))
+    QUEUE_SIZE = 256
+
+    def __init__(self, fetch_fn: Callable[[str, int], Optional[Tuple[Dict[str, Any], int, bool]]],
+                 poll_interval: Optional[float] = None, heartbeat_seconds: Optional[float] = None,
+                 max_stream_seconds: Optional[float] = None, max_streams: Optional[int] = None):
+        """
+        Initialize the broadcaster.
+
+        Args:
+            fetch_fn (callable): Called with (topic, cursor); returns (data, new_cursor, finished)
+                with the changes after cursor (data is None if nothing changed), or None
+                for an unknown topic. Cursor 0 asks for a full snapshot.
+            poll_interval (float): Seconds between checks for progress made by other workers
+            heartbeat_seconds (float): Idle time after which a heartbeat is sent
+            max_stream_seconds (float): Lifetime of one stream; EventSource reconnects after it
+            max_streams (int): Streams this worker serves at once
+        """
+        self.fetch_fn = fetch_fn
+        self.poll_interval = self.POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        self.heartbeat_seconds = self.HEARTBEAT_SECONDS if heartbeat_seconds is None else heartbeat_seconds
+        self.max_stream_seconds = self.MAX_STREAM_SECONDS if max_stream_seconds is None else max_stream_seconds
+        self.max_streams = self.MAX_STREAMS if max_streams is None else max_streams
+        self._subscribers: Dict[str, List[ProgressSubscriber]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'subscribers': 0, 'fetches': 0, 'events': 0, 'heartbeats': 0, 'resyncs': 0, 'rejected': 0}
+
+    def notify(self) -> None:
+        """Wake the producer because progress was just made in this worker."""
+        self._wakeup.set()
+
+    def has_capacity(self) -> bool:
+        """
+        Check whether another stream may be opened, counting a refusal if not.
+
+        The check is not reserved for the caller, so a few concurrent openers may
+        exceed max_streams by one or two streams.
+        """
+        with self._lock:
+            if self.stats['subscribers'] < self.max_streams:
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def _ensure_producer(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='progress-broadcaster', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                topics = {topic: self._cursors.get(topic, 0) for topic, subscribers in self._subscribers.items() if subscribers}
+            for topic, cursor in topics.items():
+                try:
+                    self._produce(topic, cursor)
+                except Exception as e:
+                    logger.error(f"Error reading progress of {topic}: {str(e)}")
+
+    def _produce(self, topic: str, cursor: int) -> None:
+        result = self.fetch_fn(topic, cursor)
+        with self._lock:
+            self.stats['fetches'] += 1
+        if result is None:
+            return
+        data, new_cursor, finished = result
+        with self._lock:
+            self._cursors[topic] = new_cursor
+            subscribers = list(self._subscribers.get(topic, ()))
+            if data is not None:
+                self.stats['events'] += len(subscribers)
+        if data is not None:
+            for subscriber in subscribers:
+                subscriber.offer('progress', data)
+        if finished:
+            for subscriber in subscribers:
+                subscriber.offer('done', {})
+
+    def _subscribe(self, topic: str) -> ProgressSubscriber:
+        subscriber = ProgressSubscriber(topic, self.QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(subscriber)
+            self._cursors.setdefault(topic, 0)
+            self.stats['subscribers'] += 1
+        self._ensure_producer()
+        return subscriber
+
+    def _unsubscribe(self, subscriber: ProgressSubscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.topic, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+                self.stats['subscribers'] -= 1
+            if not subscribers:
+                self._subscribers.pop(subscriber.topic, None)
+                self._cursors.pop(subscriber.topic, None)
+
+    @staticmethod
+    def format_event(event: str, data: Dict[str, Any]) -> str:
+        """Encode one Server-Sent Event."""
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def _snapshot(self, topic: str) -> Optional[Tuple[Dict[str, Any], bool]]:
+        result = self.fetch_fn(topic, 0)
+        if result is None:
+            return None
+        data, cursor, finished = result
+        with self._lock:
+            # A topic nobody was watching yet continues from the snapshot, not from the start
+            if self._cursors.get(topic) == 0:
+                self._cursors[topic] = cursor
+        return data, finished
+
+    def stream(self, topic: str) -> Iterator[str]:
+        """
+        Yield the Server-Sent Events of a topic: a snapshot, then changes as they happen.
+
+        The stream ends after the topic's 'done' event, after MAX_STREAM_SECONDS,
+        or when the client disconnects.
+        """
+        subscriber = self._subscribe(topic)
+        started = time.time()
+        try:
+            # Registered before the snapshot is read, so no change falls in between
+            snapshot = self._snapshot(topic)
+            if snapshot is None:
+                yield self.format_event('error', {'error': f"Unknown topic {topic}"})
+                return
+            yield "retry: 2000\n\n" + self.format_event('progress', snapshot[0])
+            if snapshot[1]:
+                yield self.format_event('done', {})
+                return
+
+            while time.time() - started < self.max_stream_seconds:
+                try:
+                    item = subscriber.queue.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    with self._lock:
+                        self.stats['heartbeats'] += 1
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if item is _RESYNC:
+                    with self._lock:
+                        self.stats['resyncs'] += 1
+                    snapshot = self._snapshot(topic)
+                    if snapshot is None:
+                        return
+                    item = ('progress', snapshot[0])
+                event, data = item
+                yield self.format_event(event, data)
+                if event == 'done':
+                    return
+        finally:
+            self._unsubscribe(subscriber)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return subscriber, fetch and event counters and the number of watched topics."""
+        with self._lock:
+            return dict(self.stats, topics=len(self._subscribers))
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously at a fixed rate per minute.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket full.
+
+        Args:
+            rate_per_minute (float): Tokens added per minute
+            capacity (float): Maximum tokens held; defaults to one minute's worth
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens if available.
+
+        Args:
+            tokens (float): Number of tokens to take (capped at the bucket capacity)
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate_per_second
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Block until tokens are available and take them.
+
+        Returns:
+            float: Total seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time <= 0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+class AnthropicRateLimiter:
+    """
+    Client-side limiter that follows the Anthropic per-minute limits on requests
+    and input tokens. Limits come from CLAUDE_REQUESTS_PER_MINUTE and
+    CLAUDE_INPUT_TOKENS_PER_MINUTE, matching the organization's rate-limit tier.
+    """
+
+    # Rough characters-per-token ratio used to estimate prompt size before sending
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 input_tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(
+            requests_per_minute or float(os.getenv('CLAUDE_REQUESTS_PER_MINUTE', '50'))
+        )
+        self.input_tokens = TokenBucket(
+            input_tokens_per_minute or float(os.getenv('CLAUDE_INPUT_TOKENS_PER_MINUTE', '40000'))
+        )
+
+    @classmethod
+    def estimate_tokens(cls, text: str) -> int:
+        """Estimate the number of input tokens in a prompt text."""
+        return len(text or '') // cls.CHARS_PER_TOKEN + 1
+
+    def acquire(self, prompt_text: str = '', requests: int = 1) -> float:
+        """
+        Block until a request with the given prompt text fits within the limits.
+
+        Returns:
+            float: Total seconds spent waiting
+        """
+        waited = self.requests.acquire(requests)
+        waited += self.input_tokens.acquire(self.estimate_tokens(prompt_text) * requests)
+        if waited > 0:
+            logger.info(f"Rate limiter delayed Claude request by {waited:.1f}s")
+        return waited
@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ReadAheadCache:
+    """
+    Bounded cache of per-image payloads filled ahead of sequential navigation.
+
+    When image N is served, prefetch_around() loads the images within the
+    window on either side of N on a small thread pool. Each payload is stored
+    with the image version it was built from and is only served while that
+    version is current and the entry is younger than the TTL, so edits made
+    after a prefetch are never hidden.
+    """
+
+    WINDOW = int(os.getenv('DIATOMS_PREFETCH_WINDOW', '2'))
+    MAX_ENTRIES = int(os.getenv('DIATOMS_PREFETCH_MAX_ENTRIES', '32'))
+    TTL_SECONDS = float(os.getenv('DIATOMS_PREFETCH_TTL_SECONDS', '60'))
+    WORKERS = int(os.getenv('DIATOMS_PREFETCH_WORKERS', '2'))
+
+    def __init__(self, load_fn: Callable[[int], Optional[Tuple[Any, Any]]],
+                 version_fn: Callable[[int], Any], window: Optional[int] = None,
+                 max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 workers: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            load_fn (callable): Builds the payload for an index and returns (version, payload),
+                or None if there is nothing to cache
+            version_fn (callable): Returns the current version of an index
+            window (int): Number of images prefetched on each side; 0 disables read-ahead
+            max_entries (int): Number of payloads kept
+            ttl_seconds (float): Maximum age of a served payload
+            workers (int): Background loader threads
+        """
+        self.load_fn = load_fn
+        self.version_fn = version_fn
+        self.window = self.WINDOW if window is None else window
+        self.max_entries = self.MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = self.TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.WORKERS if workers is None else workers))
+        self._entries: "OrderedDict[int, Tuple[Any, float, Any]]" = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'prefetched': 0, 'prefetch_errors': 0, 'evicted_unused': 0}
+        self._unused = set()
+
+    def get(self, index: int) -> Optional[Any]:
+        """
+        Take the prefetched payload for an index if it is still current.
+
+        Returns:
+            Optional[Any]: The payload, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.pop(index, None)
+            self._unused.discard(index)
+        if entry is not None:
+            version, loaded_at, payload = entry
+            if version == self.version_fn(index) and time.time() - loaded_at <= self.ttl_seconds:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return payload
+            with self._lock:
+                self.stats['stale'] += 1
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def prefetch_around(self, index: int, total: int) -> None:
+        """Schedule background loads for the images within the window around index."""
+        if self.window <= 0:
+            return
+        # Nearest neighbours first, the next image before the previous one
+        for distance in range(1, self.window + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < total:
+                    self._schedule(neighbour)
+
+    def _schedule(self, index: int) -> None:
+        with self._lock:
+            entry = self._entries.get(index)
+            if index in self._in_flight or (entry is not None and time.time() - entry[1] <= self.ttl_seconds):
+                return
+            self._in_flight.add(index)
+        self._executor.submit(self._load, index)
+
+    def _load(self, index: int) -> None:
+        try:
+            result = self.load_fn(index)
+            if result is None:
+                return
+            version, payload = result
+            with self._lock:
+                self._entries[index] = (version, time.time(), payload)
+                self._entries.move_to_end(index)
+                self._unused.add(index)
+                self.stats['prefetched'] += 1
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    if evicted in self._unused:
+                        self._unused.discard(evicted)
+                        self.stats['evicted_unused'] += 1
+        except Exception as e:
+            logger.error(f"Error prefetching image {index}: {str(e)}")
+            with self._lock:
+                self.stats['prefetch_errors'] += 1
+        finally:
+            with self._lock:
+                self._in_flight.discard(index)
+
+    def invalidate(self, index: Optional[int] = None) -> None:
+        """Drop one prefetched payload, or all of them when index is None."""
+        with self._lock:
+            if index is None:
+                self._entries.clear()
+                self._unused.clear()
+            else:
+                self._entries.pop(index, None)
+                self._unused.discard(index)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, the window and the number of cached payloads."""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                window=self.window,
+                entries=len(self._entries),
+                in_flight=len(self._in_flight),
+                hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+            )
+
+    def close(self) -> None:
+        """Stop the background loaders."""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,85 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class SegmentationCache:
+    """
+    Bounded LRU of segmentation files keyed by URL and GCS generation.
+
+    Entries hold the loaded value (segmentation text or a parsed
+    SegmentationContainer) together with the object generation it was read
+    at. Readers revalidate by downloading with if_generation_not_match, so an
+    unchanged file costs a single 304 round trip instead of a full download;
+    local saves write their new generation straight into the cache.
+    """
+
+    MAX_ENTRIES = int(os.getenv('SEGMENTATION_CACHE_ENTRIES', '512'))
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Number of files kept; defaults to SEGMENTATION_CACHE_ENTRIES
+        """
+        self.max_entries = max_entries if max_entries is not None else self.MAX_ENTRIES
+        self._entries: "OrderedDict[str, Tuple[Optional[int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+    def get(self, url: str) -> Optional[Tuple[Optional[int], Any]]:
+        """
+        Look up a cached file without revalidating it.
+
+        Returns:
+            Optional[Tuple[Optional[int], Any]]: (generation, value), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url: str, generation: Optional[int], value: Any) -> None:
+        """Store a file's value at the given generation, evicting the least recently used."""
+        if generation is None:
+            # Without a generation the entry could never be revalidated
+            self.invalidate(url)
+            return
+        with self._lock:
+            self._entries[url] = (generation, value)
+            self._entries.move_to_end(url)
+            self.stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        """Drop a file from the cache."""
+        with self._lock:
+            if self._entries.pop(url, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def record(self, outcome: str) -> None:
+        """Count a lookup outcome: 'hits' (revalidated as unchanged) or 'misses'."""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of cached files."""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+            )
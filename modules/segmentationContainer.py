@@ -0,0 +1,314 @@
+import struct
+import logging
+from typing import List, Dict, Any, Optional, Union
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class SegmentationContainer:
+    """
+    Compact binary form of a YOLO segmentation file.
+
+    Layout (little-endian, every section 8-byte aligned):
+        header   magic b'DSEG', version, coordinate dtype code, flags,
+                 polygon count, coordinate count, uint16 scale
+        labels   int32[count]
+        offsets  uint64[count + 1], polygon i is coords[offsets[i]:offsets[i + 1]]
+        coords   float32 | float64 | uint16 normalized x,y pairs
+        pixels   float64 denormalized x,y pairs (optional, FLAG_PIXEL_COORDS)
+
+    from_bytes() maps the arrays straight onto the buffer without copying.
+    With dtype='auto' the normalized coordinates are stored as float32 only
+    when every value reads back as the same decimal, so the YOLO text
+    round trip is lossless; uint16 is a lossy option for compact exports.
+    """
+
+    MAGIC = b'DSEG'
+    VERSION = 1
+    FLAG_PIXEL_COORDS = 0x01
+    UINT16_SCALE = 65535.0
+
+    _HEADER = struct.Struct('<4sHBBIQd')
+    _HEADER_SIZE = 32
+    _DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f8'), 3: np.dtype('<u2')}
+    _DTYPE_CODES = {'float32': 1, 'float64': 2, 'uint16': 3}
+
+    # Segmentation index fields that duplicate the polygon coordinates
+    POLYGON_FIELDS = ('norm_polygon_points', 'denorm_polygon_points', 'denorm_xs', 'denorm_ys')
+
+    def __init__(self, labels: np.ndarray, offsets: np.ndarray, coords: np.ndarray,
+                 pixel_coords: Optional[np.ndarray] = None, scale: float = 1.0):
+        """
+        Args:
+            labels: int32 class label per polygon
+            offsets: uint64 start of each polygon in coords, plus the total length
+            coords: normalized x,y pairs of all polygons back to back
+            pixel_coords: denormalized x,y pairs with the same layout as coords
+            scale: divisor that turns uint16 coords back into normalized values
+        """
+        self.labels = labels
+        self.offsets = offsets
+        self.coords = coords
+        self.pixel_coords = pixel_coords
+        self.scale = scale
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    # ------------------------------------------------------------------ YOLO text
+
+    @classmethod
+    def from_yolo_text(cls, text: str, dtype: str = 'auto',
+                       pixel_coords: Optional[List[float]] = None) -> 'SegmentationContainer':
+        """
+        Pack YOLO segmentation text ("label x1 y1 x2 y2 ..." per line).
+
+        Args:
+            text: Segmentation file content
+            dtype: 'auto', 'float32', 'float64' or 'uint16' for the normalized coordinates
+            pixel_coords: Optional denormalized coordinates, same layout as the text's
+
+        Returns:
+            SegmentationContainer: The packed segmentations
+
+        Raises:
+            ValueError: If a line is not a label followed by an even number of finite numbers
+        """
+        labels, lengths, tokens = [], [], []
+        for line_number, line in enumerate(text.strip().split('\n')):
+            parts = line.split()
+            if len(parts) < 3 or (len(parts) - 1) % 2:
+                raise ValueError(f"Line {line_number} is not a YOLO polygon")
+            labels.append(int(parts[0]))
+            lengths.append(len(parts) - 1)
+            tokens.extend(parts[1:])
+
+        values = np.array(tokens, dtype=np.float64)
+        if not np.isfinite(values).all():
+            raise ValueError("Segmentation coordinates must be finite")
+
+        offsets = np.zeros(len(lengths) + 1, dtype='<u8')
+        np.cumsum(lengths, out=offsets[1:])
+
+        scale = 1.0
+        if dtype == 'auto':
+            as_float32 = values.astype('<f4')
+            # float32 is lossless when each value's shortest float32 decimal is the original value
+            dtype = 'float32' if np.array_equal(as_float32.astype(str).astype(np.float64), values) else 'float64'
+        if dtype == 'float32':
+            coords = values.astype('<f4')
+        elif dtype == 'float64':
+            coords = values.astype('<f8')
+        elif dtype == 'uint16':
+            scale = cls.UINT16_SCALE
+            coords = np.rint(np.clip(values, 0.0, 1.0) * scale).astype('<u2')
+        else:
+            raise ValueError(f"Unsupported coordinate dtype: {dtype}")
+
+        pixels = None
+        if pixel_coords is not None:
+            pixels = np.asarray(pixel_coords, dtype='<f8')
+            if pixels.shape != values.shape:
+                raise ValueError("pixel_coords must have one value per normalized coordinate")
+
+        return cls(np.array(labels, dtype='<i4'), offsets, coords, pixels, scale)
+
+    @staticmethod
+    def _format_value(value: Union[np.floating, float]) -> str:
+        # Shortest decimal that reads back as the stored value, without a trailing ".0"
+        return np.format_float_positional(value, unique=True, trim='-')
+
+    def normalized_values(self) -> np.ndarray:
+        """
+        Normalized coordinates as float64, equal to the decimals they were parsed from.
+
+        Returns:
+            np.ndarray: float64 x,y pairs of all polygons
+        """
+        if self.coords.dtype == np.float32:
+            return self.coords.astype(str).astype(np.float64)
+        if self.coords.dtype == np.uint16:
+            return self.coords.astype(np.float64) / self.scale
+        return self.coords.astype(np.float64)
+
+    def to_yolo_text(self) -> str:
+        """
+        Convert back to YOLO segmentation text.
+
+        Returns:
+            str: One "label x1 y1 ..." line per polygon
+        """
+        if self.coords.dtype == np.float32:
+            values = self.coords
+        else:
+            values = self.normalized_values()
+        lines = []
+        for i in range(len(self)):
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            points = ' '.join(self._format_value(value) for value in values[start:end])
+            lines.append(f"{int(self.labels[i])} {points}")
+        return '\n'.join(lines)
+
+    # ------------------------------------------------------------------ binary
+
+    @staticmethod
+    def _padded(size: int) -> int:
+        return (size + 7) & ~7
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the container.
+
+        Returns:
+            bytes: Binary container
+        """
+        flags = self.FLAG_PIXEL_COORDS if self.pixel_coords is not None else 0
+        dtype_code = self._DTYPE_CODES[self.coords.dtype.name]
+        header = self._HEADER.pack(
+            self.MAGIC, self.VERSION, dtype_code, flags, len(self.labels), len(self.coords), self.scale
+        )
+        sections = [
+            header.ljust(self._HEADER_SIZE, b'\0'),
+            self.labels.astype('<i4').tobytes(),
+            self.offsets.astype('<u8').tobytes(),
+            self.coords.astype(self._DTYPES[dtype_code]).tobytes()
+        ]
+        if self.pixel_coords is not None:
+            sections.append(self.pixel_coords.astype('<f8').tobytes())
+        return b''.join(section.ljust(self._padded(len(section)), b'\0') for section in sections)
+
+    @classmethod
+    def from_bytes(cls, buffer: Union[bytes, bytearray, memoryview]) -> 'SegmentationContainer':
+        """
+        Map a binary container onto NumPy arrays without copying.
+
+        Args:
+            buffer: Binary container, e.g. a downloaded blob or an mmap
+
+        Returns:
+            SegmentationContainer: Read-only view over the buffer
+
+        Raises:
+            ValueError: If the buffer is not a supported container
+        """
+        if len(buffer) < cls._HEADER_SIZE:
+            raise ValueError("Buffer is too small for a segmentation container")
+        magic, version, dtype_code, flags, count, coord_count, scale = cls._HEADER.unpack_from(buffer, 0)
+        if magic != cls.MAGIC or version != cls.VERSION or dtype_code not in cls._DTYPES:
+            raise ValueError("Not a supported segmentation container")
+
+        position = cls._HEADER_SIZE
+        labels = np.frombuffer(buffer, dtype='<i4', count=count, offset=position)
+        position += cls._padded(labels.nbytes)
+        offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=position)
+        position += cls._padded(offsets.nbytes)
+        coords = np.frombuffer(buffer, dtype=cls._DTYPES[dtype_code], count=coord_count, offset=position)
+        position += cls._padded(coords.nbytes)
+        pixel_coords = None
+        if flags & cls.FLAG_PIXEL_COORDS:
+            pixel_coords = np.frombuffer(buffer, dtype='<f8', count=coord_count, offset=position)
+        return cls(labels, offsets, coords, pixel_coords, scale)
+
+    # ------------------------------------------------------------------ index entries
+
+    @classmethod
+    def from_segmentation_indices(cls, segmentation_text: str,
+                                  segmentation_indices: List[Dict[str, Any]]) -> 'SegmentationContainer':
+        """
+        Pack a saved segmentation: normalized points from the YOLO text and the
+        denormalized points from the matching segmentation index entries.
+
+        Raises:
+            ValueError: If the text and the entries do not describe the same polygons
+        """
+        pixel_coords = []
+        for entry in segmentation_indices:
+            for point in entry.get('denorm_polygon_points') or []:
+                pixel_coords.extend([point['x'], point['y']])
+        container = cls.from_yolo_text(segmentation_text)
+        if len(container) != len(segmentation_indices) or len(pixel_coords) != len(container.coords):
+            raise ValueError("Segmentation text and indices describe different polygons")
+        container.pixel_coords = np.asarray(pixel_coords, dtype='<f8')
+        return container
+
+    def polygon_fields(self, i: int) -> Dict[str, Any]:
+        """
+        Rebuild the coordinate fields of segmentation index entry i.
+
+        Returns:
+            dict: norm_polygon_points, denorm_polygon_points, denorm_xs and denorm_ys
+        """
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        # Whole numbers come back as ints, the way the browser serialized them
+        norm = [int(v) if v.is_integer() else v for v in self.normalized_values()[start:end].tolist()]
+        fields = {'norm_polygon_points': [{'x': x, 'y': y} for x, y in zip(norm[0::2], norm[1::2])]}
+        if self.pixel_coords is not None:
+            pixels = [int(v) if v.is_integer() else v for v in self.pixel_coords[start:end].tolist()]
+            xs = pixels[0::2]
+            ys = pixels[1::2]
+            fields.update({
+                'denorm_polygon_points': [{'x': x, 'y': y} for x, y in zip(xs, ys)],
+                'denorm_xs': xs,
+                'denorm_ys': ys
+            })
+        return fields
+
+    def compact_indices(self, segmentation_indices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Replace the duplicated coordinate lists of index entries with a polygon_ref
+        into this container. Entries that would not rehydrate exactly are kept whole.
+
+        Returns:
+            list: New entry dicts
+        """
+        compacted = []
+        for i, entry in enumerate(segmentation_indices):
+            if i < len(self) and self.pixel_coords is not None and \
+                    {field: entry.get(field) for field in self.POLYGON_FIELDS} == self.polygon_fields(i):
+                entry = {key: value for key, value in entry.items() if key not in self.POLYGON_FIELDS}
+                entry['polygon_ref'] = i
+            compacted.append(entry)
+        return compacted
+
+    def hydrate_indices(self, segmentation_indices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Restore the coordinate lists of entries stored with a polygon_ref.
+
+        Returns:
+            list: New entry dicts; entries without a valid polygon_ref are returned as they are
+        """
+        hydrated = []
+        for entry in segmentation_indices:
+            polygon_ref = entry.get('polygon_ref') if isinstance(entry, dict) else None
+            if isinstance(polygon_ref, int) and 0 <= polygon_ref < len(self):
+                entry = dict(entry, **self.polygon_fields(polygon_ref))
+                entry.pop('polygon_ref')
+            hydrated.append(entry)
+        return hydrated
+
+    def without(self, i: int) -> 'SegmentationContainer':
+        """
+        Copy of the container with polygon i removed.
+
+        Returns:
+            SegmentationContainer: New container
+        """
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        offsets = np.concatenate([self.offsets[:i], self.offsets[i + 1:] - (end - start)]).astype('<u8')
+        pixel_coords = None
+        if self.pixel_coords is not None:
+            pixel_coords = np.concatenate([self.pixel_coords[:start], self.pixel_coords[end:]])
+        return SegmentationContainer(
+            np.delete(self.labels, i),
+            offsets,
+            np.concatenate([self.coords[:start], self.coords[end:]]),
+            pixel_coords,
+            self.scale
+        )
@@ -1,10 +1,21 @@
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
+from .spatialIndex import BBoxGridIndex
 
 class SegmentationOps:
-    def __init__(self):
+    # Largest coordinate that still rounds exactly like Python's round() once cast to int64
+    _MAX_EXACT_COORDINATE = 2.0 ** 53
+
+    def __init__(self, backend: str = 'numpy'):
+        """
+        Args:
+            backend: 'numpy' for the vectorized engine or 'python' for the per-point loop.
+                The numpy engine produces identical output and falls back to the
+                Python path for input it cannot handle exactly.
+        """
         self.logger = logging.getLogger(__name__)
+        self.backend = backend
 
     def normalize_coordinates(self, x: float, y: float, image_width: float, image_height: float) -> Tuple[float, float]:
         """
@@ -122,16 +133,26 @@ class SegmentationOps:
             return False
 
     def find_matching_bbox(self, points_string: str, bboxes: List[Dict[str, Any]], 
-                         image_width: float, image_height: float, threshold: float = 0.5) -> Optional[Dict[str, Any]]:
+                         image_width: float, image_height: float, threshold: float = 0.5,
+                         spatial_index: Optional[BBoxGridIndex] = None) -> Optional[Dict[str, Any]]:
         """
         Find bbox that best encloses the segmentation points.
+        
+        With a spatial_index built from the same bboxes, only bboxes touching the
+        points' envelope are tested.
         """
         try:
             points = points_string.split()
             max_overlap = threshold
             best_bbox = None
             
-            for bbox in bboxes:
+            candidates = bboxes
+            if spatial_index is not None and threshold >= 0 and spatial_index.matches(bboxes):
+                envelope = self._points_envelope(points, image_width, image_height)
+                if envelope is not None:
+                    candidates = [bboxes[i] for i in spatial_index.query(*envelope)]
+            
+            for bbox in candidates:
                 overlap = self.calculate_bbox_overlap(
                     points, 
                     bbox['bbox'], 
@@ -149,6 +170,21 @@ class SegmentationOps:
             self.logger.error(f"Error finding matching bbox: {str(e)}")
             return None
 
+    def _points_envelope(self, points: List[str], image_width: float,
+                         image_height: float) -> Optional[Tuple[float, float, float, float]]:
+        """Bounding envelope of normalized points in image coordinates, or None if they do not parse."""
+        try:
+            xs, ys = [], []
+            for i in range(0, len(points), 2):
+                x, y = self.denormalize_coordinates(float(points[i]), float(points[i + 1]), image_width, image_height)
+                xs.append(x)
+                ys.append(y)
+            if not xs:
+                return None
+            return min(xs), min(ys), max(xs), max(ys)
+        except (ValueError, IndexError):
+            return None
+
     def get_label_text(self, label: int) -> str:
         """
         Convert numeric label to text description.
@@ -208,9 +244,186 @@ class SegmentationOps:
             self.logger.error(f"Error calculating bbox overlap ratio: {str(e)}")
             return 0.0
 
-    def process_image_segmentations(self, image_data: Dict[str, Any], segmentation_text: str) -> Dict[str, Any]:
+    def parse_segmentation_arrays(self, segmentations: List[Dict[str, Any]]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Parse the points of parsed segmentations into one packed coordinate array.
+
+        Coordinates are float64 so every value is bit-for-bit what float() returns.
+
+        Returns:
+            (coords, offsets): coords holds x,y pairs of all segmentations back to back and
+            segmentation i spans coords[offsets[i]:offsets[i + 1]]; None if any points
+            string is not an even number of finite numbers
+        """
+        try:
+            tokens_per_seg = [seg['points_string'].split() for seg in segmentations]
+            lengths = [len(tokens) for tokens in tokens_per_seg]
+            if any(length == 0 or length % 2 for length in lengths):
+                return None
+
+            coords = np.array([token for tokens in tokens_per_seg for token in tokens], dtype=np.float64)
+            if not np.isfinite(coords).all():
+                return None
+
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            return coords, offsets
+        except (ValueError, TypeError):
+            return None
+
+    def parse_bbox_array(self, bboxes: List[Dict[str, Any]]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Parse "x1,y1,x2,y2" bbox strings into a (B, 4) float64 array.
+
+        Returns:
+            (boxes, valid): boxes of shape (B, 4) and a mask of the bboxes that parsed;
+            None if any bbox is non-finite
+        """
+        boxes, valid = BBoxGridIndex.parse_bboxes(bboxes)
+        if not np.isfinite(boxes).all():
+            return None
+        return boxes, valid
+
+    def calculate_overlap_ratio_matrix(self, seg_boxes: np.ndarray, boxes: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """
+        Vectorized calculate_bbox_overlap_ratio for every segmentation/bbox pair.
+
+        Args:
+            seg_boxes: (S, 4) denormalized segmentation bboxes
+            boxes: (B, 4) target bboxes
+            valid: (B,) mask of target bboxes that parsed
+
+        Returns:
+            (S, B) array of overlap ratios
+        """
+        return self._overlap_ratios(seg_boxes[:, None, :], boxes[None, :, :], valid[None, :])
+
+    def _overlap_ratios(self, seg: np.ndarray, box: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """Element-wise calculate_bbox_overlap_ratio over broadcastable (..., 4) box arrays."""
+        x_left = np.maximum(seg[..., 0], box[..., 0])
+        y_top = np.maximum(seg[..., 1], box[..., 1])
+        x_right = np.minimum(seg[..., 2], box[..., 2])
+        y_bottom = np.minimum(seg[..., 3], box[..., 3])
+
+        intersection_area = (x_right - x_left) * (y_bottom - y_top)
+        denorm_points_area = (seg[..., 2] - seg[..., 0]) * (seg[..., 3] - seg[..., 1])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = intersection_area / denorm_points_area
+        disjoint = (x_right < x_left) | (y_bottom < y_top)
+        ratios[disjoint | (denorm_points_area <= 0) | ~valid] = 0.0
+        return ratios
+
+    def _process_image_segmentations_numpy(self, image_data: Dict[str, Any], segmentations: List[Dict[str, Any]],
+                                           image_width: float, image_height: float,
+                                           bboxes: List[Dict[str, Any]],
+                                           spatial_index: Optional[BBoxGridIndex] = None) -> bool:
+        """
+        Vectorized body of process_image_segmentations.
+
+        Returns:
+            bool: False, without touching image_data, if the input needs the Python path
+        """
+        seg_dicts = {}
+        for s in image_data['segmentation_indices_array']:
+            if not isinstance(s, dict) or 'index' not in s:
+                return False
+            try:
+                seg_dicts.setdefault(s['index'], s)
+            except TypeError:
+                return False
+        if any(not isinstance(bbox, dict) or 'bbox' not in bbox or 'yolo_bbox' not in bbox for bbox in bboxes):
+            return False
+
+        segmentations = [seg for seg in segmentations if seg['index'] in seg_dicts]
+        if not segmentations:
+            return True
+
+        parsed = self.parse_segmentation_arrays(segmentations)
+        parsed_bboxes = self.parse_bbox_array(bboxes)
+        if parsed is None or parsed_bboxes is None:
+            return False
+        coords, offsets = parsed
+        boxes, valid = parsed_bboxes
+
+        # Denormalize and round half to even, exactly like round(float(p) * size)
+        scaled = np.empty_like(coords)
+        scaled[0::2] = coords[0::2] * image_width
+        scaled[1::2] = coords[1::2] * image_height
+        if not np.isfinite(scaled).all() or np.abs(scaled).max() >= self._MAX_EXACT_COORDINATE:
+            return False
+        rounded = np.rint(scaled).astype(np.int64)
+
+        starts = offsets[:-1]
+        xs = rounded[0::2].astype(np.float64)
+        ys = rounded[1::2].astype(np.float64)
+        pair_starts = starts // 2
+        seg_boxes = np.stack([
+            np.minimum.reduceat(xs, pair_starts),
+            np.minimum.reduceat(ys, pair_starts),
+            np.maximum.reduceat(xs, pair_starts),
+            np.maximum.reduceat(ys, pair_starts)
+        ], axis=1)
+
+        # Best bbox per segmentation: first bbox with the highest ratio, if at least 50%
+        if bboxes and spatial_index is not None and spatial_index.matches(bboxes):
+            # Only score the bboxes that touch each segmentation's envelope
+            best = np.zeros(len(segmentations), dtype=np.int64)
+            best_ratio = np.zeros(len(segmentations), dtype=np.float64)
+            for i, seg_box in enumerate(seg_boxes.tolist()):
+                candidates = np.array(spatial_index.query(*seg_box), dtype=np.int64)
+                if len(candidates):
+                    ratios = self._overlap_ratios(seg_boxes[i], boxes[candidates], valid[candidates])
+                    position = int(ratios.argmax())
+                    best[i] = candidates[position]
+                    best_ratio[i] = ratios[position]
+        elif bboxes:
+            ratios = self.calculate_overlap_ratio_matrix(seg_boxes, boxes, valid)
+            best = ratios.argmax(axis=1)
+            best_ratio = ratios[np.arange(len(segmentations)), best]
+        else:
+            best = np.zeros(len(segmentations), dtype=np.int64)
+            best_ratio = np.zeros(len(segmentations), dtype=np.float64)
+
+        rounded_list = rounded.tolist()
+        offsets_list = offsets.tolist()
+        seg_boxes_list = seg_boxes.tolist()
+        for i, seg in enumerate(segmentations):
+            seg_dict = seg_dicts[seg['index']]
+
+            # Update segmentation data
+            seg_dict['segmentation_points'] = seg['points_string']
+            seg_dict['points_count'] = seg['points_count']
+            seg_dict['denormalized_segmentation_points'] = ' '.join(
+                map(str, rounded_list[offsets_list[i]:offsets_list[i + 1]])
+            )
+            x1, y1, x2, y2 = seg_boxes_list[i]
+            seg_dict['denorm_points_bbox'] = f"{x1},{y1},{x2},{y2}"
+
+            # Initialize default values
+            seg_dict['bbox'] = ""
+            seg_dict['yolo_bbox'] = ""
+            seg_dict['species'] = ""
+            seg_dict['overlap_ratio'] = 0.0
+
+            max_overlap = float(best_ratio[i])
+            if max_overlap >= 0.5:  # At least 50% overlap required
+                matching_bbox = bboxes[int(best[i])]
+                seg_dict['bbox'] = matching_bbox['bbox']
+                seg_dict['yolo_bbox'] = matching_bbox['yolo_bbox']
+                seg_dict['species'] = matching_bbox.get('species', '')
+                seg_dict['overlap_ratio'] = max_overlap
+                self.logger.info(f"Matched segmentation {seg['index']} to bbox for species {matching_bbox.get('species', '')} with overlap ratio {max_overlap:.2f}")
+
+        return True
+
+    def process_image_segmentations(self, image_data: Dict[str, Any], segmentation_text: str,
+                                    spatial_index: Optional[BBoxGridIndex] = None) -> Dict[str, Any]:
         """
         Process and align segmentations with bboxes for an image.
+        
+        A spatial_index built from the image's info bboxes limits matching to the
+        bboxes near each segmentation; a stale index is ignored.
         """
         try:
             if not segmentation_text or 'segmentation_indices_array' not in image_data:
@@ -223,6 +436,10 @@ class SegmentationOps:
             # Parse segmentations
             segmentations = self.parse_segmentation_file(segmentation_text)
             
+            if self.backend == 'numpy' and self._process_image_segmentations_numpy(
+                    image_data, segmentations, image_width, image_height, bboxes, spatial_index):
+                return image_data
+            
             # Process each segmentation
             for seg in segmentations:
                 # Find corresponding entry in segmentation_indices_array
@@ -0,0 +1,517 @@
+import os
+import json
+import logging
+import threading
+import sqlite3
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Callable
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class VersionConflictError(Exception):
+    """Raised when a record was changed by another worker since it was read."""
+
+    def __init__(self, namespace: str, key: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"{namespace}/{key} is at version {current_version}, expected {expected_version}; "
+            f"it was changed by another worker"
+        )
+        self.namespace = namespace
+        self.key = key
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+class InMemoryStateBackend:
+    """
+    Process-local state backend for a single worker.
+
+    Values are kept by reference, so nothing is copied or serialized; with one
+    process there is nothing to share and the versions only guard against
+    lost updates between threads.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[Tuple[str, str], Tuple[int, int, int, Any]] = {}
+        self._seq = 0
+        self._namespace_seqs: Dict[str, int] = {}
+        self._positions: Dict[str, int] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[int, Any]]:
+        """
+        Read a record.
+
+        Returns:
+            Optional[Tuple[int, Any]]: (version, value), or None if the record does not exist
+        """
+        with self._lock:
+            record = self._records.get((namespace, key))
+            return (record[0], record[3]) if record else None
+
+    def put(self, namespace: str, key: str, value: Any, expected_version: Optional[int] = None) -> int:
+        """
+        Write a record, optionally only if it is still at expected_version.
+
+        Args:
+            namespace (str): Record namespace
+            key (str): Record key
+            value: JSON-serializable value
+            expected_version (int): Version the caller last read; 0 means the record
+                must not exist yet, None writes unconditionally
+
+        Returns:
+            int: The new version
+
+        Raises:
+            VersionConflictError: If the record is not at expected_version
+        """
+        with self._lock:
+            record = self._records.get((namespace, key))
+            current_version = record[0] if record else 0
+            if expected_version is not None and expected_version != current_version:
+                raise VersionConflictError(namespace, key, expected_version, current_version)
+            if record:
+                position = record[2]
+            else:
+                position = self._positions.get(namespace, 0) + 1
+                self._positions[namespace] = position
+            self._seq += 1
+            self._namespace_seqs[namespace] = self._seq
+            self._records[(namespace, key)] = (current_version + 1, self._seq, position, value)
+            return current_version + 1
+
+    def items(self, namespace: str) -> List[Tuple[str, int, Any]]:
+        """Return (key, version, value) for every record of a namespace, in insertion order."""
+        with self._lock:
+            records = [(key, record) for (ns, key), record in self._records.items() if ns == namespace]
+        records.sort(key=lambda item: item[1][2])
+        return [(key, record[0], record[3]) for key, record in records]
+
+    def delete(self, namespace: str, key: str) -> bool:
+        """
+        Remove a record.
+
+        Returns:
+            bool: True if the record existed
+        """
+        with self._lock:
+            return self._records.pop((namespace, key), None) is not None
+
+    def changes_since(self, namespace: str, seq: int) -> Tuple[List[Tuple[str, int, int, Any]], int]:
+        """
+        Return the records written after a sequence number.
+
+        Returns:
+            tuple: ([(key, version, position, value)], latest sequence number)
+        """
+        with self._lock:
+            changes = [
+                (key, record[0], record[2], record[3])
+                for (ns, key), record in self._records.items()
+                if ns == namespace and record[1] > seq
+            ]
+            return changes, self._seq
+
+    def count(self, namespace: str) -> int:
+        """Number of records in a namespace."""
+        with self._lock:
+            return sum(1 for ns, _ in self._records if ns == namespace)
+
+    def rank(self, namespace: str, key: str) -> Optional[int]:
+        """Index of a record in its namespace's insertion order, or None if it does not exist."""
+        with self._lock:
+            record = self._records.get((namespace, key))
+            if record is None:
+                return None
+            return sum(1 for (ns, _), other in self._records.items() if ns == namespace and other[2] < record[2])
+
+    def latest_seq(self, namespace: Optional[str] = None) -> int:
+        """Sequence number of the last write, or of the last write to a namespace."""
+        with self._lock:
+            if namespace is not None:
+                return self._namespace_seqs.get(namespace, 0)
+            return self._seq
+
+
+class SQLiteStateBackend:
+    """
+    State backend shared by all worker processes through a SQLite file in WAL mode.
+
+    Every write bumps the record's version and a global sequence number, so
+    workers can apply optimistic concurrency on a record and cheaply fetch the
+    records changed since they last looked.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str):
+        """
+        Initialize the backend, creating the database file if needed.
+
+        Args:
+            db_path (str): Path of the SQLite file, on a disk shared by the workers
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, version INTEGER NOT NULL, "
+                "seq INTEGER NOT NULL, position INTEGER NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS records_seq ON records (namespace, seq)")
+            connection.execute("CREATE INDEX IF NOT EXISTS records_position ON records (namespace, position)")
+            # The sequence lives in its own row so it keeps growing after the newest record is deleted
+            connection.execute("CREATE TABLE IF NOT EXISTS sequence (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO sequence (id, seq) SELECT 1, COALESCE(MAX(seq), 0) FROM records")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so keep one per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[int, Any]]:
+        """
+        Read a record.
+
+        Returns:
+            Optional[Tuple[int, Any]]: (version, value), or None if the record does not exist
+        """
+        row = self._connection().execute(
+            "SELECT version, value FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, namespace: str, key: str, value: Any, expected_version: Optional[int] = None) -> int:
+        """
+        Write a record, optionally only if it is still at expected_version.
+
+        Args:
+            namespace (str): Record namespace
+            key (str): Record key
+            value: JSON-serializable value
+            expected_version (int): Version the caller last read; 0 means the record
+                must not exist yet, None writes unconditionally
+
+        Returns:
+            int: The new version
+
+        Raises:
+            VersionConflictError: If the record is not at expected_version
+        """
+        value_json = json.dumps(value)
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so the version check and the write are atomic
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT version, position FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            current_version = row[0] if row else 0
+            if expected_version is not None and expected_version != current_version:
+                raise VersionConflictError(namespace, key, expected_version, current_version)
+
+            connection.execute("UPDATE sequence SET seq = seq + 1 WHERE id = 1")
+            seq = connection.execute("SELECT seq FROM sequence WHERE id = 1").fetchone()[0]
+            if row:
+                position = row[1]
+            else:
+                position = connection.execute(
+                    "SELECT COALESCE(MAX(position), 0) + 1 FROM records WHERE namespace = ?", (namespace,)
+                ).fetchone()[0]
+            connection.execute(
+                "INSERT OR REPLACE INTO records (namespace, key, version, seq, position, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, current_version + 1, seq, position, value_json)
+            )
+            connection.execute("COMMIT")
+            return current_version + 1
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def items(self, namespace: str) -> List[Tuple[str, int, Any]]:
+        """Return (key, version, value) for every record of a namespace, in insertion order."""
+        rows = self._connection().execute(
+            "SELECT key, version, value FROM records WHERE namespace = ? ORDER BY position", (namespace,)
+        ).fetchall()
+        return [(key, version, json.loads(value)) for key, version, value in rows]
+
+    def delete(self, namespace: str, key: str) -> bool:
+        """
+        Remove a record.
+
+        Returns:
+            bool: True if the record existed
+        """
+        cursor = self._connection().execute(
+            "DELETE FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def changes_since(self, namespace: str, seq: int) -> Tuple[List[Tuple[str, int, int, Any]], int]:
+        """
+        Return the records written after a sequence number.
+
+        Returns:
+            tuple: ([(key, version, position, value)], latest sequence number)
+        """
+        connection = self._connection()
+        latest = self.latest_seq()
+        if latest <= seq:
+            return [], latest
+        rows = connection.execute(
+            "SELECT key, version, position, value FROM records WHERE namespace = ? AND seq > ? AND seq <= ?",
+            (namespace, seq, latest)
+        ).fetchall()
+        return [(key, version, position, json.loads(value)) for key, version, position, value in rows], latest
+
+    def count(self, namespace: str) -> int:
+        """Number of records in a namespace."""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM records WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
+
+    def rank(self, namespace: str, key: str) -> Optional[int]:
+        """Index of a record in its namespace's insertion order, or None if it does not exist."""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT position FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        return connection.execute(
+            "SELECT COUNT(*) FROM records WHERE namespace = ? AND position < ?", (namespace, row[0])
+        ).fetchone()[0]
+
+    def latest_seq(self, namespace: Optional[str] = None) -> int:
+        """Sequence number of the last write, or of the last write to a namespace."""
+        if namespace is not None:
+            return self._connection().execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM records WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+        return self._connection().execute("SELECT seq FROM sequence WHERE id = 1").fetchone()[0]
+
+
+class SharedDocument:
+    """
+    A small dict (such as processing_status) stored as one record of a state backend.
+
+    Reads always return the latest state written by any worker; update() is a
+    read-modify-write retried on version conflicts, so concurrent updates from
+    different workers are not lost.
+    """
+
+    NAMESPACE = 'documents'
+
+    def __init__(self, backend, name: str, defaults: Optional[Dict[str, Any]] = None):
+        self.backend = backend
+        self.name = name
+        if defaults is not None:
+            try:
+                self.backend.put(self.NAMESPACE, self.name, dict(defaults), expected_version=0)
+            except VersionConflictError:
+                # Another worker created it first
+                pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a copy of the current document."""
+        record = self.backend.get(self.NAMESPACE, self.name)
+        return dict(record[1]) if record else {}
+
+    def modify(self, fn: Callable[[Dict[str, Any]], None], attempts: int = 10) -> Dict[str, Any]:
+        """
+        Apply fn to a copy of the document and store it if nobody else wrote in between.
+
+        Returns:
+            dict: The stored document
+        """
+        for _ in range(attempts):
+            record = self.backend.get(self.NAMESPACE, self.name)
+            version, document = (record[0], dict(record[1])) if record else (0, {})
+            fn(document)
+            try:
+                self.backend.put(self.NAMESPACE, self.name, document, expected_version=version)
+                return document
+            except VersionConflictError:
+                continue
+        raise VersionConflictError(self.NAMESPACE, self.name, version, -1)
+
+    def update(self, fields: Dict[str, Any]) -> None:
+        self.modify(lambda document: document.update(fields))
+
+    def __getitem__(self, field: str) -> Any:
+        return self.to_dict()[field]
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        self.update({field: value})
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return self.to_dict().get(field, default)
+
+
+class SharedPaperState:
+    """
+    Keeps a worker's PaperStore consistent with the papers in a shared state backend.
+
+    Each worker holds its own PaperStore replica for fast indexed reads. Edits
+    are published per paper with the version the worker last saw, so an edit
+    based on a stale copy is rejected instead of overwriting another worker's
+    change; sync() pulls the papers other workers changed since the last call.
+    """
+
+    NAMESPACE = 'papers'
+
+    def __init__(self, backend, paper_store):
+        """
+        Args:
+            backend: InMemoryStateBackend or SQLiteStateBackend
+            paper_store (PaperStore): This worker's replica
+        """
+        self.backend = backend
+        self.paper_store = paper_store
+        self._versions: Dict[str, int] = {}
+        self._seq = 0
+        self._lock = threading.RLock()
+        self.stats = {'syncs': 0, 'papers_pulled': 0, 'papers_published': 0, 'conflicts': 0}
+
+    def initialize(self, load_fn: Callable[[], Tuple[List[Dict[str, Any]], List[str]]]) -> None:
+        """
+        Load the replica, seeding the backend from load_fn if no worker has done so yet.
+
+        Args:
+            load_fn: Returns (papers, paper_keys) from durable storage
+        """
+        with self._lock:
+            if self.backend.count(self.NAMESPACE) == 0:
+                papers, paper_keys = load_fn()
+                for paper_key, paper in zip(paper_keys, papers):
+                    try:
+                        self.backend.put(self.NAMESPACE, paper_key, paper, expected_version=0)
+                    except VersionConflictError:
+                        # Another worker is seeding concurrently; its copy is the same
+                        pass
+            self.reload()
+
+    def reload(self) -> None:
+        """Replace the replica with the backend's papers."""
+        with self._lock:
+            # Writes that land between these two reads are skipped by sync() as already seen
+            self._seq = self.backend.latest_seq()
+            records = self.backend.items(self.NAMESPACE)
+            self.paper_store.load([value for _, _, value in records], [key for key, _, _ in records])
+            self._versions = {key: version for key, version, _ in records}
+
+    def has_changes(self) -> bool:
+        """Cheap check for paper writes since the last sync; job status writes to the backend do not count."""
+        return self.backend.shared and self.backend.latest_seq(self.NAMESPACE) > self._seq
+
+    def sync(self) -> int:
+        """
+        Apply the papers other workers published since the last sync.
+
+        Returns:
+            int: Number of papers updated or added
+        """
+        if not self.backend.shared:
+            return 0
+        with self._lock:
+            changes, latest = self.backend.changes_since(self.NAMESPACE, self._seq)
+            self._seq = latest
+            pulled = 0
+            # New papers are appended in the order they were first published, like every other worker
+            for paper_key, version, _, value in sorted(changes, key=lambda change: change[2]):
+                if version <= self._versions.get(paper_key, 0):
+                    continue
+                self.paper_store.upsert_paper(paper_key, value)
+                self._versions[paper_key] = version
+                pulled += 1
+            self.stats['syncs'] += 1
+            self.stats['papers_pulled'] += pulled
+            return pulled
+
+    def in_shared_order(self, paper_key: str) -> bool:
+        """
+        Check that a paper has the same index in the replica as in the backend.
+
+        A paper appended here while another worker published a new one can end
+        up after it in the backend but before it in the replica; image indices
+        then differ between the workers until the replica is reloaded.
+        """
+        with self._lock:
+            return self.backend.rank(self.NAMESPACE, paper_key) == self.paper_store.get_paper_index(paper_key)
+
+    def publish(self, paper_keys: Iterable[str]) -> None:
+        """
+        Publish this worker's copies of the given papers.
+
+        Raises:
+            VersionConflictError: If another worker changed one of the papers first; the
+                replica's copy of that paper is replaced with the backend's
+        """
+        with self._lock:
+            for paper_key in dict.fromkeys(paper_keys):
+                paper = self.paper_store.get_paper_by_key(paper_key)
+                if paper is None:
+                    continue
+                try:
+                    self._versions[paper_key] = self.backend.put(
+                        self.NAMESPACE, paper_key, paper, expected_version=self._versions.get(paper_key, 0)
+                    )
+                    self.stats['papers_published'] += 1
+                except VersionConflictError:
+                    self.stats['conflicts'] += 1
+                    record = self.backend.get(self.NAMESPACE, paper_key)
+                    if record:
+                        self.paper_store.upsert_paper(paper_key, record[1])
+                        self._versions[paper_key] = record[0]
+                    raise
+
+    def get_paper(self, paper_key: str) -> Optional[Dict[str, Any]]:
+        """Latest published copy of a paper, falling back to the replica."""
+        if self.backend.shared:
+            record = self.backend.get(self.NAMESPACE, paper_key)
+            if record:
+                return record[1]
+        return self.paper_store.get_paper_by_key(paper_key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, shared=self.backend.shared, seq=self._seq, papers=len(self._versions))
+
+
+def create_state_backend(kind: Optional[str] = None, db_path: Optional[str] = None):
+    """
+    Create the state backend selected by STATE_BACKEND ('memory' or 'sqlite').
+
+    The default is 'sqlite' when GUNICORN_WORKERS is above 1 and 'memory' otherwise.
+
+    Args:
+        kind (str): Backend name; defaults to STATE_BACKEND
+        db_path (str): SQLite file; defaults to STATE_DB_PATH
+    """
+    if kind is None:
+        default_kind = 'sqlite' if int(os.getenv('GUNICORN_WORKERS', '1')) > 1 else 'memory'
+        kind = os.getenv('STATE_BACKEND', default_kind)
+    if kind == 'sqlite':
+        return SQLiteStateBackend(db_path or os.getenv('STATE_DB_PATH', os.path.join('temp_uploads', 'shared_state.sqlite3')))
+    if kind != 'memory':
+        logger.warning(f"Unknown STATE_BACKEND {kind}; using the in-memory backend")
+    return InMemoryStateBackend()
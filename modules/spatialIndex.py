@@ -0,0 +1,131 @@
+import os
+import math
+import logging
+from collections import defaultdict
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class BBoxGridIndex:
+    """
+    Uniform grid over the "x1,y1,x2,y2" bboxes of one image.
+
+    query() returns, in ascending order, the indices of every bbox whose extent
+    touches the given envelope, so callers that scan bboxes in order and keep
+    the first best match get the same result from the candidates as from the
+    full list. Entries that cannot be placed on the grid (unparseable, missing
+    or non-finite bboxes, or very large boxes) are returned by every query.
+    """
+
+    # Plates with fewer bboxes than this are cheaper to scan than to index
+    MIN_BBOXES = int(os.getenv('SPATIAL_INDEX_MIN_BBOXES', '32'))
+
+    # Boxes covering more cells than this go on the always-returned list instead
+    MAX_CELLS_PER_BOX = 64
+
+    def __init__(self, bboxes: List[Dict[str, Any]]):
+        """
+        Build the grid for an image's info entries.
+
+        Args:
+            bboxes (list): The image's info entries, each with a 'bbox' string
+        """
+        self.signature = self.signature_of(bboxes)
+        self.size = len(bboxes)
+        self.boxes, self.valid = self.parse_bboxes(bboxes)
+
+        finite = self.valid & np.isfinite(self.boxes).all(axis=1)
+        placed = np.flatnonzero(finite)
+        self._always: List[int] = [i for i in range(self.size) if not finite[i]]
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+        # Cells about the size of a typical box keep each box in a handful of cells
+        if len(placed):
+            extents = np.maximum(
+                np.abs(self.boxes[placed, 2] - self.boxes[placed, 0]),
+                np.abs(self.boxes[placed, 3] - self.boxes[placed, 1])
+            )
+            self.cell_size = max(float(np.median(extents)), 1.0)
+        else:
+            self.cell_size = 1.0
+
+        for i in placed.tolist():
+            cx1, cy1, cx2, cy2 = self._cell_range(*self.boxes[i].tolist())
+            if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.MAX_CELLS_PER_BOX:
+                self._always.append(i)
+                continue
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    self._cells[(cx, cy)].append(i)
+        self._always.sort()
+
+    @staticmethod
+    def signature_of(bboxes: List[Dict[str, Any]]) -> Tuple[Any, ...]:
+        """Identify the bbox set an index was built from, to detect stale indexes."""
+        return tuple(bbox.get('bbox') if isinstance(bbox, dict) else None for bbox in bboxes)
+
+    @staticmethod
+    def parse_bboxes(bboxes: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parse "x1,y1,x2,y2" bbox strings into a (B, 4) float64 array.
+
+        Returns:
+            (boxes, valid): boxes of shape (B, 4) and a mask of the bboxes that parsed
+        """
+        boxes = np.zeros((len(bboxes), 4), dtype=np.float64)
+        valid = np.zeros(len(bboxes), dtype=bool)
+        for i, bbox in enumerate(bboxes):
+            try:
+                parts = bbox['bbox'].split(',')
+                if len(parts) != 4:
+                    continue
+                boxes[i] = np.array(parts, dtype=np.float64)
+                valid[i] = True
+            except (ValueError, TypeError, AttributeError, KeyError):
+                continue
+        return boxes, valid
+
+    def _cell_range(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[int, int, int, int]:
+        return (
+            math.floor(min(x1, x2) / self.cell_size),
+            math.floor(min(y1, y2) / self.cell_size),
+            math.floor(max(x1, x2) / self.cell_size),
+            math.floor(max(y1, y2) / self.cell_size)
+        )
+
+    def matches(self, bboxes: List[Dict[str, Any]]) -> bool:
+        """Check that the index was built from exactly these bboxes."""
+        return self.signature == self.signature_of(bboxes)
+
+    def query(self, x1: float, y1: float, x2: float, y2: float) -> List[int]:
+        """
+        Find the bboxes that may intersect an envelope.
+
+        Args:
+            x1, y1, x2, y2: Envelope in image coordinates
+
+        Returns:
+            list: Candidate bbox indices in ascending order
+        """
+        if not all(math.isfinite(v) for v in (x1, y1, x2, y2)):
+            return list(range(self.size))
+
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            # The envelope covers most of the grid; walking the cells is no cheaper
+            candidates = set(i for cell in self._cells.values() for i in cell)
+        else:
+            candidates = set()
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    candidates.update(self._cells.get((cx, cy), ()))
+        candidates.update(self._always)
+        return sorted(candidates)
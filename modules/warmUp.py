@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Startup work run off the import path behind a readiness flag.
+
+    The steps run in order on a background thread, so the server can accept
+    connections (and answer health checks) while the dataset is loading. A
+    failing step is logged and recorded but does not stop the following ones,
+    the same as when each step ran at import inside its own try/except. The
+    app is ready once every step has run.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        """
+        Initialize the warm-up.
+
+        Args:
+            steps (list): (name, function) pairs run in order
+        """
+        self.steps = steps
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {
+            'state': 'pending',
+            'started_at': None,
+            'finished_at': None,
+            'steps': [{'name': name, 'state': 'pending', 'seconds': None, 'error': None} for name, _ in steps],
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        """Run the steps on a background thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        """Run every step in order and mark the app ready."""
+        with self._lock:
+            self.status.update(state='running', started_at=time.time())
+
+        for position, (name, step) in enumerate(self.steps):
+            step_status = self.status['steps'][position]
+            with self._lock:
+                step_status['state'] = 'running'
+            start = time.perf_counter()
+            try:
+                step()
+                state, error = 'done', None
+            except Exception as e:
+                logger.error(f"Error in warm-up step {name}: {str(e)}")
+                state, error = 'failed', str(e)
+            with self._lock:
+                step_status.update(state=state, error=error, seconds=round(time.perf_counter() - start, 3))
+
+        with self._lock:
+            self.status.update(state='ready', finished_at=time.time())
+        self._ready.set()
+        logger.info(f"Warm-up finished in {self.status['finished_at'] - self.status['started_at']:.2f}s")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the warm-up has finished.
+
+        Returns:
+            bool: True if the app is ready
+        """
+        return self._ready.wait(timeout)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Return the overall state and the state and duration of every step."""
+        with self._lock:
+            return dict(self.status, steps=[dict(step) for step in self.status['steps']])
@@ -0,0 +1,245 @@
+import os
+import json
+import glob
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Write-behind persistence for paper edits.
+
+    Routes apply an edit in memory, call mark_dirty() with the touched paper keys
+    and return immediately. Each dirty paper is appended to a local journal
+    (fsync'd) so a crash cannot lose the edit; a background thread waits for the
+    flush window to collect more edits and then flushes every dirty paper in one
+    batch. Journal segments are deleted once their papers are persisted, and
+    replay() returns any edits still in the journal after a restart.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[str]], List[str]],
+                 snapshot_fn: Callable[[str], Optional[Dict[str, Any]]],
+                 journal_dir: str, flush_window: float = 2.0):
+        """
+        Initialize the queue.
+
+        Args:
+            flush_fn: Persists the given paper keys and returns the keys that failed
+            snapshot_fn: Returns a consistent copy of a paper JSON object for a key (for journaling);
+                called without the queue lock held, so it may take the caller's edit locks
+            journal_dir: Local directory for journal segments
+            flush_window: Seconds to wait after the first edit before flushing
+        """
+        self.flush_fn = flush_fn
+        self.snapshot_fn = snapshot_fn
+        self.journal_dir = journal_dir
+        self.flush_window = flush_window
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._dirty: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._consecutive_failures = 0
+
+        self._segment_seq = 0
+        self._segment_file = None
+        self.stats = {
+            'edits_queued': 0,
+            'flushes': 0,
+            'papers_flushed': 0,
+            'flush_failures': 0,
+            'last_flush_seconds': 0.0,
+            'last_flush_at': None,
+        }
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        existing = self._segment_paths()
+        if existing:
+            self._segment_seq = max(self._segment_number(path) for path in existing)
+        self._open_new_segment()
+
+    # ------------------------------------------------------------------ journal
+
+    def _segment_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.journal_dir, 'journal-*.log')), key=self._segment_number)
+
+    @staticmethod
+    def _segment_number(path: str) -> int:
+        return int(os.path.basename(path)[len('journal-'):-len('.log')])
+
+    def _open_new_segment(self) -> None:
+        if self._segment_file:
+            self._segment_file.close()
+        self._segment_seq += 1
+        path = os.path.join(self.journal_dir, f"journal-{self._segment_seq:08d}.log")
+        self._segment_file = open(path, 'a', encoding='utf-8')
+
+    def _journal(self, paper_key: str, paper: Optional[Dict[str, Any]]) -> None:
+        """Append a snapshot of a paper to the live journal segment."""
+        if paper is None:
+            return
+        record = json.dumps({'paper_key': paper_key, 'timestamp': time.time(), 'paper': paper})
+        self._segment_file.write(record + '\n')
+
+    def _sync(self) -> None:
+        self._segment_file.flush()
+        os.fsync(self._segment_file.fileno())
+
+    def replay(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read all journal segments and return the latest journaled state of each paper.
+
+        Returns:
+            dict: Mapping of paper key to paper JSON object, in journal order
+        """
+        return self.read_journal(self.journal_dir)
+
+    @classmethod
+    def read_journal(cls, journal_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the journal segments in a directory, e.g. one left behind by another worker.
+
+        Returns:
+            dict: Mapping of paper key to paper JSON object, in journal order
+        """
+        papers: Dict[str, Dict[str, Any]] = {}
+        paths = sorted(glob.glob(os.path.join(journal_dir, 'journal-*.log')), key=cls._segment_number)
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write at crash time; everything before it is intact
+                        logger.warning(f"Skipping truncated journal record in {path}")
+                        continue
+                    papers.pop(record['paper_key'], None)
+                    papers[record['paper_key']] = record['paper']
+        return papers
+
+    # ------------------------------------------------------------------ queue
+
+    def mark_dirty(self, paper_keys: Iterable[str]) -> None:
+        """
+        Journal the given papers and schedule them for the next flush.
+
+        Args:
+            paper_keys: Keys of the papers that were modified in memory
+        """
+        snapshots = [(paper_key, self.snapshot_fn(paper_key)) for paper_key in paper_keys if paper_key]
+        with self._lock:
+            now = time.time()
+            for paper_key, paper in snapshots:
+                self._journal(paper_key, paper)
+                self._dirty.setdefault(paper_key, now)
+                self.stats['edits_queued'] += 1
+            self._sync()
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        """Number of papers waiting to be flushed."""
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self) -> bool:
+        """
+        Persist every dirty paper now.
+
+        Returns:
+            bool: True if all dirty papers were persisted
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return True
+                paper_keys = list(self._dirty)
+                self._dirty.clear()
+                # Edits made while flushing go to a fresh segment
+                flushed_segments = self._segment_paths()
+                self._open_new_segment()
+
+            start_time = time.time()
+            try:
+                failed_keys = list(self.flush_fn(paper_keys) or [])
+            except Exception as e:
+                logger.error(f"Error flushing write-behind queue: {str(e)}")
+                failed_keys = paper_keys
+
+            snapshots = [(paper_key, self.snapshot_fn(paper_key)) for paper_key in failed_keys]
+            with self._lock:
+                # Re-journal failures so the old segments can still be dropped; a paper
+                # marked dirty meanwhile already has a newer record in the live segment
+                for paper_key, paper in snapshots:
+                    if paper_key in self._dirty:
+                        continue
+                    self._journal(paper_key, paper)
+                    self._dirty.setdefault(paper_key, time.time())
+                self._sync()
+                for path in flushed_segments:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning(f"Could not remove journal segment {path}: {str(e)}")
+
+                self.stats['flushes'] += 1
+                self.stats['papers_flushed'] += len(paper_keys) - len(failed_keys)
+                self.stats['flush_failures'] += len(failed_keys)
+                self.stats['last_flush_seconds'] = round(time.time() - start_time, 3)
+                self.stats['last_flush_at'] = time.time()
+
+            self._consecutive_failures = self._consecutive_failures + 1 if failed_keys else 0
+            if failed_keys:
+                logger.error(f"Failed to flush {len(failed_keys)} of {len(paper_keys)} papers")
+                self._wakeup.set()
+            else:
+                logger.info(f"Flushed {len(paper_keys)} papers in {self.stats['last_flush_seconds']}s")
+            return not failed_keys
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            # Merge edits that arrive within the window into one flush, backing off after failures
+            self._stopped.wait(min(self.flush_window * (2 ** self._consecutive_failures), 60.0))
+            self.flush()
+
+    def start(self) -> None:
+        """Start the background flush thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+        self._thread.start()
+        if self.pending():
+            self._wakeup.set()
+
+    def stop(self, drain: bool = True) -> None:
+        """
+        Stop the background thread, flushing pending edits first if drain is True.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+        if drain:
+            self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue counters and the number of pending papers."""
+        with self._lock:
+            return dict(self.stats, pending=len(self._dirty), flush_window=self.flush_window)